@@ -0,0 +1,56 @@
+"""
+Benchmark for the metadata formats.
+
+Compares the size and the encoding and decoding time of the ``json`` and
+``compact`` formats for the metadata of a subscription and an upgrade.
+
+Usage::
+
+    python -m benchmarks.bench_codec
+"""
+import uuid
+import timeit
+from decimal import Decimal
+
+from payfast import codec, timezone
+
+
+
+
+def main():
+    now = timezone.now()
+    samples = {
+        'custom_str1': {
+            'user_id': '4567',
+            'plan_id': 12,
+            'trial': [now, now],
+            'run_date': now,
+            'recurring_amount': Decimal('199.99'),
+            'is_tokenized': False,
+        },
+        'custom_str2': {
+            'amount': Decimal('75.50'),
+            'token': str(uuid.uuid4()),
+            'item_name': 'Premium plan',
+            'plan_id': 12,
+            'upgrade_to_id': 14,
+            'cancel': False,
+        },
+    }
+    number = 20000
+    for name, metadata in samples.items():
+        for format in ('json', 'compact'):
+            value = codec.dumps(metadata, format=format)
+            dumps = timeit.timeit(lambda: codec.dumps(metadata, format=format), number=number)
+            loads = timeit.timeit(lambda: codec.loads(value), number=number)
+            print(
+                f'{name} {format:8} {len(value):4} chars  '
+                f'dumps: {dumps / number * 1e6:6.1f}us  '
+                f'loads: {loads / number * 1e6:6.1f}us'
+            )
+
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Micro-benchmark for payment forms.
+
+Compares looking up the template on every render with the full payment
+data in the context (the previous ``get_form``), the cached template and
+the Jinja-free string renderer.
+
+Usage::
+
+    python -m benchmarks.bench_forms
+"""
+import timeit
+
+from payfast.payment import Payment
+from payfast.templates import get_env, get_template, render_form
+
+
+
+
+def main():
+    payment = Payment(10, 'Things', name_first='Armandt')
+    data = payment.data_for_payfast
+    context = payment.get_form_context()
+    env = get_env()
+
+    def legacy():
+        return env.get_template('payfast/form.html').render({**data, **context})
+
+    def cached():
+        return get_template('payfast/form.html').render(context)
+
+    def string():
+        return render_form(
+            payment.get_inputs(data),
+            context['payfast_process_url'],
+            context['button_name'],
+        )
+
+    assert legacy() == cached() == string()
+    number = 20000
+    baseline = timeit.timeit(legacy, number=number)
+    print(f'{"legacy":<8} {baseline / number * 1e6:6.1f}us')
+    for name, function in [('cached', cached), ('string', string)]:
+        elapsed = timeit.timeit(function, number=number)
+        print(
+            f'{name:<8} {elapsed / number * 1e6:6.1f}us  '
+            f'speedup: {baseline / elapsed:.1f}x'
+        )
+
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Import-time regression check.
+
+Runs ``python -X importtime -c "import <module>"`` in a fresh interpreter and
+fails if the cumulative import time of the module (and of the packages
+that it is in, but not of the interpreter's startup) exceeds the budget, or
+if it imports any of the heavy dependencies that are only needed for the
+API clients, payments and forms.
+
+Usage::
+
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --module payfast.signature --budget 50
+"""
+import sys
+import argparse
+import subprocess
+
+HEAVY = ('requests', 'pydantic', 'jinja2', 'dateutil', 'pytz', 'httpx')
+
+
+
+
+def import_time(module, repeat=5):
+    """
+    Returns the best cumulative import time in milliseconds and the
+    modules that were imported.
+    """
+    best = None
+    imported = set()
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        # The module and the packages that it is in; the other top-level
+        # lines are the interpreter's startup (e.g. "site").
+        parts = module.split('.')
+        own = {'.'.join(parts[:index]) for index in range(1, len(parts) + 1)}
+        total = 0
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line.split('|')
+            imported.add(name.strip())
+            # Nested imports are indented.
+            if not name[1:].startswith(' ') and name.strip() in own:
+                total += int(cumulative)
+        if best is None or total < best:
+            best = total
+    return best / 1000, imported
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', action='append')
+    parser.add_argument(
+        '--budget',
+        type=float,
+        default=25.0,
+        help='Maximum cold import time in milliseconds.',
+    )
+    args = parser.parse_args()
+    modules = args.module or ['payfast', 'payfast.signature']
+
+    failed = False
+    for module in modules:
+        elapsed, imported = import_time(module)
+        heavy = sorted({
+            name.split('.')[0] for name in imported
+            if name.split('.')[0] in HEAVY
+        })
+        status = 'ok'
+        if elapsed > args.budget or heavy:
+            status = 'FAIL'
+            failed = True
+        print(f'{module:<20} {elapsed:7.1f}ms  budget: {args.budget:.0f}ms  {status}')
+        if heavy:
+            print(f'  imports heavy dependencies: {", ".join(heavy)}')
+    if failed:
+        sys.exit(1)
+
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Micro-benchmark for signing payments with a pre-hashed merchant prefix.
+
+Compares ``PrefixSigner`` (used by ``PaymentTemplate``) with
+``make_signature`` for a typical payment, and ``PaymentTemplate`` with
+``Payment`` for creating payments.
+
+Usage::
+
+    python -m benchmarks.bench_midstate
+"""
+import timeit
+
+from payfast.conf import settings
+from payfast.payment import Payment, PaymentTemplate
+from payfast.signature import PrefixSigner, get_signer, make_signature
+
+from benchmarks.bench_signature import PAYMENT
+
+
+
+
+def report(name, number, old, new):
+    print(
+        f'{name:<10} old: {old / number * 1e6:7.1f}us  '
+        f'new: {new / number * 1e6:7.1f}us  '
+        f'speedup: {old / new:.2f}x'
+    )
+
+
+
+
+def main():
+    data = dict(PAYMENT)
+    data['merchant_id'] = settings.MERCHANT_ID
+    data['merchant_key'] = settings.MERCHANT_KEY
+    signer = PrefixSigner(get_signer(settings.SALT_PASSPHRASE), data)
+    assert signer.signature(data) == make_signature(data)
+
+    number = 50000
+    old = timeit.timeit(lambda: make_signature(data), number=number)
+    new = timeit.timeit(lambda: signer.signature(data), number=number)
+    report('signature', number, old, new)
+
+    urls = {
+        'return_url': PAYMENT['return_url'],
+        'cancel_url': PAYMENT['cancel_url'],
+        'notify_url': PAYMENT['notify_url'],
+    }
+    template = PaymentTemplate(**urls)
+    number = 2000
+    old = timeit.timeit(
+        lambda: Payment(10, 'Things', name_first='Armandt', **urls),
+        number=number,
+    )
+    new = timeit.timeit(
+        lambda: template.payment(10, 'Things', name_first='Armandt'),
+        number=number,
+    )
+    report('payment', number, old, new)
+
+
+
+
+if __name__ == '__main__':
+    main()
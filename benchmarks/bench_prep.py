@@ -0,0 +1,82 @@
+"""
+Micro-benchmark for ``Payment.prep``.
+
+Compares the schema-compiled ``prep`` with the previous implementation
+(reproduced below) that reflected over ``dir(self)``.
+
+Usage::
+
+    python -m benchmarks.bench_prep
+"""
+import timeit
+from decimal import Decimal
+from datetime import datetime
+
+from payfast import constants
+from payfast.payment import Payment, SubscriptionPayment, TokenizedSub
+
+
+
+
+def legacy_prep(self):
+    data = {}
+    attributes = [a for a in dir(self) if not a.startswith('_')]
+    for attr in attributes:
+        if attr not in self.allowed_fields:
+            continue
+        value = getattr(self, attr)
+        if callable(value):
+            continue
+        if isinstance(value, Decimal):
+            value = str(value)
+        if attr in ['email_confirmation']:
+            if value is True:
+                value = constants.BooleanInteger.ON.value
+            elif value is False:
+                value = constants.BooleanInteger.OFF.value
+            else:
+                value = None
+        if attr in ['billing_date']:
+            if isinstance(value, datetime):
+                value = value.strftime('%Y-%m-%d')
+        if isinstance(value, bool):
+            if value:
+                value = 'true'
+            else:
+                value = 'false'
+        data[attr] = value
+    signer = self.signer or self.merchant.signer
+    data['signature'] = signer.signature(data, a12y=False)
+    return data
+
+
+
+
+def main():
+    kwargs = {
+        'name_first': 'Armandt',
+        'email_address': 'armandt@example.com',
+        'm_payment_id': 123,
+        'email_confirmation': True,
+        'notify_url': 'https://example.com/payfast/notify/',
+    }
+    number = 20000
+    for name, payment in [
+        ('payment', Payment(10, 'Things', **kwargs)),
+        ('subscription', SubscriptionPayment(10, 'Things', **kwargs)),
+        ('tokenized', TokenizedSub(10, 'Things', **kwargs)),
+    ]:
+        assert legacy_prep(payment) == payment.prep()
+        legacy = timeit.timeit(lambda: legacy_prep(payment), number=number)
+        new = timeit.timeit(payment.prep, number=number)
+        print(
+            f'{name:<13} legacy: {legacy / number * 1e6:6.1f}us  '
+            f'prep: {new / number * 1e6:6.1f}us  '
+            f'speedup: {legacy / new:.1f}x'
+        )
+
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Throughput benchmark for the ITN endpoints.
+
+Runs a local stand-in for PayFast's validation endpoint in another
+process and sends signed ITNs to ``ITNReceiver`` as a WSGI app (from a
+pool of ``threads``, like a threaded WSGI server) and as an ASGI app (as
+up to ``concurrency`` tasks on one event loop), and to the Django REST
+framework view if Django REST framework is installed.
+
+The stand-in answers after ``latency`` milliseconds, as PayFast would.
+
+Usage::
+
+    python -m benchmarks.bench_receivers [threads] [concurrency] [itns] [latency]
+"""
+import io
+import sys
+import time
+import asyncio
+import logging
+import multiprocessing
+from decimal import Decimal
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from payfast.conf import settings
+from payfast.signature import make_signature
+from payfast.receivers import ITNReceiver
+
+IPADDR = '197.97.145.145'
+
+
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    latency = 0.3
+
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        # Simulate the network latency to PayFast.
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', '5')
+        self.end_headers()
+        self.wfile.write(b'VALID')
+
+
+    def log_message(self, *args):
+        pass
+
+
+
+
+class Server(ThreadingHTTPServer):
+
+    daemon_threads = True
+    # The default backlog of 5 resets connections under load.
+    request_queue_size = 1024
+
+
+
+
+def serve(ports, latency):
+    Handler.latency = latency
+    server = Server(('127.0.0.1', 0), Handler)
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+
+
+def make_bodies(count):
+    bodies = []
+    for index in range(count):
+        data = {
+            'm_payment_id': str(index),
+            'pf_payment_id': str(1000000 + index),
+            'payment_status': 'COMPLETE',
+            'item_name': 'Things',
+            'amount_gross': '200.00',
+            'merchant_id': '10000100',
+        }
+        data['signature'] = make_signature(data)
+        bodies.append(urlencode(data).encode('utf-8'))
+    return bodies
+
+
+
+
+def report(name, bodies, elapsed, statuses):
+    total = len(bodies)
+    errors = sum(1 for status in statuses if status != 200)
+    print(
+        f'{name:<8} {total} ITNs in {elapsed:.2f}s '
+        f'({total / elapsed:.0f} ITNs/s, {errors} errors)'
+    )
+
+
+
+
+def run_wsgi(bodies, threads):
+    app = ITNReceiver()
+
+    def send(body):
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(body)),
+            'REMOTE_ADDR': IPADDR,
+            'wsgi.input': io.BytesIO(body),
+        }
+        started = []
+        app(environ, lambda status, headers: started.append(status))
+        return int(started[0].split()[0])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        statuses = list(executor.map(send, bodies))
+    report('wsgi', bodies, time.perf_counter() - start, statuses)
+
+
+
+
+def run_asgi(bodies, concurrency):
+    app = ITNReceiver()
+
+    async def send(body, semaphore):
+        scope = {
+            'type': 'http',
+            'method': 'POST',
+            'headers': [
+                (b'content-type', b'application/x-www-form-urlencoded'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+            'client': (IPADDR, 443),
+        }
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body}
+
+        async def send_message(message):
+            sent.append(message)
+
+        async with semaphore:
+            await app(scope, receive, send_message)
+        return sent[0]['status']
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(send(body, semaphore) for body in bodies))
+
+    start = time.perf_counter()
+    statuses = asyncio.run(main())
+    report('asgi', bodies, time.perf_counter() - start, statuses)
+
+
+
+
+def run_drf(bodies, threads):
+    try:
+        import rest_framework  # noqa: F401
+        import django
+        from django.conf import settings as django_settings
+    except ImportError:
+        print('drf      skipped; Django REST framework is not installed')
+        return
+    if not django_settings.configured:
+        django_settings.configure(
+            DEBUG=False,
+            ALLOWED_HOSTS=['*'],
+            INSTALLED_APPS=['django.contrib.contenttypes', 'django.contrib.auth', 'rest_framework'],
+        )
+        django.setup()
+    from django.test import RequestFactory
+    from payfast.views import NotifyEndpoint
+
+    view = NotifyEndpoint.as_view()
+    factory = RequestFactory()
+
+    def send(body):
+        request = factory.post(
+            '/payfast/notify/',
+            data=body,
+            content_type='application/x-www-form-urlencoded',
+            REMOTE_ADDR=IPADDR,
+        )
+        return view(request).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        statuses = list(executor.map(send, bodies))
+    report('drf', bodies, time.perf_counter() - start, statuses)
+
+
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    latency = int(sys.argv[4]) if len(sys.argv) > 4 else 300
+
+    # The thread pools are larger than urllib3's connection pool.
+    logging.getLogger('urllib3').setLevel(logging.ERROR)
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(ports, latency / 1000), daemon=True)
+    server.start()
+    settings.VALIDATE_URL = f'http://127.0.0.1:{ports.get()}/eng/query/validate'
+    settings.expected_amount_callback = lambda m_payment_id: Decimal('200.00')
+    settings.payment_done_callback = lambda itn: None
+    # Every ITN is processed, not acknowledged as a copy.
+    settings.IDEMPOTENCY_BACKEND = 'off'
+    try:
+        run_wsgi(make_bodies(count), threads)
+        run_asgi(make_bodies(count), concurrency)
+        run_drf(make_bodies(count), threads)
+    finally:
+        server.terminate()
+
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Micro-benchmark for the signature engine.
+
+Compares ``Signer`` with the previous ``make_querystring`` implementation
+(reproduced below) for a typical payment and for API request headers.
+
+Usage::
+
+    python -m benchmarks.bench_signature
+"""
+import timeit
+import hashlib
+from decimal import Decimal
+from urllib.parse import urlencode
+from collections import OrderedDict
+
+from payfast.signature import FIELD_ORDER, Signer
+
+SALT = 'testing12345'
+PAYMENT = {
+    'merchant_id': 10030202,
+    'merchant_key': '4fkhqhutgnkhj',
+    'return_url': 'https://example.com/payfast/return/',
+    'cancel_url': 'https://example.com/payfast/cancel/',
+    'notify_url': 'https://example.com/payfast/notify/',
+    'name_first': 'Armandt',
+    'name_last': 'van Zyl',
+    'email_address': 'armandt@example.com',
+    'm_payment_id': '123',
+    'amount': Decimal('10.00'),
+    'item_name': 'Things, but things every month',
+    'custom_str1': '{"user_id": 1, "plan_id": "test", "trial": [null, null]}',
+    'payment_method': 'cc',
+    'subscription_type': 1,
+    'billing_date': '2023-02-09',
+    'recurring_amount': Decimal('10.00'),
+    'frequency': 3,
+    'cycles': 0,
+}
+HEADERS = {
+    'merchant-id': '10030202',
+    'version': 'v1',
+    'timestamp': '2023-02-09T10:00:00',
+    'amount': 1000,
+}
+
+
+
+
+def legacy_querystring(payfast_data, salt=SALT, a12y=False):
+    correct_order = list(FIELD_ORDER)
+    list_for_get_string = []
+    keys = list(payfast_data.keys())
+    if a12y:
+        keys.append('passphrase')
+        sorted_keys = sorted(keys)
+    else:
+        sorted_keys = sorted(keys, key=correct_order.index)
+    for key in sorted_keys:
+        if key == 'signature':
+            continue
+        if key == 'passphrase':
+            value = salt
+        else:
+            value = payfast_data[key]
+        if value is not None:
+            list_for_get_string.append((key, str(value)))
+    if not a12y:
+        list_for_get_string.append(('passphrase', salt))
+    return urlencode(OrderedDict(list_for_get_string))
+
+
+
+
+def legacy_signature(payfast_data, a12y=False):
+    querystring = legacy_querystring(payfast_data, a12y=a12y)
+    return hashlib.md5(querystring.encode()).hexdigest().lower()
+
+
+
+
+def main():
+    signer = Signer(SALT)
+    number = 20000
+    for name, data, a12y in [
+        ('payment', PAYMENT, False),
+        ('headers', HEADERS, True),
+    ]:
+        assert legacy_signature(data, a12y) == signer.signature(data, a12y)
+        legacy = timeit.timeit(
+            lambda: legacy_signature(data, a12y),
+            number=number,
+        )
+        new = timeit.timeit(
+            lambda: signer.signature(data, a12y),
+            number=number,
+        )
+        print(
+            f'{name:<8} legacy: {legacy / number * 1e6:6.1f}us  '
+            f'signer: {new / number * 1e6:6.1f}us  '
+            f'speedup: {legacy / new:.1f}x'
+        )
+
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Stress benchmark for concurrent ``Subscriptions.get`` calls.
+
+Runs a local stand-in for the PayFast API and compares the thread-local
+transport with a single ``requests.Session`` shared by every thread.
+
+Usage::
+
+    python -m benchmarks.bench_threads [threads] [requests_per_thread]
+"""
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from payfast import PayFast
+from payfast.conf import settings
+from payfast.base import RequestsTransport, ThreadLocalTransport
+from payfast.clients import registry
+
+TOKEN = 'a3b3ae55-ab8b-b388-df23-4e6882b86ce0'
+BODY = json.dumps({
+    'code': 200,
+    'status': 'success',
+    'data': {
+        'response': {
+            'amount': 1628,
+            'cycles': 14,
+            'cycles_complete': 9,
+            'frequency': 3,
+            'run_date': '2020-07-04T00:00:00+02:00',
+            'status': 1,
+            'status_reason': '',
+            'status_text': 'ACTIVE',
+            'token': TOKEN,
+        },
+    },
+}).encode()
+
+
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+
+    def do_GET(self):
+        # Simulate some network latency on PayFast's side.
+        time.sleep(0.002)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+
+    def log_message(self, *args):
+        pass
+
+
+
+
+class SharedSessionPayFast(PayFast):
+    TRANSPORT_CLASS = RequestsTransport
+
+
+
+
+class ThreadLocalPayFast(PayFast):
+    TRANSPORT_CLASS = ThreadLocalTransport
+
+
+
+
+def run(client_class, threads, per_thread):
+    registry.clear()
+    payfast = client_class()
+    errors = []
+
+    def target():
+        for _ in range(per_thread):
+            try:
+                payfast.subscriptions.get(TOKEN)
+            except Exception as exc:
+                errors.append(exc)
+
+    workers = [threading.Thread(target=target) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    total = threads * per_thread
+    print(
+        f'{client_class.__name__:<24} {total} requests in {elapsed:.2f}s '
+        f'({total / elapsed:.0f} req/s, {len(errors)} errors)'
+    )
+
+
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings.API_ROOT = f'http://127.0.0.1:{server.server_port}'
+    try:
+        run(SharedSessionPayFast, threads, per_thread)
+        run(ThreadLocalPayFast, threads, per_thread)
+    finally:
+        server.shutdown()
+
+
+
+
+if __name__ == '__main__':
+    main()
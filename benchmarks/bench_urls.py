@@ -0,0 +1,58 @@
+"""
+Benchmark for payment redirect URLs.
+
+Compares ``Payment.get_url`` with ``Payment.get_form`` for one payment,
+and ``build_payment_urls`` with creating payments and rendering their
+forms in a loop.
+
+Usage::
+
+    python -m benchmarks.bench_urls
+"""
+import time
+import timeit
+
+from payfast.payment import Payment
+from payfast.batch import build_payment_urls
+
+NOTIFY_URL = 'https://example.com/payfast/notify/'
+
+
+
+
+def main():
+    payment = Payment(10, 'Things', name_first='Armandt', notify_url=NOTIFY_URL)
+    payment.get_form()
+    number = 20000
+    form = timeit.timeit(payment.get_form, number=number)
+    url = timeit.timeit(payment.get_url, number=number)
+    print(
+        f'one payment   get_form: {form / number * 1e6:7.1f}us  '
+        f'get_url: {url / number * 1e6:7.1f}us  '
+        f'speedup: {form / url:.1f}x'
+    )
+
+    specs = [
+        {'amount': 10 + i % 50, 'item_name': f'Invoice {i}', 'm_payment_id': str(i)}
+        for i in range(2000)
+    ]
+    started = time.perf_counter()
+    for spec in specs:
+        spec = dict(spec)
+        Payment(spec.pop('amount'), spec.pop('item_name'), notify_url=NOTIFY_URL, **spec).get_form()
+    forms = time.perf_counter() - started
+    started = time.perf_counter()
+    for url in build_payment_urls(specs, notify_url=NOTIFY_URL):
+        pass
+    urls = time.perf_counter() - started
+    print(
+        f'{len(specs)} payments  forms: {forms * 1e3:7.1f}ms  '
+        f'build_payment_urls: {urls * 1e3:7.1f}ms  '
+        f'speedup: {forms / urls:.1f}x'
+    )
+
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Micro-benchmark for the validation modes of payments.
+
+Shows the per-payment cost of validating the data for PayFast in each
+``VALIDATION`` mode, and of creating a payment in each mode.
+
+Usage::
+
+    python -m benchmarks.bench_validation
+"""
+import timeit
+
+from payfast.conf import settings
+from payfast.payment import Payment, SubscriptionPayment
+from payfast.validation import validate, validate_many
+
+MODES = ('full', 'compiled', 'off')
+
+
+
+
+def main():
+    number = 20000
+    for payment in [
+        Payment(10, 'Things', name_first='Armandt'),
+        SubscriptionPayment(10, 'Things, but every month'),
+    ]:
+        name = type(payment).__name__
+        data = payment.data_for_payfast
+        for mode in MODES:
+            elapsed = timeit.timeit(
+                lambda: validate(payment.validator, data, mode),
+                number=number,
+            )
+            print(f'{name:<20} validate {mode:<9} {elapsed / number * 1e6:6.1f}us')
+
+        payloads = [data] * 1000
+        for mode in MODES[:2]:
+            elapsed = timeit.timeit(
+                lambda: validate_many(payment.validator, payloads, mode),
+                number=20,
+            )
+            print(
+                f'{name:<20} validate_many {mode:<9} '
+                f'{elapsed / 20 / len(payloads) * 1e6:6.1f}us per payment'
+            )
+
+    number = 2000
+    for mode in MODES:
+        settings.VALIDATION = mode
+        elapsed = timeit.timeit(
+            lambda: Payment(10, 'Things', name_first='Armandt'),
+            number=number,
+        )
+        print(f'{"Payment()":<20} {mode:<18} {elapsed / number * 1e6:6.1f}us')
+
+
+
+
+if __name__ == '__main__':
+    main()
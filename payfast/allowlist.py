@@ -0,0 +1,212 @@
+"""
+A compiled allowlist of PayFast's IP addresses.
+
+The addresses and networks are merged into sorted, non-overlapping integer
+intervals (one table for IPv4 and one for IPv6) so that a lookup is a
+``bisect`` instead of a scan of every network. Recently seen addresses are
+kept in a small LRU cache.
+
+The allowlist can be reloaded at runtime, without a restart, from a file
+(one address or network per line; ``#`` starts a comment) or from a
+callable that returns the addresses and networks. A file is also reloaded
+automatically when it changes.
+
+Exposes the following settings:
+
+.. data:: PAYFAST_NETWORKS
+
+.. data:: PAYFAST_IP_LIST
+
+.. data:: ALLOWLIST_PATH
+
+.. data:: allowlist_callback
+
+.. data:: ALLOWLIST_CACHE_SIZE
+"""
+import os
+import time
+import logging
+import threading
+from functools import lru_cache
+from bisect import bisect_right
+from collections import OrderedDict
+from ipaddress import ip_address, ip_network
+
+from payfast.conf import settings
+
+logger = logging.getLogger('payfast')
+
+# Seconds between checks for changes to the allowlist file.
+WATCH_INTERVAL = 1.0
+
+
+
+
+def get_intervals(entries) -> dict:
+    """
+    Returns the merged intervals per IP version as two lists: the start and
+    the end (inclusive) of every interval.
+    """
+    intervals = {4: [], 6: []}
+    for entry in entries:
+        network = ip_network(entry, strict=False)
+        intervals[network.version].append((
+            int(network.network_address),
+            int(network.broadcast_address),
+        ))
+
+    tables = {}
+    for version, items in intervals.items():
+        starts = []
+        ends = []
+        for start, end in sorted(items):
+            if ends and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+                continue
+            starts.append(start)
+            ends.append(end)
+        tables[version] = (starts, ends)
+    return tables
+
+
+
+
+def read_entries(path) -> list:
+    entries = []
+    with open(path) as fp:
+        for line in fp:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                entries.append(line)
+    return entries
+
+
+
+
+class IPAllowlist:
+
+    def __init__(
+        self,
+        entries=None,
+        path=None,
+        callback=None,
+        cache_size=None,
+    ):
+        """
+        :param entries: IP addresses and networks. Defaults to
+                        ``PAYFAST_IP_LIST`` and ``PAYFAST_NETWORKS``.
+        :param path: A file to load the entries from instead.
+        :param callback: A callable that returns the entries, used instead
+                         of ``path`` and ``entries``.
+        """
+        if entries is None:
+            entries = [*settings.PAYFAST_IP_LIST, *settings.PAYFAST_NETWORKS]
+        if cache_size is None:
+            cache_size = settings.ALLOWLIST_CACHE_SIZE
+        self.entries = [str(entry) for entry in entries]
+        self.path = path
+        self.callback = callback
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self.reload()
+
+
+    def get_entries(self) -> list:
+        if self.callback is not None:
+            return list(self.callback())
+        if self.path:
+            self._mtime = os.stat(self.path).st_mtime
+            return read_entries(self.path)
+        return self.entries
+
+
+    def reload(self):
+        """
+        Compile the entries again. The previous allowlist stays in use if
+        the new entries are invalid.
+        """
+        try:
+            tables = get_intervals(self.get_entries())
+        except (OSError, ValueError) as exc:
+            if getattr(self, '_tables', None) is None:
+                raise
+            logger.error(f'Could not reload the PayFast IP allowlist: {exc}')
+            return
+        # Swapped together so that lookups never see a stale cache for
+        # new tables.
+        with self._lock:
+            self._tables = tables
+            self._cache = OrderedDict()
+
+
+    def watch(self):
+        """
+        Reload the allowlist if the file has changed. Checks at most once
+        every ``WATCH_INTERVAL`` seconds.
+        """
+        if not self.path or self.callback is not None:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < WATCH_INTERVAL:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+
+    def lookup(self, ip) -> bool:
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        starts, ends = self._tables[ip.version]
+        value = int(ip)
+        index = bisect_right(starts, value) - 1
+        return index >= 0 and value <= ends[index]
+
+
+    def check(self, ip_string):
+        """
+        Returns whether the address is allowed and the parsed address, or
+        ``None`` if it is not a valid address.
+        """
+        self.watch()
+        with self._lock:
+            cache = self._cache
+            result = cache.get(ip_string, None)
+            if result is not None:
+                cache.move_to_end(ip_string)
+                return result
+        try:
+            ip = ip_address(str(ip_string).strip())
+        except ValueError:
+            # ValueError: <value> does not appear to be an IPv4 or IPv6 address
+            return False, None
+        result = (self.lookup(ip), ip)
+        with self._lock:
+            if cache is self._cache and self.cache_size:
+                cache[ip_string] = result
+                if len(cache) > self.cache_size:
+                    cache.popitem(last=False)
+        return result
+
+
+    def __contains__(self, ip_string):
+        return self.check(ip_string)[0]
+
+
+
+
+@lru_cache(maxsize=None)
+def get_allowlist() -> IPAllowlist:
+    """
+    Returns the shared ``IPAllowlist``, built on first use.
+    """
+    return IPAllowlist(
+        path=settings.ALLOWLIST_PATH,
+        callback=settings.allowlist_callback,
+    )
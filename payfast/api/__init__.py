@@ -0,0 +1,12 @@
+def __getattr__(name):
+    # Submodules, e.g. "payfast.api.subscriptions", are imported on first
+    # use like they are for "payfast".
+    from importlib import import_module
+
+    submodule = f'{__name__}.{name}'
+    try:
+        return import_module(submodule)
+    except ModuleNotFoundError as exc:
+        if exc.name != submodule:
+            raise
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
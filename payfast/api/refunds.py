@@ -1,4 +1,4 @@
-from payfast.base import Resource
+from payfast.base import Resource, AsyncResource
 
 
 
@@ -40,3 +40,9 @@ class Refunds(Resource):
         GET /refunds/:id
         """
         raise NotImplementedError
+
+
+
+
+class AsyncRefunds(Refunds, AsyncResource):
+    pass
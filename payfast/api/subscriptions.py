@@ -1,6 +1,5 @@
 # TODO: add TokenizedSubscription
 
-import json
 import decimal
 import logging
 from decimal import Decimal
@@ -9,18 +8,19 @@ from typing import List, Union
 
 from dateutil.relativedelta import relativedelta
 
-from payfast import constants, timezone
-from payfast.base import Resource
+from payfast import codec, constants, timezone
+from payfast.base import Resource, AsyncResource
 from payfast.decorators import cached
+from payfast.singleflight import flight, async_flight
 from payfast.utils import (
     urljoin,
     prorate,
     cache_bust,
+    acache_bust,
     get_freq_delta,
 )
 from payfast.conf import settings
 from payfast.exceptions import PayFastAPIException, PayFastException
-from payfast.serialization import PayFastJSONEncoder
 from payfast.payment import (
     Payment,
     SubscriptionPayment,
@@ -221,7 +221,7 @@ class Upgrade:
             'upgrade_to_id': self.upgrade_to_id,
             'cancel': self.cancel,
         }
-        return json.dumps(d, cls=PayFastJSONEncoder)
+        return codec.dumps(d)
 
 
     def do(self, itn=None):
@@ -293,14 +293,14 @@ class SubscriptionBase:
 
 
     def cancel(self):
-        from payfast import PayFast
-        payfast = PayFast()
+        from payfast.clients import get_payfast
+        payfast = get_payfast()
         return payfast.subscriptions.cancel(self.token)
 
 
     def update_card_link(self, return_url=None) -> str:
-        from payfast import PayFast
-        payfast = PayFast()
+        from payfast.clients import get_payfast
+        payfast = get_payfast()
         return payfast.subscriptions.update_card_link(self.token, return_url)
 
 
@@ -388,8 +388,8 @@ class Subscription(SubscriptionBase):
 
         :param amount: The amount to downgrade to.
         """
-        from payfast import PayFast
-        payfast = PayFast()
+        from payfast.clients import get_payfast
+        payfast = get_payfast()
 
         if settings.PAYFAST_UPDATE_BUG:
             raise PayFastException(
@@ -459,8 +459,8 @@ class Subscription(SubscriptionBase):
 
 
     def change_billing_day(self, day: int) -> bool:
-        from payfast import PayFast
-        payfast = PayFast()
+        from payfast.clients import get_payfast
+        payfast = get_payfast()
 
         # TODO: take billing cycle into account
         # TODO: prorate?
@@ -520,8 +520,8 @@ class Subscription(SubscriptionBase):
 
 
     def update(self, **kwargs):
-        from payfast import PayFast
-        payfast = PayFast()
+        from payfast.clients import get_payfast
+        payfast = get_payfast()
         return payfast.subscriptions.update(self.token, **kwargs)
 
 
@@ -597,8 +597,18 @@ class SubscriptionBaseResource:
 
         :rtype: Subscription
         """
+        # Concurrent callers for the same token share one request.
+        key = self.flight_key(token, self.is_card)
+        return flight.do(key, self._get, token)
+
+
+    def _get(self, token):
         uri = urljoin([self.uri, token, 'fetch'])
         response = self.request('GET', uri)
+        return self._handle_get(token, response)
+
+
+    def _handle_get(self, token, response):
         data = response.payload
         if isinstance(data, dict):
             if 'token' not in data:
@@ -633,6 +643,12 @@ class SubscriptionBaseResource:
         uri = urljoin([self.uri, token, 'cancel'])
         # TODO: handle "Failure - The subscription status is cancelled"
         response = self.request('PUT', uri, raise_for_status=False)
+        data = self._handle_cancel(response)
+        cache_bust(token)
+        return data
+
+
+    def _handle_cancel(self, response):
         if not response.ok:
             cancel_msg = 'failure - the subscription status is cancelled'
             if cancel_msg in response.message.lower():
@@ -650,9 +666,96 @@ class SubscriptionBaseResource:
                     response.payload = True
             else:
                 raise PayFastAPIException(response)
-        data = response.payload
-        cache_bust(token)
-        return data
+        return response.payload
+
+
+    def _update_payload(self, cycles, run_date, amount_cents, amount) -> dict:
+        payload = {}
+        if cycles:
+            payload['cycles'] = cycles
+        if run_date:
+            if not isinstance(run_date, datetime):
+                raise ValueError('"run_date" must be a datetime object.')
+            run_date = timezone.normalize(run_date)
+            run_date = run_date.strftime('%Y-%m-%d')
+            payload['run_date'] = run_date
+
+        if not amount_cents and not amount:
+            raise ValueError(
+                'You must provide a value for either "amount" or "amount_cents" '
+                'when running "Subscriptions.update".'
+            )
+        if amount:
+            try:
+                amount = Decimal(amount)
+                amount = amount.quantize(Decimal('1.00'))
+            except (decimal.InvalidOperation, TypeError):
+                amount_type = type(amount)
+                raise ValueError(
+                    f'Value provided for "amount" argument ("{amount}") '
+                    f'must support conversion to "Decimal". '
+                    f'Value type: "{amount_type}".'
+                )
+            amount_cents = amount * Decimal(100)
+
+        amount_cents = int(amount_cents)
+        payload['amount'] = amount_cents
+        if not payload:
+            raise ValueError(
+                'You must provide at least one of the optional kwargs for the '
+                'subscription update.'
+            )
+        return payload
+
+
+    def _charge_args(
+        self,
+        token,
+        amount,
+        item_name,
+        item_description=None,
+        itn=True,
+        m_payment_id=None,
+        cc_cvv=None,
+        setup=None,
+    ):
+        amount_cents = int(amount * 100)
+        logger.info(f'Charging card "{token}" with {amount_cents} cents.')
+        uri = urljoin([self.uri, token, 'adhoc'])
+        if itn:
+            itn = 'true'
+        else:
+            itn = 'false'
+        _payload = {
+            'amount': amount_cents,
+            'item_name': item_name,
+            'item_description': item_description,
+            'itn': itn,
+            'm_payment_id': m_payment_id,
+            'cc_cvv': cc_cvv,
+            'setup': setup,
+        }
+        payload = {
+            key: value for key, value in _payload.items() if value is not None
+        }
+        return uri, payload
+
+
+    def _handle_charge(self, response):
+        pf_payment_id = None
+        data = getattr(response, 'payload')
+        try:
+            pf_payment_id = data['pf_payment_id']
+        except (KeyError, TypeError):
+            # No errors were raised in making the request so let's assume
+            # the charge was successful. Log this for someone to look at
+            # and figure out what happened otherwise there may be a risk
+            # in double-charging if the user of this library retries payment.
+            logger.error(
+                f'No PayFast payment ID was found in response payload. '
+                f'Payload: {data}'
+            )
+        return pf_payment_id
 
 
     def update_card_link(self, token, return_url=None) -> str:
@@ -743,41 +846,7 @@ class Subscriptions(SubscriptionBaseResource, Resource):
         from payfast import callbacks
 
         uri = urljoin([self.uri, token, 'update'])
-        payload = {}
-        if cycles:
-            payload['cycles'] = cycles
-        if run_date:
-            if not isinstance(run_date, datetime):
-                raise ValueError('"run_date" must be a datetime object.')
-            run_date = timezone.normalize(run_date)
-            run_date = run_date.strftime('%Y-%m-%d')
-            payload['run_date'] = run_date
-
-        if not amount_cents and not amount:
-            raise ValueError(
-                'You must provide a value for either "amount" or "amount_cents" '
-                'when running "Subscriptions.update".'
-            )
-        if amount:
-            try:
-                amount = Decimal(amount)
-                amount = amount.quantize(Decimal('1.00'))
-            except (decimal.InvalidOperation, TypeError):
-                amount_type = type(amount)
-                raise ValueError(
-                    f'Value provided for "amount" argument ("{amount}") '
-                    f'must support conversion to "Decimal". '
-                    f'Value type: "{amount_type}".'
-                )
-            amount_cents = amount * Decimal(100)
-
-        amount_cents = int(amount_cents)
-        payload['amount'] = amount_cents
-        if not payload:
-            raise ValueError(
-                'You must provide at least one of the optional kwargs for the '
-                'subscription update.'
-            )
+        payload = self._update_payload(cycles, run_date, amount_cents, amount)
         response = None
         try:
             response = self.request('PATCH', uri, payload=payload)
@@ -843,40 +912,166 @@ class Cards(SubscriptionBaseResource, Resource):
                 }
             }
         """
-        amount_cents = int(amount * 100)
-        logger.info(f'Charging card "{token}" with {amount_cents} cents.')
-        uri = urljoin([self.uri, token, 'adhoc'])
-        if itn:
-            itn = 'true'
-        else:
-            itn = 'false'
-        _payload = {
-            'amount': amount_cents,
-            'item_name': item_name,
-            'item_description': item_description,
-            'itn': itn,
-            'm_payment_id': m_payment_id,
-            'cc_cvv': cc_cvv,
-            'setup': setup,
-        }
-        payload = {
-            key: value for key, value in _payload.items() if value is not None
-        }
+        uri, payload = self._charge_args(
+            token,
+            amount,
+            item_name,
+            item_description=item_description,
+            itn=itn,
+            m_payment_id=m_payment_id,
+            cc_cvv=cc_cvv,
+            setup=setup,
+        )
         response = self.request('POST', uri, payload=payload)
-        pf_payment_id = None
-        data = getattr(response, 'payload')
+        return self._handle_charge(response)
+
+
+    def new(self, *args, **kwargs):
+        return TokenizedPayment(*args, **kwargs)
+
+
+
+
+class AsyncSubscriptionBaseResource(SubscriptionBaseResource):
+    """
+    The ``asyncio`` counterpart of ``SubscriptionBaseResource``. Requests
+    are built and responses are handled in exactly the same way.
+    """
+
+    async def fetch(self, *args, **kwargs):
+        return await self.get(*args, **kwargs)
+
+
+    @cached
+    async def get(self, token, **kwargs):
+        """
+        GET ``/subscriptions/:token/fetch``
+
+        :rtype: Subscription
+        """
+        key = self.flight_key(token, self.is_card)
+        return await async_flight.do(key, self._get, token)
+
+
+    async def _get(self, token):
+        uri = urljoin([self.uri, token, 'fetch'])
+        response = await self.request('GET', uri)
+        return self._handle_get(token, response)
+
+
+    async def cancel(self, token):
+        """
+        PUT /subscriptions/:token/cancel
+
+        :rtype: bool
+        """
+        uri = urljoin([self.uri, token, 'cancel'])
+        response = await self.request('PUT', uri, raise_for_status=False)
+        data = self._handle_cancel(response)
+        await acache_bust(token, self)
+        return data
+
+
+
+
+class AsyncSubscriptions(AsyncSubscriptionBaseResource, AsyncResource):
+
+
+    async def pause(self, token):
+        """
+        PUT /subscriptions/:token/pause
+
+        :rtype: bool
+        """
+        uri = urljoin([self.uri, token, 'pause'])
+        response = await self.request('PUT', uri)
+        await acache_bust(token, self)
+        return response.payload
+
+
+    async def unpause(self, token):
+        """
+        PUT /subscriptions/:token/unpause
+
+        :rtype: bool
+        """
+        uri = urljoin([self.uri, token, 'unpause'])
+        response = await self.request('PUT', uri)
+        await acache_bust(token, self)
+        return response.payload
+
+
+    async def update(
+        self,
+        token,
+        cycles: int=None,
+        run_date: datetime=None,
+        amount_cents: int=None,
+        amount=None,
+    ):
+        """
+        PATCH /subscriptions/:token/update
+
+        See ``Subscriptions.update``.
+        """
+        from payfast import callbacks
+
+        uri = urljoin([self.uri, token, 'update'])
+        payload = self._update_payload(cycles, run_date, amount_cents, amount)
+        response = None
         try:
-            pf_payment_id = data['pf_payment_id']
-        except (KeyError, TypeError):
-            # No errors were raised in making the request so let's assume
-            # the charge was successful. Log this for someone to look at
-            # and figure out what happened otherwise there may be a risk
-            # in double-charging if the user of this library retries payment.
-            logger.error(
-                f'No PayFast payment ID was found in response payload. '
-                f'Payload: {data}'
-            )
-        return pf_payment_id
+            response = await self.request('PATCH', uri, payload=payload)
+        except Exception as exc:
+            callbacks._subscription_update(token, payload, success=False)
+            raise
+        data = response.payload
+        await acache_bust(token, self)
+        callbacks._subscription_update(token, payload, success=True)
+        return data
+
+
+    def new(self, *args, **kwargs):
+        return SubscriptionPayment(*args, **kwargs)
+
+
+
+
+class AsyncCards(AsyncSubscriptionBaseResource, AsyncResource):
+
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.is_card = True
+
+
+    async def charge(
+        self,
+        token,
+        amount: Decimal,
+        item_name,
+        item_description=None,
+        itn: bool=True,
+        m_payment_id=None,
+        cc_cvv: str=None,
+        setup=None,
+    ):
+        """
+        POST /subscriptions/:token/adhoc
+
+        See ``Cards.charge``.
+        """
+        uri, payload = self._charge_args(
+            token,
+            amount,
+            item_name,
+            item_description=item_description,
+            itn=itn,
+            m_payment_id=m_payment_id,
+            cc_cvv=cc_cvv,
+            setup=setup,
+        )
+        response = await self.request('POST', uri, payload=payload)
+        return self._handle_charge(response)
 
 
     def new(self, *args, **kwargs):
@@ -6,8 +6,9 @@ from datetime import datetime
 from typing import List
 
 from payfast import constants, timezone
-from payfast.base import Resource
+from payfast.base import Resource, AsyncResource
 from payfast.utils import urljoin, csv_to_dict
+from payfast.singleflight import flight, async_flight
 from payfast.conf import settings
 from payfast.exceptions import PayFastAPIException
 from payfast.payment import (
@@ -170,6 +171,17 @@ class Transactions(Resource):
         return _data
 
 
+    def _list(self, uri, params):
+        response = self.request('GET', uri, params=params)
+        return self._handle_list(response)
+
+
+    def _handle_list(self, response):
+        csv_string = response.payload
+        data = self._normalize_response(csv_string)
+        return TransactionList(data)
+
+
     def list(self, start: datetime, end: datetime):
         """
         GET /transactions/history?from=:date&to=:date
@@ -178,10 +190,7 @@ class Transactions(Resource):
             'from': start,
             'to': end,
         })
-        response = self.request('GET', self.uri, params=params)
-        csv_string = response.payload
-        data = self._normalize_response(csv_string)
-        return TransactionList(data)
+        return self._list(self.uri, params)
 
 
     def list_daily(self, date: datetime):
@@ -195,10 +204,7 @@ class Transactions(Resource):
         params = self._prep_params({
             'date': date.strftime('%Y-%m-%d'),
         })
-        response = self.request('GET', uri, params=params)
-        csv_string = response.payload
-        data = self._normalize_response(csv_string)
-        return TransactionList(data)
+        return self._list(uri, params)
 
 
     def list_weekly(self, date: datetime):
@@ -212,10 +218,7 @@ class Transactions(Resource):
         params = self._prep_params({
             'date': date.strftime('%Y-%m-%d'),
         })
-        response = self.request('GET', uri, params=params)
-        csv_string = response.payload
-        data = self._normalize_response(csv_string)
-        return TransactionList(data)
+        return self._list(uri, params)
 
 
     def list_monthly(self, date: datetime):
@@ -229,10 +232,7 @@ class Transactions(Resource):
         params = self._prep_params({
             'date': date.strftime('%Y-%m'),
         })
-        response = self.request('GET', uri, params=params)
-        csv_string = response.payload
-        data = self._normalize_response(csv_string)
-        return TransactionList(data)
+        return self._list(uri, params)
 
 
 
@@ -288,7 +288,44 @@ class CCTransactions(Resource):
                 }
             }
         """
+        # Concurrent callers for the same ID share one request.
+        return flight.do(self.flight_key(id), self._get, id)
+
+
+    def _get(self, id):
         uri = urljoin([self.uri, id])
         response = self.request('GET', uri)
-        data = response.payload
-        return CCTransaction(data)
+        return CCTransaction(response.payload)
+
+
+
+
+class AsyncTransactions(Transactions, AsyncResource):
+    """
+    The ``asyncio`` counterpart of ``Transactions``. All of the ``list``
+    methods return awaitables.
+    """
+
+    async def _list(self, uri, params):
+        response = await self.request('GET', uri, params=params)
+        return self._handle_list(response)
+
+
+
+
+class AsyncCCTransactions(CCTransactions, AsyncResource):
+
+
+    async def get(self, id: str):
+        """
+        GET /process/query/:id
+
+        See ``CCTransactions.get``.
+        """
+        return await async_flight.do(self.flight_key(id), self._get, id)
+
+
+    async def _get(self, id):
+        uri = urljoin([self.uri, id])
+        response = await self.request('GET', uri)
+        return CCTransaction(response.payload)
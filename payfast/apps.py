@@ -18,6 +18,7 @@ class PayfastConfig(AppConfig):
         from payfast.conf import settings
         from payfast import signals
 
+        settings.check()
         settings.configure_django()
 
 
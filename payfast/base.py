@@ -1,4 +1,6 @@
 import json
+import time
+import asyncio
 import logging
 from datetime import datetime
 from urllib.parse import urljoin
@@ -6,10 +8,20 @@ import urllib.parse
 
 import requests
 
-from payfast import timezone
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from payfast import timezone, retry, circuit, ratelimit
 from payfast.conf import settings
-from payfast.signature import make_signature
-from payfast.exceptions import PayFastAPIException, PayFastTimeout
+from payfast.utils import get_endpoint
+from payfast.exceptions import (
+    PayFastAPIException,
+    PayFastTimeout,
+    PayFastCircuitOpen,
+    PayFastRateLimited,
+)
 
 logger = logging.getLogger('payfast')
 
@@ -23,11 +35,15 @@ class PayFastResponse:
         Example responses received from PayFast can be found in
         ``payfast/responses.txt``.
 
-        :param response: The response as received from ``python-requests``.
+        :param response: The response as received from ``python-requests``
+                         or ``httpx``.
         """
         self.orig = response
         self.status_code = response.status_code
-        self.ok = response.ok
+        # httpx responses don't have the ``ok`` attribute.
+        self.ok = getattr(response, 'ok', None)
+        if self.ok is None:
+            self.ok = response.is_success
 
         # These are the things that we will find in a variety
         # of API responses from PayFast. Some values might be
@@ -50,7 +66,10 @@ class PayFastResponse:
         self.http_status = response.status_code
         try:
             self.json = response.json()
-        except requests.JSONDecodeError:
+        except ValueError:
+            # requests.JSONDecodeError is based on simplejson's error if
+            # simplejson is installed, not json's; both are ValueErrors,
+            # as is the error raised by httpx.
             self.text = response.content.decode()
         logger.debug(json.dumps(self.json, indent=4))
 
@@ -95,9 +114,77 @@ class PayFastResponse:
 
 class RequestsTransport:
 
-    def __init__(self, api_version):
+    retry_policy = None
+    circuit_breaker = None
+    rate_limiter = None
+
+
+    def __init__(
+        self,
+        api_version,
+        session=None,
+        retry_policy=None,
+        circuit_breaker=None,
+        rate_limiter=None,
+        merchant=None,
+    ):
+        """
+        :param session: The ``requests.Session`` to use. Defaults to the
+                        shared session from ``payfast.clients.registry``.
+        :param retry_policy: A ``payfast.retry.RetryPolicy``. Defaults to
+                             ``payfast.retry.get_default_policy()``.
+        :param circuit_breaker: A ``payfast.circuit.CircuitBreaker``.
+                                Defaults to ``payfast.circuit.get_breaker()``
+                                unless ``CIRCUIT_BREAKER`` is disabled.
+        :param rate_limiter: A ``payfast.ratelimit.RateLimiter``. Defaults
+                             to ``payfast.ratelimit.get_limiter()`` if any rate
+                             limits are configured.
+        :param merchant: A ``payfast.merchants.Merchant``. Defaults to the
+                         current merchant when the request is made.
+        """
+        from payfast.clients import registry
+
         self.api_version = api_version
-        self.session = requests.Session()
+        self.merchant = merchant
+        if session is None:
+            session = registry.session(*self.get_merchant().pool_key)
+        self.session = session
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.rate_limiter = rate_limiter
+
+
+    def get_merchant(self):
+        from payfast.merchants import current_merchant
+        return self.merchant or current_merchant()
+
+
+    def get_retry_policy(self) -> retry.RetryPolicy:
+        return self.retry_policy or retry.get_default_policy()
+
+
+    def get_circuit_breaker(self):
+        if self.circuit_breaker:
+            return self.circuit_breaker
+        if settings.CIRCUIT_BREAKER:
+            return circuit.get_breaker()
+        return None
+
+
+    def get_rate_limiter(self):
+        if self.rate_limiter:
+            return self.rate_limiter
+        limiter = ratelimit.get_limiter()
+        if limiter.enabled:
+            return limiter
+        return None
+
+
+    def get_rate_limit_args(self) -> dict:
+        return {
+            'blocking': settings.RATE_LIMIT_BLOCKING,
+            'timeout': settings.RATE_LIMIT_TIMEOUT or None,
+        }
 
 
     def handle_response(self, response, raise_for_status=True) -> PayFastResponse:
@@ -108,17 +195,20 @@ class RequestsTransport:
         return response
 
 
-    def request(
+    def build_request(
         self,
         method,
         uri,
         payload=None,
         params=None,
         headers=None,
-        raise_for_status=True,
         urlencode=False,
-        **kwargs
-    ):
+    ) -> dict:
+        """
+        Build the signed arguments for a request to the PayFast API. This
+        is shared by all transports so that the header signing stays the
+        same regardless of the HTTP client used.
+        """
         if not headers:
             for_headers = payload or params
             content_type = None
@@ -150,21 +240,49 @@ class RequestsTransport:
             request_args['params'] = params
 
         logger.debug(json.dumps(request_args, indent=4))
+        return request_args
+
 
+    def request(
+        self,
+        method,
+        uri,
+        payload=None,
+        params=None,
+        headers=None,
+        raise_for_status=True,
+        urlencode=False,
+        **kwargs
+    ):
+        request_args = self.build_request(
+            method,
+            uri,
+            payload=payload,
+            params=params,
+            headers=headers,
+            urlencode=urlencode,
+        )
         req = requests.Request(**request_args)
         req = req.prepare()
-        response = None
+        endpoint = get_endpoint(uri)
+        breaker = self.get_circuit_breaker()
+        if breaker:
+            decision = breaker.before_request(endpoint)
+            if decision == circuit.PROBE:
+                ok = breaker.probe()
+                breaker.probe_done(endpoint, ok)
+                if not ok:
+                    raise PayFastCircuitOpen(endpoint)
+            elif decision == circuit.REJECT:
+                raise PayFastCircuitOpen(endpoint)
         try:
-            response = self.session.send(
-                req,
-                timeout=settings.API_TIMEOUT,
-                allow_redirects=False,
-            )
-        except (
-            requests.ConnectionError,
-            requests.Timeout
-        ):
-            raise PayFastTimeout()
+            response = self.send(req, method, uri, payload)
+        except PayFastTimeout:
+            if breaker:
+                breaker.record(endpoint, success=False)
+            raise
+        if breaker:
+            breaker.record(endpoint, success=response.status_code < 500)
 
         response = self.handle_response(
             response,
@@ -173,6 +291,58 @@ class RequestsTransport:
         return response
 
 
+    def send(self, req, method, uri, payload=None):
+        """
+        Send the prepared request, retrying it according to the retry
+        policy if it is idempotent.
+        """
+        policy = self.get_retry_policy()
+        policy.stats.incr('requests')
+        idempotent = policy.is_idempotent(method, uri, payload)
+        if not idempotent:
+            policy.stats.incr('not_idempotent')
+        limiter = self.get_rate_limiter()
+        endpoint = get_endpoint(uri)
+        started = time.monotonic()
+        attempt = 0
+        response = None
+        while True:
+            attempt += 1
+            if limiter:
+                args = self.get_rate_limit_args()
+                if not limiter.acquire(endpoint, **args):
+                    raise PayFastRateLimited(endpoint)
+            policy.stats.incr('attempts')
+            delay = None
+            try:
+                response = self.session.send(
+                    req,
+                    timeout=policy.get_timeout(started),
+                    allow_redirects=False,
+                )
+            except (
+                requests.ConnectionError,
+                requests.Timeout
+            ):
+                if idempotent:
+                    delay = policy.next_delay(attempt, started, 'connection')
+                if delay is None:
+                    raise PayFastTimeout()
+            else:
+                status = response.status_code
+                if idempotent and status in policy.RETRY_STATUSES:
+                    delay = policy.next_delay(
+                        attempt,
+                        started,
+                        status,
+                        response=response,
+                    )
+                if delay is None:
+                    break
+            time.sleep(delay)
+        return response
+
+
     def get_headers(self, payload, content_type=None):
         # There's a bug on PayFast's API where they don't account
         # for microseconds which means that using datetime.isoformat()
@@ -180,8 +350,9 @@ class RequestsTransport:
         # timestamp = timezone.now().isoformat()
         timestamp = timezone.now()
         timestamp = timestamp.strftime('%Y-%m-%dT%H:%M:%S')
+        merchant = self.get_merchant()
         headers = {
-            'merchant-id': str(settings.MERCHANT_ID),
+            'merchant-id': str(merchant.merchant_id),
             'version': self.api_version,
             'timestamp': str(timestamp),
         }
@@ -194,7 +365,7 @@ class RequestsTransport:
                 }
             elif isinstance(payload, str):
                 for_signature['payload'] = payload
-        signature = make_signature(for_signature, a12y=True)
+        signature = merchant.signer.signature(for_signature, a12y=True)
         headers['signature'] = signature
 
         if content_type:
@@ -204,14 +375,210 @@ class RequestsTransport:
 
 
 
+class ThreadLocalTransport(RequestsTransport):
+    """
+    Gives each thread its own ``requests.Session``. The sessions share one
+    bounded connection pool from ``payfast.clients.registry``.
+
+    ``requests.Session`` is not documented as thread-safe, so this is the
+    transport to use with module-level clients in multi-threaded WSGI
+    servers (gthread, gevent, etc).
+    """
+
+    def __init__(
+        self,
+        api_version,
+        retry_policy=None,
+        circuit_breaker=None,
+        rate_limiter=None,
+        merchant=None,
+    ):
+        self.api_version = api_version
+        self.merchant = merchant
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.rate_limiter = rate_limiter
+
+
+    @property
+    def session(self):
+        from payfast.clients import registry
+        return registry.thread_session(*self.get_merchant().pool_key)
+
+
+
+
+class AsyncTransport(RequestsTransport):
+    """
+    A non-blocking transport that uses a pooled ``httpx.AsyncClient``.
+
+    Requests are signed and responses are handled exactly like they are
+    in ``RequestsTransport``; only the I/O is different.
+    """
+
+    def __init__(
+        self,
+        api_version,
+        client=None,
+        retry_policy=None,
+        circuit_breaker=None,
+        rate_limiter=None,
+        merchant=None,
+    ):
+        if httpx is None:
+            raise ImportError(
+                'The "httpx" package is required to use "AsyncTransport". '
+                'Install it with "pip install httpx".'
+            )
+        self.api_version = api_version
+        self.merchant = merchant
+        self._client = client
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.rate_limiter = rate_limiter
+
+
+    @property
+    def client(self):
+        """
+        The shared ``httpx.AsyncClient`` for the running event loop from
+        ``payfast.clients.registry`` unless a client was provided.
+        """
+        from payfast.clients import registry
+
+        if self._client is not None:
+            return self._client
+        return registry.async_client(*self.get_merchant().pool_key)
+
+
+    async def request(
+        self,
+        method,
+        uri,
+        payload=None,
+        params=None,
+        headers=None,
+        raise_for_status=True,
+        urlencode=False,
+        **kwargs
+    ):
+        request_args = self.build_request(
+            method,
+            uri,
+            payload=payload,
+            params=params,
+            headers=headers,
+            urlencode=urlencode,
+        )
+        # httpx expects raw request bodies as "content".
+        if 'data' in request_args:
+            request_args['content'] = request_args.pop('data')
+        endpoint = get_endpoint(uri)
+        breaker = self.get_circuit_breaker()
+        if breaker:
+            decision = breaker.before_request(endpoint)
+            if decision == circuit.PROBE:
+                # The probe uses the blocking client.
+                loop = asyncio.get_running_loop()
+                ok = await loop.run_in_executor(None, breaker.probe)
+                breaker.probe_done(endpoint, ok)
+                if not ok:
+                    raise PayFastCircuitOpen(endpoint)
+            elif decision == circuit.REJECT:
+                raise PayFastCircuitOpen(endpoint)
+        try:
+            response = await self.send(request_args, method, uri, payload)
+        except PayFastTimeout:
+            if breaker:
+                breaker.record(endpoint, success=False)
+            raise
+        if breaker:
+            breaker.record(endpoint, success=response.status_code < 500)
+
+        response = self.handle_response(
+            response,
+            raise_for_status=raise_for_status,
+        )
+        return response
+
+
+    async def send(self, request_args, method, uri, payload=None):
+        policy = self.get_retry_policy()
+        policy.stats.incr('requests')
+        idempotent = policy.is_idempotent(method, uri, payload)
+        if not idempotent:
+            policy.stats.incr('not_idempotent')
+        limiter = self.get_rate_limiter()
+        endpoint = get_endpoint(uri)
+        started = time.monotonic()
+        attempt = 0
+        response = None
+        while True:
+            attempt += 1
+            if limiter:
+                args = self.get_rate_limit_args()
+                if not await limiter.acquire_async(endpoint, **args):
+                    raise PayFastRateLimited(endpoint)
+            policy.stats.incr('attempts')
+            delay = None
+            try:
+                response = await self.client.request(
+                    **request_args,
+                    timeout=policy.get_timeout(started),
+                    follow_redirects=False,
+                )
+            except httpx.TransportError:
+                # Includes timeouts and connection errors.
+                if idempotent:
+                    delay = policy.next_delay(attempt, started, 'connection')
+                if delay is None:
+                    raise PayFastTimeout()
+            else:
+                status = response.status_code
+                if idempotent and status in policy.RETRY_STATUSES:
+                    delay = policy.next_delay(
+                        attempt,
+                        started,
+                        status,
+                        response=response,
+                    )
+                if delay is None:
+                    break
+            await asyncio.sleep(delay)
+        return response
+
+
+    async def close(self):
+        # Shared clients are closed with ``registry.aclose()``.
+        if self._client is not None:
+            await self._client.aclose()
+
+
+
+
 class Resource:
 
     key = None
 
 
-    def __init__(self, api_version, transport_class=RequestsTransport):
-        self.base_uri = settings.API_ROOT
-        self.transport = transport_class(api_version)
+    def __init__(
+        self,
+        api_version,
+        transport_class=RequestsTransport,
+        transport=None,
+        base_uri=None,
+    ):
+        """
+        :param transport: An existing transport to use instead of creating
+                          a new one from ``transport_class``. This allows
+                          several resources to share one connection pool.
+        :param base_uri: Defaults to the ``api_root`` of the transport's
+                         merchant when the request is made.
+        """
+        self._base_uri = base_uri
+        if transport is None:
+            transport = transport_class(api_version)
+        self.transport = transport
 
 
     def request(self, method, uri, **kwargs):
@@ -223,11 +590,25 @@ class Resource:
         return response
 
 
+    @property
+    def base_uri(self):
+        return self._base_uri or self.transport.get_merchant().api_root
+
+
     @property
     def uri(self):
         return urljoin(self.base_uri, self.key)
 
 
+    def flight_key(self, *parts) -> tuple:
+        """
+        The single-flight key of a request. Requests for different
+        merchants are signed with different credentials, so they are
+        never shared.
+        """
+        return (*self.transport.get_merchant().pool_key, self.uri, *parts)
+
+
     def get(self):
         raise NotImplementedError
 
@@ -254,3 +635,32 @@ class Resource:
 
     def cancel(self):
         raise NotImplementedError
+
+
+
+
+class AsyncResource(Resource):
+
+
+    def __init__(
+        self,
+        api_version,
+        transport_class=AsyncTransport,
+        transport=None,
+        base_uri=None,
+    ):
+        super().__init__(
+            api_version,
+            transport_class=transport_class,
+            transport=transport,
+            base_uri=base_uri,
+        )
+
+
+    async def request(self, method, uri, **kwargs):
+        response = await self.transport.request(
+            method,
+            uri,
+            **kwargs,
+        )
+        return response
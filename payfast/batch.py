@@ -0,0 +1,276 @@
+"""
+Bulk creation of payments, e.g. for monthly invoicing.
+
+``PaymentBatch`` takes payment specs (dictionaries of the arguments for a
+payment class) or a CSV/JSONL file of specs and lazily yields the signed
+payload, the signed redirect URL or the rendered form of every payment, in
+order. The merchant fields are prepared and pre-hashed once (see
+``PaymentTemplate``) and the Django users of each chunk of specs are
+fetched with one query (see ``payfast.users``).
+
+Usage::
+
+    batch = PaymentBatch('invoices.csv', output='url', workers=4)
+    with open('links.txt', 'w') as fp:
+        batch.write(fp)
+
+A spec may have a ``type`` of ``payment`` (the default), ``subscription``,
+``tokenized`` or ``tokenized_sub``. Specs are read and processed in
+windows so the batch is never held in memory as a whole.
+"""
+import os
+import csv
+import json
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+from payfast.signature import PREFIX_FIELDS
+from payfast.users import resolver
+from payfast.merchants import current_merchant
+from payfast.serialization import PayFastJSONEncoder, integer_fields
+from payfast.payment import (
+    Payment,
+    PaymentTemplate,
+    SubscriptionPayment,
+    TokenizedPayment,
+    TokenizedSub,
+)
+
+PAYMENT_CLASSES = {
+    'payment': Payment,
+    'subscription': SubscriptionPayment,
+    'tokenized': TokenizedPayment,
+    'tokenized_sub': TokenizedSub,
+}
+OUTPUTS = ('payload', 'url', 'form')
+CUSTOMER_FIELDS = ('name_first', 'name_last', 'email_address')
+
+
+
+
+def read_specs(path):
+    """
+    Yields the specs in a CSV file (with a header row) or a JSONL file.
+    Blank CSV values are left out and integer fields are converted.
+    """
+    extension = os.path.splitext(str(path))[1].lower()
+    with open(path, newline='') as fp:
+        if extension == '.csv':
+            for row in csv.DictReader(fp):
+                spec = {}
+                for key, value in row.items():
+                    if value == '':
+                        continue
+                    if key in integer_fields:
+                        value = int(value)
+                    spec[key] = value
+                yield spec
+        elif extension in ('.jsonl', '.ndjson'):
+            for line in fp:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            raise ValueError(
+                f'Payment specs must be in a ".csv" or ".jsonl" file, not '
+                f'"{path}".'
+            )
+
+
+
+
+class PaymentBatch:
+
+    def __init__(
+        self,
+        specs,
+        output='payload',
+        payment_type='payment',
+        merchant=None,
+        workers=0,
+        chunksize=100,
+        window=None,
+        **defaults,
+    ):
+        """
+        :param specs: An iterable of dictionaries, or the path to a CSV or
+                      JSONL file.
+        :param output: ``payload``, ``url`` or ``form``.
+        :param payment_type: The default payment type of the specs.
+        :param workers: The number of worker processes. Use 0 to create
+                        the payments in this process.
+        :param chunksize: The number of specs sent to a worker, and whose
+                          users are prefetched, at a time.
+        :param window: The maximum number of chunks in flight. Defaults to
+                       twice the number of workers.
+        :param defaults: Arguments for every payment, e.g. ``notify_url``.
+        """
+        if output not in OUTPUTS:
+            raise ValueError(
+                f'"output" must be one of {", ".join(OUTPUTS)}, not "{output}".'
+            )
+        if payment_type not in PAYMENT_CLASSES:
+            raise ValueError(f'Unknown payment type "{payment_type}".')
+        if isinstance(specs, (str, os.PathLike)):
+            specs = read_specs(specs)
+        self.specs = specs
+        self.output = output
+        self.payment_type = payment_type
+        # Resolved here because the worker processes don't share the
+        # current merchant's context.
+        self.merchant = merchant or current_merchant()
+        self.workers = workers
+        self.chunksize = chunksize
+        self.window = window or max(workers * 2, 1)
+        self.defaults = defaults
+
+
+    @property
+    def config(self) -> tuple:
+        # Everything a worker process needs to build the payments.
+        return (self.output, self.payment_type, self.merchant, self.defaults)
+
+
+    def __iter__(self):
+        if self.workers:
+            return self.iter_parallel()
+        return self.iter_serial()
+
+
+    def iter_serial(self):
+        builder = PaymentBuilder(*self.config)
+        specs = iter(self.specs)
+        while True:
+            chunk = list(islice(specs, self.chunksize))
+            if not chunk:
+                return
+            yield from builder.build_many(chunk)
+
+
+    def iter_parallel(self):
+        """
+        Keeps at most ``window`` chunks in flight and yields the results
+        in order.
+        """
+        specs = iter(self.specs)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = []
+            while True:
+                while len(pending) < self.window:
+                    chunk = list(islice(specs, self.chunksize))
+                    if not chunk:
+                        break
+                    pending.append(executor.submit(build_chunk, self.config, chunk))
+                if not pending:
+                    return
+                yield from pending.pop(0).result()
+
+
+    def write(self, fp):
+        """
+        Write the output to a file object or path as it is produced. Each
+        payload is a line of JSON and each URL or form is followed by a
+        new line. Returns the number of payments written.
+        """
+        if isinstance(fp, (str, os.PathLike)):
+            with open(fp, 'w') as file:
+                return self.write(file)
+        count = 0
+        for item in self:
+            if self.output == 'payload':
+                item = json.dumps(item, cls=PayFastJSONEncoder)
+            fp.write(item)
+            fp.write('\n')
+            count += 1
+        return count
+
+
+
+
+class PaymentBuilder:
+    """
+    Creates the payments of a batch in one process.
+    """
+
+    def __init__(self, output, payment_type, merchant, defaults):
+        self.output = output
+        self.payment_type = payment_type
+        merchant_fields = {
+            field: defaults[field] for field in PREFIX_FIELDS if field in defaults
+        }
+        self.defaults = {
+            key: value for key, value in defaults.items()
+            if key not in merchant_fields
+        }
+        self.template = PaymentTemplate(merchant=merchant, **merchant_fields)
+
+
+    def build(self, spec):
+        spec = {**self.defaults, **spec}
+        payment_type = spec.pop('type', self.payment_type)
+        try:
+            payment_class = PAYMENT_CLASSES[payment_type]
+        except KeyError:
+            raise ValueError(f'Unknown payment type "{payment_type}".')
+        amount = spec.pop('amount')
+        item_name = spec.pop('item_name')
+        payment = self.template.create(payment_class, amount, item_name, **spec)
+        data = payment.data_for_payfast
+        if self.output == 'url':
+            return payment.get_url()
+        if self.output == 'form':
+            return payment.get_form()
+        return data
+
+
+    def get_user_ids(self, specs) -> list:
+        """
+        The IDs of the users that the payments have to be looked up for.
+        """
+        user_ids = []
+        for spec in specs:
+            spec = {**self.defaults, **spec}
+            if spec.get('user', None) is not None or not spec.get('user_id', None):
+                continue
+            if all(spec.get(field, None) for field in CUSTOMER_FIELDS):
+                continue
+            user_ids.append(spec['user_id'])
+        return user_ids
+
+
+    def build_many(self, specs) -> list:
+        with resolver.prefetch(self.get_user_ids(specs)):
+            return [self.build(spec) for spec in specs]
+
+
+
+
+# The builder of the last batch in a worker process, so that the merchant
+# fields and the form template are prepared once per worker.
+_builder = (None, None)
+
+
+
+
+def get_builder(config) -> PaymentBuilder:
+    global _builder
+    key = repr(config)
+    if _builder[0] != key:
+        _builder = (key, PaymentBuilder(*config))
+    return _builder[1]
+
+
+
+
+def build_chunk(config, specs) -> list:
+    return get_builder(config).build_many(specs)
+
+
+
+
+def build_payment_urls(specs, **kwargs):
+    """
+    Yields the signed redirect URL of every payment spec. Accepts the same
+    arguments as ``PaymentBatch``.
+    """
+    return iter(PaymentBatch(specs, output='url', **kwargs))
@@ -0,0 +1,346 @@
+"""
+A circuit breaker for requests to the PayFast API.
+
+The failure rate is tracked per endpoint (see ``payfast.utils.get_endpoint``)
+over a fixed window. When the failure rate reaches ``CIRCUIT_FAILURE_RATE``
+the circuit opens and requests to that endpoint fail fast with
+``PayFastCircuitOpen`` (a ``PayFastTimeout``) instead of waiting for the
+full ``API_TIMEOUT``. After ``CIRCUIT_RESET_TIMEOUT`` seconds one caller
+probes the API with a single ping request that times out after
+``CIRCUIT_PROBE_TIMEOUT`` seconds; the circuit closes if the probe
+succeeds and re-opens otherwise.
+
+The state can be shared between worker processes with ``FileBackend``.
+Point ``CIRCUIT_PATH`` to a file on ``/dev/shm`` to keep it in shared memory.
+Each request updates the backend once, when its result is recorded; the
+breaker decides whether to let a request through from the state that its
+last update returned, so a circuit that another process opened is seen
+after this process's next request.
+
+Exposes the following settings:
+
+.. data:: CIRCUIT_BREAKER
+
+.. data:: CIRCUIT_FAILURE_RATE
+
+.. data:: CIRCUIT_MIN_REQUESTS
+
+.. data:: CIRCUIT_WINDOW
+
+.. data:: CIRCUIT_RESET_TIMEOUT
+
+.. data:: CIRCUIT_PROBE_TIMEOUT
+
+.. data:: CIRCUIT_BACKEND
+
+.. data:: CIRCUIT_PATH
+"""
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from functools import lru_cache
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows.
+    fcntl = None
+
+from payfast.conf import settings
+
+logger = logging.getLogger('payfast.api')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# The breaker's decisions for a request.
+ALLOW = 'allow'
+REJECT = 'reject'
+PROBE = 'probe'
+
+# Endpoints that are never guarded by the breaker. The probe itself
+# calls "ping".
+EXEMPT_ENDPOINTS = frozenset({'ping'})
+
+
+
+
+def new_state(now) -> dict:
+    return {
+        'state': CLOSED,
+        'opened_at': 0.0,
+        'window_start': now,
+        'total': 0,
+        'failures': 0,
+    }
+
+
+
+
+class MemoryBackend:
+    """
+    Keeps the state in this process only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+
+
+    def update(self, key, function) -> dict:
+        """
+        Atomically apply ``function`` to the state of ``key`` and store the
+        state that it returns.
+        """
+        with self._lock:
+            state = self._states.get(key, None)
+            state = function(state)
+            self._states[key] = state
+            return dict(state)
+
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+
+
+
+class FileBackend:
+    """
+    Keeps the state in a JSON file that is shared by all processes on the
+    host. Updates are serialised with an exclusive ``flock``.
+    """
+
+    def __init__(self, path=None):
+        if not path:
+            directory = '/dev/shm'
+            if not os.path.isdir(directory):
+                directory = tempfile.gettempdir()
+            path = os.path.join(directory, 'payfast-circuit.json')
+        self.path = path
+        # flock doesn't serialise threads that share a file descriptor.
+        self._lock = threading.Lock()
+
+
+    def update(self, key, function) -> dict:
+        with self._lock:
+            with open(self.path, 'a+') as fp:
+                if fcntl:
+                    fcntl.flock(fp, fcntl.LOCK_EX)
+                try:
+                    fp.seek(0)
+                    try:
+                        states = json.loads(fp.read() or '{}')
+                    except json.JSONDecodeError:
+                        states = {}
+                    state = function(states.get(key, None))
+                    states[key] = state
+                    fp.seek(0)
+                    fp.truncate()
+                    fp.write(json.dumps(states))
+                    fp.flush()
+                finally:
+                    if fcntl:
+                        fcntl.flock(fp, fcntl.LOCK_UN)
+        return dict(state)
+
+
+    def clear(self):
+        with self._lock:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+
+
+def default_probe() -> bool:
+    """
+    The API is considered available if a ping request gets a successful
+    response; the body of the response is not taken into account. The
+    request is made once, without retries, with a timeout of
+    ``CIRCUIT_PROBE_TIMEOUT`` seconds.
+    """
+    from payfast.base import RequestsTransport
+    from payfast.retry import RetryPolicy
+    from payfast.utils import urljoin
+    from payfast.clients import get_payfast
+    from payfast.exceptions import PayFastTimeout, PayFastException
+
+    payfast = get_payfast()
+    transport = RequestsTransport(
+        payfast.api_version,
+        retry_policy=RetryPolicy(
+            max_attempts=1,
+            deadline=settings.CIRCUIT_PROBE_TIMEOUT,
+        ),
+        merchant=payfast.merchant,
+    )
+    try:
+        transport.request('GET', urljoin([payfast.get_base_uri(), 'ping']))
+    except (PayFastTimeout, PayFastException):
+        return False
+    return True
+
+
+
+
+class CircuitBreaker:
+
+    def __init__(
+        self,
+        backend=None,
+        failure_rate=None,
+        min_requests=None,
+        window=None,
+        reset_timeout=None,
+        probe=default_probe,
+    ):
+        if backend is None:
+            backend = get_backend()
+        if failure_rate is None:
+            failure_rate = settings.CIRCUIT_FAILURE_RATE
+        if min_requests is None:
+            min_requests = settings.CIRCUIT_MIN_REQUESTS
+        if window is None:
+            window = settings.CIRCUIT_WINDOW
+        if reset_timeout is None:
+            reset_timeout = settings.CIRCUIT_RESET_TIMEOUT
+        self.backend = backend
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.probe = probe
+        # The state of each endpoint as of this process's last update.
+        self._states = {}
+
+
+    def update(self, endpoint, function) -> dict:
+        state = self.backend.update(endpoint, function)
+        self._states[endpoint] = state
+        return state
+
+
+    def get_state(self, endpoint) -> dict:
+        now = time.time()
+
+        def read(state):
+            return state or new_state(now)
+        return self.update(endpoint, read)
+
+
+    def before_request(self, endpoint) -> str:
+        """
+        Returns ``ALLOW`` if the request may go ahead, ``REJECT`` if it must
+        fail fast or ``PROBE`` if the caller must probe the API and report
+        the result with ``probe_done``. Only one caller gets ``PROBE``.
+        """
+        if endpoint in EXEMPT_ENDPOINTS:
+            return ALLOW
+        now = time.time()
+        # The backend is only updated when the reset timeout has passed.
+        state = self._states.get(endpoint, None)
+        if state is None or state['state'] == CLOSED:
+            return ALLOW
+        if now - state['opened_at'] < self.reset_timeout:
+            return REJECT
+        decision = [ALLOW]
+
+        def check(state):
+            state = state or new_state(now)
+            if state['state'] == OPEN:
+                if now - state['opened_at'] >= self.reset_timeout:
+                    state['state'] = HALF_OPEN
+                    # Doubles as a lease in case the prober dies.
+                    state['opened_at'] = now
+                    decision[0] = PROBE
+                else:
+                    decision[0] = REJECT
+            elif state['state'] == HALF_OPEN:
+                if now - state['opened_at'] >= self.reset_timeout:
+                    # The previous probe never reported back.
+                    state['opened_at'] = now
+                    decision[0] = PROBE
+                else:
+                    decision[0] = REJECT
+            return state
+        self.update(endpoint, check)
+        return decision[0]
+
+
+    def probe_done(self, endpoint, ok):
+        now = time.time()
+
+        def done(state):
+            if ok:
+                logger.info(f'Closing circuit for PayFast endpoint "{endpoint}".')
+                return new_state(now)
+            state = state or new_state(now)
+            state['state'] = OPEN
+            state['opened_at'] = now
+            return state
+        self.update(endpoint, done)
+
+
+    def record(self, endpoint, success):
+        if endpoint in EXEMPT_ENDPOINTS:
+            return
+        now = time.time()
+
+        def add(state):
+            state = state or new_state(now)
+            if now - state['window_start'] >= self.window:
+                state['window_start'] = now
+                state['total'] = 0
+                state['failures'] = 0
+            state['total'] += 1
+            if not success:
+                state['failures'] += 1
+            if (
+                state['state'] == CLOSED
+                and state['total'] >= self.min_requests
+                and state['failures'] / state['total'] >= self.failure_rate
+            ):
+                logger.warning(
+                    f'Opening circuit for PayFast endpoint "{endpoint}" after '
+                    f'{state["failures"]} failures in {state["total"]} requests.'
+                )
+                state['state'] = OPEN
+                state['opened_at'] = now
+            return state
+        self.update(endpoint, add)
+
+
+    def reset(self):
+        self.backend.clear()
+        self._states.clear()
+
+
+
+
+def get_backend():
+    if settings.CIRCUIT_BACKEND == 'file':
+        return FileBackend(settings.CIRCUIT_PATH)
+    if settings.CIRCUIT_BACKEND == 'memory':
+        return MemoryBackend()
+    raise ValueError(
+        f'"CIRCUIT_BACKEND" must be either "memory" or "file", not '
+        f'"{settings.CIRCUIT_BACKEND}".'
+    )
+
+
+
+
+@lru_cache(maxsize=None)
+def get_breaker() -> CircuitBreaker:
+    """
+    Returns the shared ``CircuitBreaker``, built on first use.
+    """
+    return CircuitBreaker()
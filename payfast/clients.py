@@ -0,0 +1,232 @@
+"""
+A process-wide registry of HTTP connection pools.
+
+Every ``PayFast`` client, and therefore every ``Resource`` and model helper,
+draws its connections from the registry so that TCP and TLS connections are
+reused between API calls. There is one pool per merchant and API root; the
+current merchant (see ``payfast.merchants``) is used by default.
+
+Exposes the following settings:
+
+.. data:: POOL_CONNECTIONS
+
+.. data:: POOL_MAXSIZE
+
+.. data:: POOL_BLOCK
+
+.. data:: POOL_KEEPALIVE
+"""
+import asyncio
+import threading
+from weakref import WeakKeyDictionary
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from payfast.conf import settings
+
+
+
+
+class ClientRegistry:
+
+    def __init__(self):
+        # Re-entrant because building a shared ``PayFast`` client draws a
+        # session from this registry.
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._adapters = {}
+        self._sessions = {}
+        self._clients = {}
+        # httpx clients can't be shared between event loops.
+        self._async_clients = WeakKeyDictionary()
+
+
+    def get_key(self, merchant_id=None, api_root=None) -> tuple:
+        """
+        Defaults to the current merchant; see ``payfast.merchants``.
+        """
+        from payfast.merchants import current_merchant
+
+        if merchant_id is None or api_root is None:
+            merchant = current_merchant()
+            if merchant_id is None:
+                merchant_id = merchant.merchant_id
+            if api_root is None:
+                api_root = merchant.api_root
+        return (str(merchant_id), api_root)
+
+
+    def make_adapter(self) -> HTTPAdapter:
+        return HTTPAdapter(
+            pool_connections=settings.POOL_CONNECTIONS,
+            pool_maxsize=settings.POOL_MAXSIZE,
+            pool_block=settings.POOL_BLOCK,
+        )
+
+
+    def adapter(self, merchant_id=None, api_root=None) -> HTTPAdapter:
+        """
+        Returns the shared ``HTTPAdapter`` (and therefore the shared
+        connection pool) for the merchant.
+        """
+        key = self.get_key(merchant_id, api_root)
+        adapter = self._adapters.get(key)
+        if adapter is not None:
+            return adapter
+        with self._lock:
+            adapter = self._adapters.get(key)
+            if adapter is None:
+                adapter = self.make_adapter()
+                self._adapters[key] = adapter
+        return adapter
+
+
+    def make_session(self, adapter) -> requests.Session:
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not settings.POOL_KEEPALIVE:
+            session.headers['Connection'] = 'close'
+        return session
+
+
+    def session(self, merchant_id=None, api_root=None) -> requests.Session:
+        """
+        Returns the shared ``requests.Session`` for the merchant.
+        """
+        key = self.get_key(merchant_id, api_root)
+        session = self._sessions.get(key)
+        if session is not None:
+            return session
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                adapter = self.adapter(merchant_id, api_root)
+                session = self.make_session(adapter)
+                self._sessions[key] = session
+        return session
+
+
+    def thread_session(self, merchant_id=None, api_root=None) -> requests.Session:
+        """
+        Returns a ``requests.Session`` that belongs to the current thread.
+        All of the thread sessions for a merchant share one connection pool,
+        so the number of connections stays bounded by ``POOL_MAXSIZE``.
+        Under gevent, ``threading.local`` is patched to be greenlet-local.
+        """
+        key = self.get_key(merchant_id, api_root)
+        sessions = getattr(self._local, 'sessions', None)
+        if sessions is None:
+            sessions = {}
+            self._local.sessions = sessions
+        session = sessions.get(key)
+        if session is None:
+            adapter = self.adapter(merchant_id, api_root)
+            session = self.make_session(adapter)
+            sessions[key] = session
+        return session
+
+
+    def make_async_client(self):
+        keepalive = settings.POOL_KEEPALIVE
+        max_connections = settings.POOL_MAXSIZE
+        max_keepalive = settings.POOL_MAXSIZE
+        if not settings.POOL_BLOCK:
+            # Like urllib3, open extra connections when the pool is
+            # exhausted instead of waiting for one to be released.
+            max_connections = None
+        if not keepalive:
+            max_keepalive = 0
+            keepalive = None
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive,
+        )
+        return httpx.AsyncClient(limits=limits, timeout=settings.API_TIMEOUT)
+
+
+    def async_client(self, merchant_id=None, api_root=None):
+        """
+        Returns the shared ``httpx.AsyncClient`` for the merchant on the
+        running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        key = self.get_key(merchant_id, api_root)
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None:
+                client = self.make_async_client()
+                clients[key] = client
+        return client
+
+
+    def payfast(self, merchant_id=None, api_root=None):
+        """
+        Returns a shared ``PayFast`` client. Model helpers use this instead
+        of building a new client (and six resources) on every call.
+        """
+        from payfast import PayFast
+        from payfast.merchants import merchants, current_merchant
+
+        key = self.get_key(merchant_id, api_root)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                if merchant_id is None:
+                    merchant = current_merchant()
+                else:
+                    merchant = merchants.get(merchant_id)
+                client = PayFast(base_uri=key[1], merchant=merchant)
+                self._clients[key] = client
+        return client
+
+
+    def clear(self):
+        """
+        Close and forget all the synchronous pools. Async clients should be
+        closed with ``aclose`` from the event loop they belong to.
+        """
+        with self._lock:
+            adapters = list(self._adapters.values())
+            self._adapters.clear()
+            self._sessions.clear()
+            self._clients.clear()
+            self._local = threading.local()
+        for adapter in adapters:
+            adapter.close()
+
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.pop(loop, {})
+        for client in clients.values():
+            await client.aclose()
+
+
+
+
+registry = ClientRegistry()
+
+
+
+
+def get_session(merchant_id=None, api_root=None) -> requests.Session:
+    return registry.session(merchant_id, api_root)
+
+
+
+
+def get_payfast(merchant_id=None, api_root=None):
+    return registry.payfast(merchant_id, api_root)
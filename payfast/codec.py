@@ -0,0 +1,376 @@
+"""
+Encoding of the metadata in ``custom_str1`` and ``custom_str2``.
+
+PayFast limits custom strings to 255 characters. The ``json`` format is
+readable but uses the full key names; the ``compact`` format packs the
+metadata into bytes and encodes them with URL-safe base64:
+
+- keys are short numeric field IDs;
+- integers are varints, amounts are integer cents, datetimes are integer
+  seconds since the epoch and UUIDs are 16 bytes.
+
+Decoding gives the same types as the ``json`` format: datetimes, dates
+and decimals are read as the strings that JSON would have, and then the
+same fields are converted (e.g. ``run_date`` to a datetime and
+``recurring_amount`` to a decimal). The differences are that ``None``
+values are left out of compact metadata, and that dates, which JSON
+can't encode, are packed and read as ISO strings.
+
+Compact values start with ``~`` and a version number so the format can
+change later. Decoding detects the format, so metadata that was sent in
+either format (e.g. before the setting changed) can be read.
+
+Exposes the following settings:
+
+.. data:: METADATA_FORMAT
+"""
+import re
+import json
+import base64
+import struct
+from decimal import Decimal
+from datetime import date, datetime, timedelta
+
+from payfast.conf import settings
+from payfast.serialization import PayFastJSONEncoder, decoder
+
+VERSION = 1
+MARKER = '~'
+PREFIX = f'{MARKER}{VERSION}'
+
+# Never change or reuse an ID; add new fields at the end or bump the
+# version.
+FIELD_IDS = {
+    'user_id': 1,
+    'plan_id': 2,
+    'trial': 3,
+    'run_date': 4,
+    'recurring_amount': 5,
+    'is_tokenized': 6,
+    'amount': 7,
+    'token': 8,
+    'item_name': 9,
+    'upgrade_to_id': 10,
+    'cancel': 11,
+    'account_id': 12,
+    'subscription_token': 13,
+    'is_upgrade': 14,
+}
+FIELD_NAMES = {field_id: field for field, field_id in FIELD_IDS.items()}
+# Followed by the length and the name of a field without an ID.
+NAMED_FIELD = 0
+
+# Value types
+NONE = 0
+FALSE = 1
+TRUE = 2
+INTEGER = 3
+STRING = 4
+CENTS = 5
+DECIMAL = 6
+DATETIME = 7
+DATE = 8
+UUID_BYTES = 9
+LIST = 10
+FLOAT = 11
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_DATE = EPOCH.date()
+
+
+
+
+def write_varint(buffer, value):
+    while value > 0x7f:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+
+
+def read_varint(data, position) -> tuple:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+
+
+
+
+def zigzag(value) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+
+
+def unzigzag(value) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+
+
+def write_bytes(buffer, value):
+    write_varint(buffer, len(value))
+    buffer += value
+
+
+
+
+# Only the canonical form, so that the decoded string is the same.
+is_uuid = re.compile(
+    r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\Z'
+).match
+
+
+
+
+def write_value(buffer, value):
+    if value is None:
+        buffer.append(NONE)
+    elif value is True:
+        buffer.append(TRUE)
+    elif value is False:
+        buffer.append(FALSE)
+    elif isinstance(value, int):
+        buffer.append(INTEGER)
+        write_varint(buffer, zigzag(value))
+    elif isinstance(value, float):
+        buffer.append(FLOAT)
+        buffer += struct.pack('>d', value)
+    elif isinstance(value, Decimal):
+        sign, digits, exponent = value.as_tuple()
+        # Only amounts with two decimal places, so that the decoded string
+        # is the same.
+        if exponent == -2:
+            cents = int(''.join(map(str, digits)))
+            buffer.append(CENTS)
+            write_varint(buffer, zigzag(-cents if sign else cents))
+        else:
+            buffer.append(DECIMAL)
+            write_bytes(buffer, str(value).encode())
+    elif isinstance(value, datetime):
+        # Like the JSON format, the time zone and microseconds are dropped.
+        buffer.append(DATETIME)
+        seconds = (value.replace(tzinfo=None, microsecond=0) - EPOCH) // timedelta(seconds=1)
+        write_varint(buffer, zigzag(seconds))
+    elif isinstance(value, date):
+        buffer.append(DATE)
+        write_varint(buffer, zigzag((value - EPOCH_DATE).days))
+    elif isinstance(value, str):
+        if is_uuid(value):
+            buffer.append(UUID_BYTES)
+            buffer += bytes.fromhex(value.replace('-', ''))
+        else:
+            buffer.append(STRING)
+            write_bytes(buffer, value.encode())
+    elif isinstance(value, (list, tuple)):
+        buffer.append(LIST)
+        write_varint(buffer, len(value))
+        for item in value:
+            write_value(buffer, item)
+    else:
+        raise TypeError(
+            f'Object of type {type(value).__name__} cannot be packed into '
+            f'PayFast metadata.'
+        )
+
+
+
+
+def read_bytes(data, position) -> tuple:
+    length, position = read_varint(data, position)
+    end = position + length
+    if end > len(data):
+        raise ValueError('Truncated PayFast metadata.')
+    return data[position:end], end
+
+
+
+
+def read_integer(data, position):
+    value, position = read_varint(data, position)
+    return unzigzag(value), position
+
+
+
+
+def read_string(data, position):
+    value, position = read_bytes(data, position)
+    return value.decode(), position
+
+
+
+
+def read_cents(data, position):
+    value, position = read_integer(data, position)
+    return str(Decimal(f'{value}e-2')), position
+
+
+
+
+def read_datetime(data, position):
+    value, position = read_integer(data, position)
+    return (EPOCH + timedelta(seconds=value)).isoformat(), position
+
+
+
+
+def read_date(data, position):
+    value, position = read_integer(data, position)
+    return (EPOCH_DATE + timedelta(days=value)).isoformat(), position
+
+
+
+
+def read_float(data, position):
+    end = position + 8
+    if end > len(data):
+        raise ValueError('Truncated PayFast metadata.')
+    return struct.unpack('>d', data[position:end])[0], end
+
+
+
+
+def read_uuid(data, position):
+    end = position + 16
+    if end > len(data):
+        raise ValueError('Truncated PayFast metadata.')
+    value = data[position:end].hex()
+    return (
+        f'{value[:8]}-{value[8:12]}-{value[12:16]}-{value[16:20]}-{value[20:]}'
+    ), end
+
+
+
+
+def read_list(data, position):
+    length, position = read_varint(data, position)
+    items = []
+    for _ in range(length):
+        item, position = read_value(data, position)
+        items.append(item)
+    return items, position
+
+
+
+
+# Indexed by the value type.
+READERS = (
+    lambda data, position: (None, position),
+    lambda data, position: (False, position),
+    lambda data, position: (True, position),
+    read_integer,
+    read_string,
+    read_cents,
+    # Decimals are read as strings, like JSON.
+    read_string,
+    read_datetime,
+    read_date,
+    read_uuid,
+    read_list,
+    read_float,
+)
+
+
+
+
+def read_value(data, position) -> tuple:
+    value_type = data[position]
+    if value_type >= len(READERS):
+        raise ValueError(f'Unknown PayFast metadata value type {value_type}.')
+    return READERS[value_type](data, position + 1)
+
+
+
+
+def pack(metadata: dict) -> str:
+    """
+    Encode the metadata in the compact format. ``None`` values are left
+    out.
+    """
+    buffer = bytearray()
+    for key, value in metadata.items():
+        if value is None:
+            continue
+        field_id = FIELD_IDS.get(key, None)
+        if field_id is None:
+            buffer.append(NAMED_FIELD)
+            write_bytes(buffer, key.encode())
+        else:
+            buffer.append(field_id)
+        write_value(buffer, value)
+    return PREFIX + base64.urlsafe_b64encode(bytes(buffer)).rstrip(b'=').decode()
+
+
+
+
+def unpack(value: str) -> dict:
+    if not value.startswith(PREFIX):
+        raise ValueError(
+            f'Unsupported PayFast metadata version "{value[1:2]}".'
+        )
+    body = value[len(PREFIX):]
+    try:
+        data = base64.b64decode(
+            body + '=' * (-len(body) % 4), altchars=b'-_', validate=True,
+        )
+    except ValueError as exc:
+        raise ValueError(f'Invalid PayFast metadata: {exc}') from None
+    metadata = {}
+    position = 0
+    try:
+        while position < len(data):
+            field_id = data[position]
+            position += 1
+            if field_id == NAMED_FIELD:
+                key, position = read_string(data, position)
+            else:
+                key = FIELD_NAMES.get(field_id, None)
+                if key is None:
+                    raise ValueError(f'Unknown PayFast metadata field {field_id}.')
+            metadata[key], position = read_value(data, position)
+    except IndexError:
+        raise ValueError('Truncated PayFast metadata.') from None
+    # The same fields as the JSON format are converted.
+    return decoder(metadata)
+
+
+
+
+def dumps(metadata: dict, format=None) -> str:
+    """
+    :param format: ``json`` or ``compact``. Defaults to
+                   ``METADATA_FORMAT``.
+    """
+    if format is None:
+        format = settings.METADATA_FORMAT
+    if format == 'compact':
+        return pack(metadata)
+    if format == 'json':
+        return json.dumps(metadata, cls=PayFastJSONEncoder)
+    raise ValueError(
+        f'"METADATA_FORMAT" must be "json" or "compact", not "{format}".'
+    )
+
+
+
+
+def loads(value: str) -> dict:
+    """
+    Decode metadata in either format. Raises ``ValueError`` if it is not
+    valid metadata.
+    """
+    if not isinstance(value, str):
+        raise TypeError(f'Expected a string, not {type(value).__name__}.')
+    if value.startswith(MARKER):
+        return unpack(value)
+    metadata = json.loads(value, object_hook=decoder)
+    if not isinstance(metadata, dict):
+        raise ValueError('PayFast metadata must be a JSON object.')
+    return metadata
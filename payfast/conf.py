@@ -22,15 +22,15 @@ Exposes the following settings:
 .. data:: PAYFAST_NETWORKS
 
 .. data:: PAYFAST_IP_LIST
+
+.. data:: ALLOWLIST_PATH
+
+.. data:: TRUSTED_PROXIES
 """
 import sys
 from importlib import import_module
 from importlib.util import find_spec as importlib_find
 
-from ipaddress import ip_network, ip_address
-
-from decouple import config
-
 
 
 
@@ -68,41 +68,147 @@ def import_string(dotted_path):
 
 
 
-class Settings:
+class setting:
+    """
+    A ``Settings`` attribute that is resolved on first access and then
+    stored on the class, so the environment is read (and callbacks are
+    imported) only when a setting is actually used. Assigning to the
+    attribute overrides it as before.
+    """
+
+    def __init__(self, function):
+        self.function = function
+
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+
+    def __get__(self, instance, owner):
+        value = self.function(owner)
+        setattr(owner, self.name, value)
+        return value
+
+
+
+
+def env(name, **kwargs) -> setting:
+    """
+    A setting that is read with ``decouple.config`` on first access.
+    """
+    def resolve(cls):
+        from decouple import config
+        return config(name, **kwargs)
+    return setting(resolve)
+
+
+
+
+def callback(name) -> setting:
+    """
+    A setting that holds the dotted path to a callable which is imported
+    on first access.
+    """
+    attr = name.lower().replace('payfast_', '', 1)
+
+    def resolve(cls):
+        from decouple import config
+        function = config(name, default=None)
+        if function:
+            function = import_string(function)
+            if not callable(function):
+                raise ValueError(f'"{attr}" must be a callable')
+        return function
+    return setting(resolve)
+
+
+
+
+def optional_int(value):
+    if value == '':
+        return None
+    return int(value)
+
 
-    DEBUG = config('PAYFAST_DEBUG', cast=bool, default=True)
-    USE_PAYFAST_SANDBOX = DEBUG
+
+
+class SettingsType(type):
+    """
+    Counts the changes to the settings in ``version`` so that objects that
+    are built from them (e.g. the merchant from the settings) know when
+    they must be built again.
+    """
+
+    version = 0
+
+
+    def __setattr__(cls, name, value):
+        super().__setattr__(name, value)
+        type.__setattr__(cls, 'version', cls.version + 1)
+
+
+    def __delattr__(cls, name):
+        super().__delattr__(name)
+        type.__setattr__(cls, 'version', cls.version + 1)
+
+
+
+
+class Settings(metaclass=SettingsType):
+
+    DEBUG = env('PAYFAST_DEBUG', cast=bool, default=True)
+
+    @setting
+    def USE_PAYFAST_SANDBOX(cls):
+        return cls.DEBUG
 
     DEFAULT_MERCHANT_ID = 10030202
     DEFAULT_MERCHANT_KEY = '4fkhqhutgnkhj'
     DEFAULT_SALT_PASSPHRASE = 'testing12345'
 
-    PAYFAST_HOST = None
-    PROCESS_URL = None
-    if USE_PAYFAST_SANDBOX:
-        PAYFAST_HOST = 'sandbox.payfast.co.za'
-    else:
-        PAYFAST_HOST = 'www.payfast.co.za'
+    @setting
+    def PAYFAST_HOST(cls):
+        if cls.USE_PAYFAST_SANDBOX:
+            return 'sandbox.payfast.co.za'
+        return 'www.payfast.co.za'
+
     API_ROOT = 'https://api.payfast.co.za'
 
     # Might only be set in Django, add defaults
-    MERCHANT_ID = config('PAYFAST_MERCHANT_ID', default=DEFAULT_MERCHANT_ID, cast=int)
-    MERCHANT_KEY = config('PAYFAST_MERCHANT_KEY', default=DEFAULT_MERCHANT_KEY)
-    SALT_PASSPHRASE = config('PAYFAST_SALT_PASSPHRASE', default=DEFAULT_SALT_PASSPHRASE)
-
-    if len(SALT_PASSPHRASE) > 32:
-        raise ValueError(
-            'Your PayFast "SALT_PASSPHRASE" setting must be no longer than '
-            '32 characters'
-        )
-
-    if DEBUG:
-        MERCHANT_ID = DEFAULT_MERCHANT_ID
-        MERCHANT_KEY = DEFAULT_MERCHANT_KEY
-        SALT_PASSPHRASE = DEFAULT_SALT_PASSPHRASE
-
-    PROCESS_URL = f'https://{PAYFAST_HOST}/eng/process'
-    VALIDATE_URL = f'https://{PAYFAST_HOST}/eng/query/validate'
+    @setting
+    def MERCHANT_ID(cls):
+        if cls.DEBUG:
+            return cls.DEFAULT_MERCHANT_ID
+        from decouple import config
+        return config('PAYFAST_MERCHANT_ID', default=cls.DEFAULT_MERCHANT_ID, cast=int)
+
+    @setting
+    def MERCHANT_KEY(cls):
+        if cls.DEBUG:
+            return cls.DEFAULT_MERCHANT_KEY
+        from decouple import config
+        return config('PAYFAST_MERCHANT_KEY', default=cls.DEFAULT_MERCHANT_KEY)
+
+    @setting
+    def SALT_PASSPHRASE(cls):
+        from decouple import config
+        passphrase = config('PAYFAST_SALT_PASSPHRASE', default=cls.DEFAULT_SALT_PASSPHRASE)
+        if len(passphrase) > 32:
+            raise ValueError(
+                'Your PayFast "SALT_PASSPHRASE" setting must be no longer than '
+                '32 characters'
+            )
+        if cls.DEBUG:
+            passphrase = cls.DEFAULT_SALT_PASSPHRASE
+        return passphrase
+
+    @setting
+    def PROCESS_URL(cls):
+        return f'https://{cls.PAYFAST_HOST}/eng/process'
+
+    @setting
+    def VALIDATE_URL(cls):
+        return f'https://{cls.PAYFAST_HOST}/eng/query/validate'
 
     PAYFAST_NETWORKS_DEFAULT = [
         '197.97.145.144/28',
@@ -111,35 +217,139 @@ class Settings:
     PAYFAST_IP_LIST_DEFAULT = [
         '144.126.193.139',
     ]
-    PAYFAST_NETWORKS = PAYFAST_NETWORKS_DEFAULT
-    PAYFAST_IP_LIST = PAYFAST_IP_LIST_DEFAULT
-
-    payfast_networks = set()
-    for network in PAYFAST_NETWORKS:
-        try:
-            network_obj = ip_network(network)
-            payfast_networks.add(network_obj)
-        except ValueError:
-            raise
-
-    payfast_ip_list = set()
-    for ip in PAYFAST_IP_LIST:
-        try:
-            ip_obj = ip_address(ip)
-            payfast_ip_list.add(ip_obj)
-        except ValueError:
-            raise
-
-    PAYFAST_NETWORKS = list(payfast_networks)
-    PAYFAST_IP_LIST = list(payfast_ip_list)
-
-    PAYFAST_UPDATE_BUG = config('PAYFAST_UPDATE_BUG', cast=bool, default=True)
-
-    API_TIMEOUT = config('PAYFAST_API_TIMEOUT', cast=int, default=30)
 
-    RETURN_URL = config('PAYFAST_RETURN_URL', default='')
-    CANCEL_URL = config('PAYFAST_CANCEL_URL', default='')
-    NOTIFY_URL = config('PAYFAST_NOTIFY_URL', default='')
+    @setting
+    def PAYFAST_NETWORKS(cls):
+        from ipaddress import ip_network
+        return list({ip_network(network) for network in cls.PAYFAST_NETWORKS_DEFAULT})
+
+    @setting
+    def PAYFAST_IP_LIST(cls):
+        from ipaddress import ip_address
+        return list({ip_address(ip) for ip in cls.PAYFAST_IP_LIST_DEFAULT})
+
+    # Load the allowlist from a file or a callable instead of the lists
+    # above. See ``payfast.allowlist``.
+    ALLOWLIST_PATH = env('PAYFAST_ALLOWLIST_PATH', default='')
+    ALLOWLIST_CACHE_SIZE = env('PAYFAST_ALLOWLIST_CACHE_SIZE', cast=int, default=1024)
+    allowlist_callback = callback('PAYFAST_ALLOWLIST_CALLBACK')
+
+    # The number of reverse proxies in front of the ITN endpoint. The
+    # client address is taken that many hops from the right of
+    # "X-Forwarded-For". Leave blank to use the leftmost address.
+    TRUSTED_PROXIES = env('PAYFAST_TRUSTED_PROXIES', cast=optional_int, default='')
+
+    PAYFAST_UPDATE_BUG = env('PAYFAST_UPDATE_BUG', cast=bool, default=True)
+
+    API_TIMEOUT = env('PAYFAST_API_TIMEOUT', cast=int, default=30)
+
+    # Connection pool shared by all API clients for the same merchant and
+    # API root. See ``payfast.clients``.
+    POOL_CONNECTIONS = env('PAYFAST_POOL_CONNECTIONS', cast=int, default=10)
+    POOL_MAXSIZE = env('PAYFAST_POOL_MAXSIZE', cast=int, default=10)
+    POOL_BLOCK = env('PAYFAST_POOL_BLOCK', cast=bool, default=False)
+    # Seconds that an idle connection is kept alive. Set to 0 to disable
+    # keep-alive altogether.
+    POOL_KEEPALIVE = env('PAYFAST_POOL_KEEPALIVE', cast=float, default=5.0)
+
+    # Retries for idempotent API requests. See ``payfast.retry``.
+    RETRY_MAX_ATTEMPTS = env('PAYFAST_RETRY_MAX_ATTEMPTS', cast=int, default=3)
+    RETRY_BACKOFF = env('PAYFAST_RETRY_BACKOFF', cast=float, default=0.5)
+    RETRY_BACKOFF_MAX = env('PAYFAST_RETRY_BACKOFF_MAX', cast=float, default=8.0)
+    # Total time budget, in seconds, for a request including all retries.
+    RETRY_DEADLINE = env('PAYFAST_RETRY_DEADLINE', cast=float, default=60.0)
+
+    # Circuit breaker for the API. See ``payfast.circuit``.
+    CIRCUIT_BREAKER = env('PAYFAST_CIRCUIT_BREAKER', cast=bool, default=True)
+    CIRCUIT_FAILURE_RATE = env('PAYFAST_CIRCUIT_FAILURE_RATE', cast=float, default=0.5)
+    CIRCUIT_MIN_REQUESTS = env('PAYFAST_CIRCUIT_MIN_REQUESTS', cast=int, default=5)
+    CIRCUIT_WINDOW = env('PAYFAST_CIRCUIT_WINDOW', cast=float, default=60.0)
+    CIRCUIT_RESET_TIMEOUT = env('PAYFAST_CIRCUIT_RESET_TIMEOUT', cast=float, default=30.0)
+    # Timeout, in seconds, of the probe; it is never retried.
+    CIRCUIT_PROBE_TIMEOUT = env('PAYFAST_CIRCUIT_PROBE_TIMEOUT', cast=float, default=3.0)
+    # Either "memory" or "file". Use the file backend to share the state
+    # between worker processes.
+    CIRCUIT_BACKEND = env('PAYFAST_CIRCUIT_BACKEND', default='memory')
+    CIRCUIT_PATH = env('PAYFAST_CIRCUIT_PATH', default='')
+
+    # Outbound rate limit for the API. See ``payfast.ratelimit``.
+    # Requests per second per endpoint; 0 disables the rate limiter.
+    RATE_LIMIT = env('PAYFAST_RATE_LIMIT', cast=float, default=0)
+    RATE_LIMIT_BURST = env('PAYFAST_RATE_LIMIT_BURST', cast=int, default=0)
+    # Per-endpoint overrides, e.g. "subscriptions/adhoc=2,subscriptions/update=5"
+    RATE_LIMITS = env('PAYFAST_RATE_LIMITS', default='')
+    RATE_LIMIT_BLOCKING = env('PAYFAST_RATE_LIMIT_BLOCKING', cast=bool, default=True)
+    # Maximum number of seconds to wait for a token when blocking; 0 means
+    # wait as long as it takes.
+    RATE_LIMIT_TIMEOUT = env('PAYFAST_RATE_LIMIT_TIMEOUT', cast=float, default=0)
+    # Either "memory" or "sqlite". Use the SQLite backend to share the
+    # buckets between worker processes.
+    RATE_LIMIT_BACKEND = env('PAYFAST_RATE_LIMIT_BACKEND', default='memory')
+    RATE_LIMIT_PATH = env('PAYFAST_RATE_LIMIT_PATH', default='')
+
+    # How payments are validated: "full" (pydantic), "compiled" or "off".
+    # See ``payfast.validation``.
+    VALIDATION = env('PAYFAST_VALIDATION', default='full')
+
+    # Keep compiled form templates on disk; see ``payfast.templates``.
+    TEMPLATE_CACHE_DIR = env('PAYFAST_TEMPLATE_CACHE_DIR', default='')
+    # Either "template" (Jinja) or "string", which renders the same form
+    # markup without Jinja.
+    FORM_RENDERER = env('PAYFAST_FORM_RENDERER', default='template')
+
+    # Either "sync" (process ITNs before responding) or "queue" (check the
+    # signature and IP address, queue the ITN and respond). See
+    # ``payfast.queue``.
+    ITN_MODE = env('PAYFAST_ITN_MODE', default='sync')
+    # Either "sqlite", "memory" or the dotted path to a backend class.
+    ITN_QUEUE_BACKEND = env('PAYFAST_ITN_QUEUE_BACKEND', default='sqlite')
+    ITN_QUEUE_PATH = env('PAYFAST_ITN_QUEUE_PATH', default='')
+    # ITNs are rejected (and PayFast retries them later) when the queue is
+    # this deep.
+    ITN_QUEUE_MAX_DEPTH = env('PAYFAST_ITN_QUEUE_MAX_DEPTH', cast=int, default=10000)
+    ITN_QUEUE_WORKERS = env('PAYFAST_ITN_QUEUE_WORKERS', cast=int, default=2)
+    ITN_QUEUE_MAX_ATTEMPTS = env('PAYFAST_ITN_QUEUE_MAX_ATTEMPTS', cast=int, default=5)
+    # Seconds before an ITN that a worker took is given to another worker,
+    # e.g. when the worker's process died.
+    ITN_QUEUE_LEASE = env('PAYFAST_ITN_QUEUE_LEASE', cast=int, default=300)
+
+    # The request to "VALIDATE_URL" for ITN security check 4. See
+    # ``payfast.security_checks.ValidateClient``.
+    VALIDATE_CONNECT_TIMEOUT = env('PAYFAST_VALIDATE_CONNECT_TIMEOUT', cast=float, default=3.05)
+    VALIDATE_READ_TIMEOUT = env('PAYFAST_VALIDATE_READ_TIMEOUT', cast=float, default=10.0)
+    VALIDATE_RETRIES = env('PAYFAST_VALIDATE_RETRIES', cast=int, default=2)
+    # Seconds that "VALID" results are cached; 0 disables the cache.
+    VALIDATE_CACHE_TTL = env('PAYFAST_VALIDATE_CACHE_TTL', cast=float, default=0)
+
+    # Run the ITN checks that wait on PayFast or the database at the same
+    # time, in a pool of ITN_THREADS threads, with a deadline of
+    # ITN_DEADLINE seconds per ITN. See ``ITN.do_concurrent_checks``.
+    ITN_CONCURRENT = env('PAYFAST_ITN_CONCURRENT', cast=bool, default=False)
+    ITN_THREADS = env('PAYFAST_ITN_THREADS', cast=int, default=8)
+    ITN_DEADLINE = env('PAYFAST_ITN_DEADLINE', cast=float, default=20.0)
+
+    # Where processed ITNs are remembered so that PayFast's retries are not
+    # processed again: "memory", "sqlite", "django" (the Django cache),
+    # "off" or the dotted path to a backend class. See
+    # ``payfast.idempotency``.
+    IDEMPOTENCY_BACKEND = env('PAYFAST_IDEMPOTENCY_BACKEND', default='memory')
+    # Three days, which covers PayFast's retries.
+    IDEMPOTENCY_TIMEOUT = env('PAYFAST_IDEMPOTENCY_TIMEOUT', cast=int, default=259200)
+    IDEMPOTENCY_CACHE_SIZE = env('PAYFAST_IDEMPOTENCY_CACHE_SIZE', cast=int, default=10000)
+    IDEMPOTENCY_PATH = env('PAYFAST_IDEMPOTENCY_PATH', default='')
+
+    # How the metadata in "custom_str1" and "custom_str2" is encoded: "json"
+    # or "compact". See ``payfast.codec``.
+    METADATA_FORMAT = env('PAYFAST_METADATA_FORMAT', default='json')
+
+    # Cache the contact fields of Django users for payments; 0 disables the
+    # cache. See ``payfast.users``.
+    USER_CACHE_SIZE = env('PAYFAST_USER_CACHE_SIZE', cast=int, default=0)
+    USER_CACHE_TIMEOUT = env('PAYFAST_USER_CACHE_TIMEOUT', cast=int, default=300)
+
+    RETURN_URL = env('PAYFAST_RETURN_URL', default='')
+    CANCEL_URL = env('PAYFAST_CANCEL_URL', default='')
+    NOTIFY_URL = env('PAYFAST_NOTIFY_URL', default='')
 
     """
     # Follow Django convention with regard to the cache timeout
@@ -152,36 +362,44 @@ class Settings:
         # Expire the keys immediately.
         pass
     """
-    CACHE_TIMEOUT = config('PAYFAST_CACHE_TIMEOUT', cast=int, default=300)
-    CACHE_KEY_PREFIX = config('PAYFAST_CACHE_KEY_PREFIX', default='payfast')
-
-    GRACE_PERIOD_DAYS = config('PAYFAST_GRACE_PERIOD_DAYS', cast=int, default=7)
-    if GRACE_PERIOD_DAYS < 6:
-        raise ValueError('"GRACE_PERIOD_DAYS" must be an integer bigger than 5.')
-
-    expected_amount_callback = config('PAYFAST_EXPECTED_AMOUNT_CALLBACK', default=None)
-    if expected_amount_callback:
-        expected_amount_callback = import_string(expected_amount_callback)
-        if not callable(expected_amount_callback):
-            raise ValueError('"expected_amount_callback" must be a callable')
-
-    payment_done_callback = config('PAYFAST_PAYMENT_DONE_CALLBACK', default=None)
-    if payment_done_callback:
-        payment_done_callback = import_string(payment_done_callback)
-        if not callable(payment_done_callback):
-            raise ValueError('"payment_done_callback" must be a callable')
-
-    payment_start_callback = config('PAYFAST_PAYMENT_START_CALLBACK', default=None)
-    if payment_start_callback:
-        payment_start_callback = import_string(payment_start_callback)
-        if not callable(payment_start_callback):
-            raise ValueError('"payment_start_callback" must be a callable')
-
-    subscription_update_callback = config('PAYFAST_SUBSCRIPTION_UPDATE_CALLBACK', default=None)
-    if subscription_update_callback:
-        subscription_update_callback = import_string(subscription_update_callback)
-        if not callable(subscription_update_callback):
-            raise ValueError('"subscription_update_callback" must be a callable')
+    CACHE_TIMEOUT = env('PAYFAST_CACHE_TIMEOUT', cast=int, default=300)
+    CACHE_KEY_PREFIX = env('PAYFAST_CACHE_KEY_PREFIX', default='payfast')
+
+    @setting
+    def GRACE_PERIOD_DAYS(cls):
+        from decouple import config
+        days = config('PAYFAST_GRACE_PERIOD_DAYS', cast=int, default=7)
+        if days < 6:
+            raise ValueError('"GRACE_PERIOD_DAYS" must be an integer bigger than 5.')
+        return days
+
+    expected_amount_callback = callback('PAYFAST_EXPECTED_AMOUNT_CALLBACK')
+    payment_done_callback = callback('PAYFAST_PAYMENT_DONE_CALLBACK')
+    payment_start_callback = callback('PAYFAST_PAYMENT_START_CALLBACK')
+    subscription_update_callback = callback('PAYFAST_SUBSCRIPTION_UPDATE_CALLBACK')
+
+    # The settings that raise ``ValueError`` for invalid values. See
+    # ``check``.
+    CHECKED_SETTINGS = (
+        'SALT_PASSPHRASE',
+        'GRACE_PERIOD_DAYS',
+        'expected_amount_callback',
+        'payment_done_callback',
+        'payment_start_callback',
+        'subscription_update_callback',
+        'allowlist_callback',
+    )
+
+
+    @classmethod
+    def check(cls):
+        """
+        Resolve the settings that are validated so that invalid values fail
+        at startup instead of on first use. Called when the Django app is
+        ready; call it when the app starts otherwise.
+        """
+        for name in cls.CHECKED_SETTINGS:
+            getattr(cls, name)
 
 
     @classmethod
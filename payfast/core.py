@@ -0,0 +1,203 @@
+"""
+The ``PayFast`` and ``AsyncPayFast`` API clients.
+"""
+import os
+from functools import partial
+from typing import Union
+from datetime import datetime, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from payfast.conf import settings
+from payfast.payment import (
+    Payment,
+    SubscriptionPayment,
+    TokenizedPayment,
+    TokenizedSub,
+)
+from payfast.base import (
+    RequestsTransport,
+    ThreadLocalTransport,
+    AsyncTransport,
+)
+from payfast.logging import configure_logging
+from payfast.exceptions import PayFastException
+from payfast.api.subscriptions import (
+    Subscriptions,
+    Cards,
+    AsyncSubscriptions,
+    AsyncCards,
+)
+from payfast.api.transactions import (
+    Transactions,
+    CCTransactions,
+    AsyncTransactions,
+    AsyncCCTransactions,
+)
+from payfast.api.refunds import Refunds, AsyncRefunds
+
+
+
+
+class PayFast:
+
+    TRANSPORT_CLASS = ThreadLocalTransport
+
+
+    def __init__(
+        self,
+        base_uri=None,
+        version='v1',
+        merchant=None,
+    ):
+        """
+        :param base_uri: Defaults to the ``api_root`` of the merchant.
+        :param merchant: A ``payfast.merchants.Merchant`` to use for all
+                         requests and payments. Defaults to the current
+                         merchant at the time of each call.
+        """
+        configure_logging()
+        self.base_uri = base_uri
+        self.api_version = version
+        self.merchant = merchant
+        # All of the resources share one transport which draws its
+        # connections from the shared pool in ``payfast.clients``.
+        self.transport = self.TRANSPORT_CLASS(version, merchant=merchant)
+        args = [version]
+        kwargs = {'transport': self.transport, 'base_uri': base_uri}
+
+        self.subscriptions = Subscriptions(*args, **kwargs)
+        self.subs = Subscriptions(*args, **kwargs) # alias
+        self.cards = Cards(*args, **kwargs)
+
+        self.transactions = Transactions(*args, **kwargs)
+        self.cc_transactions = CCTransactions(*args, **kwargs)
+
+        self.refunds = Refunds(*args, **kwargs)
+        self.refund = self.refunds.create # alias
+
+        self._set_payment_classes()
+
+
+    def _set_payment_classes(self):
+        payment_classes = {
+            'payment': Payment,
+            'subscription': SubscriptionPayment,
+            'sub': SubscriptionPayment, # alias
+            'tokenized_sub': TokenizedSub,
+            'tsub': TokenizedSub, # alias
+            'tokenized': TokenizedPayment,
+        }
+        for name, payment_class in payment_classes.items():
+            if self.merchant:
+                payment_class = partial(payment_class, merchant=self.merchant)
+            setattr(self, name, payment_class)
+
+
+    def get_base_uri(self) -> str:
+        return self.base_uri or self.transport.get_merchant().api_root
+
+
+    def ping(self):
+        from payfast.utils import urljoin
+        uri = urljoin([self.get_base_uri(), 'ping'])
+        response = self.transport.request('GET', uri)
+        return self._is_pong(response)
+
+
+    def _is_pong(self, response) -> bool:
+        expected = 'PayFast API'
+        if settings.DEBUG:
+            expected = 'API V1'
+        # The ping endpoint responds with a plain (JSON) string.
+        if response.text and response.text in expected:
+            return True
+        return False
+
+
+    def trial(
+        self,
+        amount,
+        item_name,
+        is_tokenized=False,
+        **kwargs
+    ):
+        zero_amount = 0
+        payment = None
+        kwargs['recurring_amount'] = amount
+        sub = self.sub
+        if is_tokenized:
+            sub = self.tsub
+        payment = sub(
+            zero_amount,
+            item_name,
+            **kwargs,
+        )
+        return payment
+
+
+
+
+class AsyncPayFast(PayFast):
+    """
+    Mirrors ``PayFast`` but the API methods are coroutines. All of the
+    resources share one ``AsyncTransport`` which uses the pooled client
+    from ``payfast.clients`` so that many requests can be in flight on a
+    single event loop.
+
+    Usage::
+
+        async with AsyncPayFast() as payfast:
+            sub = await payfast.subscriptions.get(token)
+    """
+
+    TRANSPORT_CLASS = AsyncTransport
+
+
+    def __init__(
+        self,
+        base_uri=None,
+        version='v1',
+        transport=None,
+        merchant=None,
+    ):
+        configure_logging()
+        self.base_uri = base_uri
+        self.api_version = version
+        self.merchant = merchant
+        if transport is None:
+            transport = self.TRANSPORT_CLASS(version, merchant=merchant)
+        self.transport = transport
+        args = [version]
+        kwargs = {'transport': transport, 'base_uri': base_uri}
+
+        self.subscriptions = AsyncSubscriptions(*args, **kwargs)
+        self.subs = self.subscriptions # alias
+        self.cards = AsyncCards(*args, **kwargs)
+
+        self.transactions = AsyncTransactions(*args, **kwargs)
+        self.cc_transactions = AsyncCCTransactions(*args, **kwargs)
+
+        self.refunds = AsyncRefunds(*args, **kwargs)
+        self.refund = self.refunds.create # alias
+
+        self._set_payment_classes()
+
+
+    async def ping(self):
+        from payfast.utils import urljoin
+        uri = urljoin([self.get_base_uri(), 'ping'])
+        response = await self.transport.request('GET', uri)
+        return self._is_pong(response)
+
+
+    async def close(self):
+        await self.transport.close()
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *args):
+        await self.close()
@@ -2,6 +2,7 @@ import time
 import json
 import hashlib
 import logging
+import inspect
 from functools import wraps
 
 try:
@@ -15,59 +16,94 @@ from payfast.conf import settings
 
 logger = logging.getLogger('payfast')
 
+# Sentinel used to tell the caller of ``_cache_lookup`` to make the request.
+MISS = object()
 
 
 
-def cached(function):
-    @wraps(function)
-    def decorator(self, token, *args, **kwargs):
-        from payfast.utils import make_key
-        from payfast.api.subscriptions import Subscription
-
-        fresh = kwargs.get('fresh', False)
-        cache_only = kwargs.get('cache_only', False)
-        nocache = not kwargs.get('cache', False)
-        timeout = settings.CACHE_TIMEOUT
-        if not cache:
-            # If Django is not installed
-            if cache_only:
-                # TODO REVIEW:
-                # Cache only is not relevant if Django is not installed.
-                # Potentially raise an error.
-                #
-                # Or, mention that the cache=True will be ignored
-                # if it can't be cached.
-                pass
-            return function(self, token, *args, **kwargs)
-        else:
-            if not apps.ready:
-                return function(self, token, *args, **kwargs)
-
-        key = make_key(token)
-        if nocache:
-            return function(self, token, *args, **kwargs)
-
-        if fresh:
-            cache.delete(key)
-
-        cached_resp = cache.get(key)
-        if cached_resp:
-            try:
-                cached_resp = json.loads(cached_resp)
-            except json.JSONDecodeError as exc:
-                raise
-            token = cached_resp.get('token', None)
-            logger.debug(f'Cache hit for PayFast subscription "{token}".')
-            return Subscription(cached_resp)
 
+def _cache_lookup(token, kwargs):
+    """
+    Returns a tuple of the cache key (``None`` if the result must not be
+    stored) and the cached value. The cached value is ``MISS`` if the
+    wrapped function must be called.
+    """
+    from payfast.utils import make_key
+    from payfast.api.subscriptions import Subscription
+
+    fresh = kwargs.get('fresh', False)
+    cache_only = kwargs.get('cache_only', False)
+    nocache = not kwargs.get('cache', False)
+    if not cache:
+        # If Django is not installed
         if cache_only:
-            # We couldn't find anything in the cache so return
-            return
+            # TODO REVIEW:
+            # Cache only is not relevant if Django is not installed.
+            # Potentially raise an error.
+            #
+            # Or, mention that the cache=True will be ignored
+            # if it can't be cached.
+            pass
+        return None, MISS
+    else:
+        if not apps.ready:
+            return None, MISS
+
+    key = make_key(token)
+    if nocache:
+        return None, MISS
+
+    if fresh:
+        cache.delete(key)
+
+    cached_resp = cache.get(key)
+    if cached_resp:
+        try:
+            cached_resp = json.loads(cached_resp)
+        except json.JSONDecodeError as exc:
+            raise
+        token = cached_resp.get('token', None)
+        logger.debug(f'Cache hit for PayFast subscription "{token}".')
+        return key, Subscription(cached_resp)
+
+    if cache_only:
+        # We couldn't find anything in the cache so return
+        return key, None
+    return key, MISS
+
+
 
+
+def _cache_store(key, subscription_obj):
+    timeout = settings.CACHE_TIMEOUT
+    resp = json.dumps(subscription_obj.data)
+    cache.set(key, resp, timeout=timeout)
+    token = subscription_obj.token
+    logger.debug(f'Cache miss for PayFast subscription "{token}".')
+
+
+
+
+def cached(function):
+    if inspect.iscoroutinefunction(function):
+        @wraps(function)
+        async def async_decorator(self, token, *args, **kwargs):
+            key, value = _cache_lookup(token, kwargs)
+            if value is not MISS:
+                return value
+            subscription_obj = await function(self, token, *args, **kwargs)
+            if key:
+                _cache_store(key, subscription_obj)
+            return subscription_obj
+        return async_decorator
+
+    @wraps(function)
+    def decorator(self, token, *args, **kwargs):
+        key, value = _cache_lookup(token, kwargs)
+        if value is not MISS:
+            return value
         subscription_obj = function(self, token, *args, **kwargs)
-        resp = json.dumps(subscription_obj.data)
-        cache.set(key, resp, timeout=timeout)
-        token = subscription_obj.token
-        logger.debug(f'Cache miss for PayFast subscription "{token}".')
+        if key:
+            _cache_store(key, subscription_obj)
         return subscription_obj
     return decorator
@@ -63,3 +63,50 @@ class PayFastAPIException(PayFastException):
             errors='\n'.join(errors)
         )
         super().__init__(message, *args, **kwargs)
+
+
+
+
+class PayFastCircuitOpen(PayFastTimeout):
+    """
+    Raised without contacting PayFast while the circuit breaker for an
+    endpoint is open.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        super().__init__(
+            f'The circuit breaker for the PayFast endpoint "{endpoint}" '
+            f'is open.'
+        )
+
+
+
+
+class PayFastRateLimited(PayFastException):
+    """
+    Raised when a request can't acquire a token from the outbound rate
+    limiter in time.
+    """
+
+    def __init__(self, endpoint, wait=None):
+        self.endpoint = endpoint
+        self.wait = wait
+        super().__init__(
+            f'The outbound rate limit for the PayFast endpoint "{endpoint}" '
+            f'has been reached.'
+        )
+
+
+
+
+class PayFastQueueFull(PayFastException):
+    """
+    Raised when an ITN can't be queued because the queue is full.
+    """
+
+    def __init__(self, depth):
+        self.depth = depth
+        super().__init__(
+            f'The PayFast ITN queue is full ({depth} ITNs waiting).'
+        )
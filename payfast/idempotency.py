@@ -0,0 +1,389 @@
+"""
+Deduplication of the ITNs that PayFast sends more than once.
+
+PayFast sends an ITN again (immediately, after 10 minutes and then at
+longer intervals) until it gets a 200 response. An ITN is identified by
+its ``pf_payment_id``, ``payment_status`` and ``signature``; once an ITN
+has been processed, copies of it are acknowledged without being processed
+again. A copy that arrives while the ITN is still being processed is
+rejected so that PayFast sends it again later, in case processing fails.
+
+Usage::
+
+    from payfast.idempotency import NEW, DUPLICATE, itn_store
+
+    state = itn_store.begin(data)
+    if state == NEW:
+        try:
+            process_itn(data)
+        except Exception:
+            itn_store.release(data)
+            raise
+        itn_store.finish(data)
+
+Exposes the following settings:
+
+.. data:: IDEMPOTENCY_BACKEND
+
+.. data:: IDEMPOTENCY_TIMEOUT
+
+.. data:: IDEMPOTENCY_CACHE_SIZE
+
+.. data:: IDEMPOTENCY_PATH
+"""
+import os
+import time
+import sqlite3
+import tempfile
+import itertools
+import threading
+from collections import Counter, OrderedDict
+
+from payfast.conf import settings, import_string
+
+# The states of an ITN.
+NEW = 'new'
+IN_PROGRESS = 'in_progress'
+DUPLICATE = 'duplicate'
+
+# Seconds that an ITN is marked as in progress before a copy of it may be
+# processed, e.g. if the process died while processing it.
+PROCESSING_TIMEOUT = 300
+
+# The number of keys that ``SQLiteBackend`` adds between deleting all of
+# the expired keys.
+PURGE_INTERVAL = 100
+
+
+
+
+def get_key(data):
+    """
+    Returns the key of the ITN data, or ``None`` if it has no
+    ``pf_payment_id``.
+    """
+    pf_payment_id = data.get('pf_payment_id', None)
+    if not pf_payment_id:
+        return None
+    payment_status = data.get('payment_status', None) or ''
+    signature = data.get('signature', None) or ''
+    return f'{pf_payment_id}:{payment_status}:{signature}'
+
+
+
+
+class MemoryBackend:
+    """
+    Keeps the keys in an LRU cache in this process only.
+    """
+
+    def __init__(self, cache_size=None):
+        if cache_size is None:
+            cache_size = settings.IDEMPOTENCY_CACHE_SIZE
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+
+
+    def get(self, key):
+        with self._lock:
+            item = self._keys.get(key, None)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._keys[key]
+                return None
+            self._keys.move_to_end(key)
+            return value
+
+
+    def add(self, key, value, timeout) -> bool:
+        """
+        Store the value unless the key exists. Returns whether it was
+        stored.
+        """
+        with self._lock:
+            item = self._keys.get(key, None)
+            if item is not None and item[1] > time.monotonic():
+                return False
+            self._set(key, value, timeout)
+            return True
+
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._set(key, value, timeout)
+
+
+    def _set(self, key, value, timeout):
+        self._keys[key] = (value, time.monotonic() + timeout)
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.cache_size:
+            self._keys.popitem(last=False)
+
+
+    def delete(self, key):
+        with self._lock:
+            self._keys.pop(key, None)
+
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+
+
+class SQLiteBackend:
+    """
+    Keeps the keys in a SQLite database that is shared by all processes on
+    the host. The expired keys are deleted every ``purge_interval`` keys
+    that are added, so that the table doesn't keep a row for every ITN.
+    """
+
+    def __init__(self, path=None, purge_interval=PURGE_INTERVAL):
+        if not path:
+            path = os.path.join(tempfile.gettempdir(), 'payfast-idempotency.sqlite3')
+        self.path = path
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._adds = itertools.count(1)
+
+
+    @property
+    def connection(self):
+        # sqlite3 connections can't be shared between threads.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path,
+                timeout=30,
+                isolation_level=None,
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS payfast_itn_keys ('
+                'key TEXT PRIMARY KEY, value TEXT, expires_at REAL)'
+            )
+            self._local.connection = connection
+        return connection
+
+
+    def get(self, key):
+        row = self.connection.execute(
+            'SELECT value FROM payfast_itn_keys WHERE key = ? AND expires_at > ?',
+            (key, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+
+    def add(self, key, value, timeout) -> bool:
+        now = time.time()
+        connection = self.connection
+        purge = next(self._adds) % self.purge_interval == 0
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if purge:
+                self._purge(now)
+            else:
+                connection.execute(
+                    'DELETE FROM payfast_itn_keys WHERE key = ? AND expires_at <= ?',
+                    (key, now),
+                )
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO payfast_itn_keys (key, value, expires_at) '
+                'VALUES (?, ?, ?)',
+                (key, value, now + timeout),
+            )
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return cursor.rowcount == 1
+
+
+    def set(self, key, value, timeout):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO payfast_itn_keys (key, value, expires_at) '
+            'VALUES (?, ?, ?)',
+            (key, value, time.time() + timeout),
+        )
+
+
+    def delete(self, key):
+        self.connection.execute('DELETE FROM payfast_itn_keys WHERE key = ?', (key,))
+
+
+    def purge(self):
+        """
+        Delete the expired keys.
+        """
+        self._purge(time.time())
+
+
+    def _purge(self, now):
+        self.connection.execute(
+            'DELETE FROM payfast_itn_keys WHERE expires_at <= ?',
+            (now,),
+        )
+
+
+    def clear(self):
+        self.connection.execute('DELETE FROM payfast_itn_keys')
+
+
+
+
+class DjangoCacheBackend:
+    """
+    Keeps the keys in Django's default cache.
+    """
+
+    def __init__(self, cache=None):
+        if cache is None:
+            from django.core.cache import cache
+        self.cache = cache
+
+
+    def make_key(self, key):
+        return f'{settings.CACHE_KEY_PREFIX}:itn:{key}'
+
+
+    def get(self, key):
+        return self.cache.get(self.make_key(key))
+
+
+    def add(self, key, value, timeout) -> bool:
+        return self.cache.add(self.make_key(key), value, timeout=timeout)
+
+
+    def set(self, key, value, timeout):
+        self.cache.set(self.make_key(key), value, timeout=timeout)
+
+
+    def delete(self, key):
+        self.cache.delete(self.make_key(key))
+
+
+
+
+def get_backend():
+    backend = settings.IDEMPOTENCY_BACKEND
+    if backend == 'off':
+        return None
+    if backend == 'memory':
+        return MemoryBackend()
+    if backend == 'sqlite':
+        return SQLiteBackend(settings.IDEMPOTENCY_PATH)
+    if backend == 'django':
+        return DjangoCacheBackend()
+    try:
+        return import_string(backend)()
+    except ImportError:
+        raise ValueError(
+            f'"IDEMPOTENCY_BACKEND" must be "memory", "sqlite", "django", '
+            f'"off" or the dotted path to a backend class, not "{backend}".'
+        )
+
+
+
+
+class ITNStore:
+
+    def __init__(self, backend=None, timeout=None):
+        """
+        :param backend: Defaults to ``IDEMPOTENCY_BACKEND``.
+        :param timeout: The number of seconds that processed ITNs are
+                        remembered. Defaults to ``IDEMPOTENCY_TIMEOUT``.
+        """
+        self._backend = backend
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = get_backend() or False
+        return self._backend
+
+
+    @property
+    def timeout(self) -> int:
+        if self._timeout is None:
+            return settings.IDEMPOTENCY_TIMEOUT
+        return self._timeout
+
+
+    def count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+
+    def begin(self, data) -> str:
+        """
+        Mark the ITN as in progress. Returns ``NEW`` if it must be
+        processed, ``DUPLICATE`` if it was processed and ``IN_PROGRESS`` if
+        it is being processed.
+        """
+        key = get_key(data)
+        backend = self.backend
+        if key is None or not backend:
+            return NEW
+        if backend.add(key, IN_PROGRESS, PROCESSING_TIMEOUT):
+            self.count('misses')
+            return NEW
+        # The key may have expired or been released in the meantime; that
+        # copy is processed the next time PayFast sends it.
+        state = backend.get(key) or IN_PROGRESS
+        self.count('hits')
+        self.count(state)
+        return state
+
+
+    def finish(self, data):
+        """
+        Mark the ITN as processed.
+        """
+        key = get_key(data)
+        if key is not None and self.backend:
+            self.backend.set(key, DUPLICATE, self.timeout)
+
+
+    def release(self, data):
+        """
+        Forget the ITN so that it is processed when PayFast sends it again,
+        e.g. because processing it failed.
+        """
+        key = get_key(data)
+        if key is not None and self.backend:
+            self.backend.delete(key)
+
+
+    def metrics(self) -> dict:
+        """
+        - ``hits``: copies of ITNs that were not processed again, of which
+          ``duplicate`` were processed and ``in_progress`` were being
+          processed.
+        - ``misses``: ITNs that were processed.
+        - ``hit_rate``: the share of the ITNs that were copies.
+        """
+        with self._lock:
+            counters = dict(self.counters)
+        hits = counters.get('hits', 0)
+        total = hits + counters.get('misses', 0)
+        counters['hit_rate'] = hits / total if total else 0.0
+        return counters
+
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+
+
+
+
+itn_store = ITNStore()
@@ -1,16 +1,49 @@
 import json
+import time
 import decimal
+import logging
+import threading
+import contextvars
 from decimal import Decimal
 from datetime import datetime
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
 
-from payfast import PayFast
-from payfast import constants, timezone, callbacks
+from payfast.clients import get_payfast
+from payfast import codec, constants, timezone, callbacks
 from payfast import security_checks as checks
-from payfast.exceptions import PayFastAPIException
-from payfast.serialization import decoder
+from payfast.conf import settings
+from payfast.utils import run_in_thread, call_in_worker
+from payfast.exceptions import PayFastAPIException, PayFastTimeout
+from payfast.users import resolver
 from payfast.api.subscriptions import Upgrade
 
-payfast = PayFast()
+logger = logging.getLogger('payfast.itn')
+
+# The stages of an ITN, in order; see ``ITN.timings``.
+STAGES = ('parse', 'signature', 'ip', 'amount', 'validate', 'enrich')
+
+# Not fetched yet.
+UNSET = object()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    The threads for ``ITN.do_concurrent_checks``, shared by all ITNs.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ITN_THREADS,
+                thread_name_prefix='payfast-itn-check',
+            )
+        return _executor
 
 
 
@@ -50,16 +83,23 @@ class ITN:
                 'signature': 'ad8e7685c9522c24365d7ccea8cb3db7',
             }
         """
+        started = time.perf_counter()
         self.payload = data
         self.data_from_payfast = json.dumps(data)
         self.payfast_ipaddr = payfast_ipaddr
         self.paid_at = timezone.now()
-        self.sub = None
         self.secchecks_passed = None
         self.secchecks_results = None
+        # Seconds spent in each stage; see ``STAGES``.
+        self.timings = {}
+
+        # Fetched when they are first used; see ``enrich``.
+        self._sub = UNSET
+        self._upgrade = UNSET
+        self._expected_amount = UNSET
+        self._upgrade_data = None
 
         self.is_upgrade = False
-        self.upgrade = None
 
         required = [
             'pf_payment_id',
@@ -174,11 +214,63 @@ class ITN:
             if self.amount_fee < 0:
                 self.amount_fee = abs(self.amount_fee)
 
-        self.expected_amount = callbacks._get_expected_amount(self.m_payment_id)
-        self.sub = self.get_subscription()
-
         self.handle_custom_str1()
         self.handle_custom_str2()
+        self.timings['parse'] = time.perf_counter() - started
+
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+
+    @property
+    def expected_amount(self):
+        if self._expected_amount is UNSET:
+            self._expected_amount = callbacks._get_expected_amount(self.m_payment_id)
+        return self._expected_amount
+
+
+    @expected_amount.setter
+    def expected_amount(self, value):
+        self._expected_amount = value
+
+
+    @property
+    def sub(self):
+        """
+        The subscription, fetched when it is first used. Only ITNs that
+        no security check failed for fetch it (see ``secchecks_ok``);
+        otherwise this is the subscription that was already fetched, or
+        ``None``.
+        """
+        if not self.secchecks_ok:
+            return None if self._sub is UNSET else self._sub
+        return self.get_subscription()
+
+
+    @sub.setter
+    def sub(self, value):
+        self._sub = value
+
+
+    @property
+    def upgrade(self):
+        """
+        Same as ``sub`` for the upgrade.
+        """
+        if not self.secchecks_ok:
+            return None if self._upgrade is UNSET else self._upgrade
+        return self.fetch_upgrade()
+
+
+    @upgrade.setter
+    def upgrade(self, value):
+        self._upgrade = value
 
 
     def handle_custom_str1(self):
@@ -191,8 +283,8 @@ class ITN:
             return
 
         try:
-            str1 = json.loads(str1, object_hook=decoder)
-        except (json.decoder.JSONDecodeError, TypeError):
+            str1 = codec.loads(str1)
+        except (ValueError, TypeError):
             return
 
         for field in Payment.custom_str1_fields:
@@ -201,6 +293,10 @@ class ITN:
 
 
     def handle_custom_str2(self):
+        """
+        Reads the upgrade from ``custom_str2``. The subscription that is
+        upgraded is only fetched when ``upgrade`` is used.
+        """
         str2 = self.custom_str2
         self.is_upgrade = False
         if not str2:
@@ -210,36 +306,44 @@ class ITN:
         self.is_upgrade = True
 
         try:
-            str2 = json.loads(str2, object_hook=decoder)
-        except (json.decoder.JSONDecodeError, TypeError):
+            str2 = codec.loads(str2)
+        except (ValueError, TypeError):
             return
 
-        upgrade_from_token = str2.get('token', None)
-        if not upgrade_from_token:
+        if not str2.get('token', None):
             return # TODO REVIEW
 
-        cancel = str2.get('cancel', False)
+        self.plan_id = str2.get('plan_id', None)
+        self.upgrade_to_id = str2.get('upgrade_to_id', None)
+        self._upgrade_data = str2
+
+
+    def fetch_upgrade(self):
+        if self._upgrade is UNSET:
+            self._upgrade = self.get_upgrade()
+        return self._upgrade
+
+
+    def get_upgrade(self):
+        str2 = self._upgrade_data
+        if not str2:
+            return None
 
         sub = None
         try:
-            sub = payfast.subs.get(upgrade_from_token)
+            sub = get_payfast().subs.get(str2['token'])
         except PayFastAPIException:
-            return # TODO REVIEW
-
-        amount = str2.get('amount', None)
-        item_name = str2.get('item_name', None)
-        self.plan_id = str2.get('plan_id', None)
-        self.upgrade_to_id = str2.get('upgrade_to_id', None)
+            return None # TODO REVIEW
 
         kwargs = {
             'plan_id': self.plan_id,
             'upgrade_to_id': self.upgrade_to_id,
-            'cancel': cancel,
+            'cancel': str2.get('cancel', False),
         }
-        self.upgrade = Upgrade(
+        return Upgrade(
             sub,
-            amount,
-            item_name,
+            str2.get('amount', None),
+            str2.get('item_name', None),
             **kwargs,
         )
 
@@ -282,8 +386,8 @@ class ITN:
         if not self.token:
             return
 
-        if self.sub:
-            return self.sub
+        if self._sub is not UNSET and self._sub:
+            return self._sub
 
         # This is a payment for a subscription/tokenized subscription.
         # This could be one of four things:
@@ -295,11 +399,11 @@ class ITN:
         # - It might be a tokenized payment automatically initiated by
         #   the merchant.
         try:
-            self.sub = payfast.subscriptions.get(self.token)
+            self._sub = get_payfast().subscriptions.get(self.token)
         except PayFastAPIException:
             # TODO REVIEW
             raise
-        return self.sub
+        return self._sub
 
 
     def get_sub(self, *args, **kwargs):
@@ -310,83 +414,278 @@ class ITN:
 
 
     def get_user(self):
-        try:
-            import django
-            from django.contrib.auth import get_user_model
-        except ImportError:
-            return
-        User = get_user_model()
-        if not self.user_id:
-            return
-        user = None
-        try:
-            user = User.objects.get(pk=self.user_id)
-        except User.DoesNotExist:
-            pass
-        return user
+        """
+        Returns the Django user, or ``None``. Uses the users prefetched for
+        this context, if any (see ``payfast.users``).
+        """
+        return resolver.get_user(self.user_id)
 
 
     def is_downgrade(self):
         return not self.is_upgrade
 
 
+    @property
+    def secchecks_ok(self) -> bool:
+        """
+        Whether the ITN was checked and no check failed. Unlike for
+        ``secchecks_passed``, checks that were skipped (``None``, e.g. the
+        amount check without an expected amount callback) don't count.
+        """
+        if not self.secchecks_results:
+            return False
+        return False not in self.secchecks_results['security_checks'].values()
+
+
     def do_security_checks(self):
+        """
+        Runs the checks in ``STAGES`` order, cheapest first, and stops at the
+        first check that fails so that forged or malformed ITNs don't cost
+        a request to PayFast. Checks that can't be done (``None``) are
+        skipped. The checks that were not run are ``None``.
+        """
         if self.secchecks_passed and self.secchecks_results:
             return self.secchecks_passed, self.secchecks_results
 
-        passed = False
-        results = {}
+        checks_run = {
+            'check_one': None,
+            'check_two': None,
+            'check_three': None,
+            'check_four': None,
+        }
+        for stage, check, function in self.get_checks():
+            with self.stage(stage):
+                checks_run[check] = function()
+            if checks_run[check] is False:
+                # According to PayFast:
+                # Check payment manually and log for investigation.
+                break
+
+        # TODO REVIEW
+        # Successful payment if every check was done and passed.
+        return self.set_results(all(checks_run.values()), checks_run)
+
+
+    def get_checks(self) -> list:
+        return [
+            # Security check 1:
+            # Verify the signature.
+            ('signature', 'check_one', self.check_signature),
+            # Security check 2:
+            # Check that the notification has come from a valid PayFast domain.
+            ('ip', 'check_two', self.check_ip),
+            # Security check 3:
+            # Compare payment data.
+            ('amount', 'check_three', self.check_amount),
+            # Security check 4:
+            # Perform a server request to confirm the details.
+            ('validate', 'check_four', self.check_with_payfast),
+        ]
 
-        check_one = None
-        check_two = None
-        check_three = None
-        check_four = None
 
-        # Security check 1:
-        # Verify the signature.
-        check_one = checks.signature_is_valid(self.signature, self.payload)
+    def check_signature(self):
+        try:
+            return checks.signature_is_valid(self.signature, self.payload)
+        except ValueError:
+            # Fields that are not in the signature order.
+            return False
+
+
+    def check_ip(self):
+        if not self.payfast_ipaddr:
+            return None
+        return checks.request_is_from_payfast(self.payfast_ipaddr)[0]
 
-        # Security check 2:
-        # Check that the notification has come from a valid PayFast domain.
-        if self.payfast_ipaddr:
-            check_two, payfast_ip_address = checks.request_is_from_payfast(
-                self.payfast_ipaddr,
-            )
 
-        # Security check 3:
-        # Compare payment data.
-        if self.expected_amount:
-            check_three = checks.payment_data_is_valid(
-                total=self.expected_amount,
-                amount_gross=self.amount_gross,
+    def check_amount(self):
+        if not self.expected_amount:
+            return None
+        return checks.payment_data_is_valid(
+            total=self.expected_amount,
+            amount_gross=self.amount_gross,
+        )
+
+
+    def check_with_payfast(self):
+        return checks.send_validation_request(self.payload)
+
+
+    def enrich(self):
+        """
+        Fetch the subscription and the subscription that is upgraded, if
+        any.
+        """
+        with self.stage('enrich'):
+            self.get_subscription()
+            self.fetch_upgrade()
+
+
+    def do_concurrent_checks(self, deadline=None):
+        """
+        Like ``do_security_checks`` followed by ``enrich``, but the checks
+        that wait on the database or on PayFast run at the same time: the
+        amount check, the validation request, and fetching the subscription
+        and the subscription that is upgraded. The signature and the IP
+        address are checked first.
+
+        The results are combined in the same order as ``do_security_checks``,
+        whichever finishes first, and errors are raised the same way.
+        ``PayFastTimeout`` is raised if a stage that the result depends on
+        doesn't finish within ``deadline`` seconds (``ITN_DEADLINE``); its
+        thread is left to finish in the background.
+        """
+        if self.secchecks_passed and self.secchecks_results:
+            return self.secchecks_passed, self.secchecks_results
+        if deadline is None:
+            deadline = settings.ITN_DEADLINE
+        started = time.monotonic()
+
+        checks_run = {
+            'check_one': None,
+            'check_two': None,
+            'check_three': None,
+            'check_four': None,
+        }
+        stages = self.get_checks()
+        cheap, remote = stages[:2], stages[2:]
+        for stage, check, function in cheap:
+            with self.stage(stage):
+                checks_run[check] = function()
+            if checks_run[check] is False:
+                return self.set_results(False, checks_run)
+
+        tasks = [(stage, function) for stage, check, function in remote]
+        if self.token:
+            tasks.append(('enrich', self.get_subscription))
+        if self._upgrade_data:
+            tasks.append(('upgrade', self.fetch_upgrade))
+
+        executor = get_executor()
+        futures = {}
+        for stage, function in tasks:
+            # Each task gets a copy of the context for the current merchant.
+            context = contextvars.copy_context()
+            futures[stage] = executor.submit(
+                context.run, call_in_worker, self.run_stage, stage, function,
             )
+        remaining = max(0.0, deadline - (time.monotonic() - started))
+        done, not_done = wait(futures.values(), timeout=remaining)
+
+        def result(stage):
+            future = futures[stage]
+            if future not in done:
+                raise PayFastTimeout(
+                    f'The "{stage}" stage of PayFast ITN "{self.pf_payment_id}" '
+                    f'did not finish within {deadline} seconds.'
+                )
+            return future.result()
+
+        # Combined as if the checks ran one after the other, so that the
+        # results don't depend on which check finished first.
+        failed = False
+        for stage, check, function in remote:
+            checks_run[check] = result(stage)
+            if checks_run[check] is False:
+                failed = True
+                break
+        if not failed:
+            for stage, function in tasks[len(remote):]:
+                result(stage)
+        return self.set_results(all(checks_run.values()), checks_run)
+
+
+    async def ado_security_checks(self):
+        """
+        Same as ``do_security_checks`` for asyncio. The validation request
+        uses async I/O (see ``ValidateClient.avalidate``) and the expected
+        amount callback runs in a thread.
+        """
+        if self.secchecks_passed and self.secchecks_results:
+            return self.secchecks_passed, self.secchecks_results
+
+        checks_run = {
+            'check_one': None,
+            'check_two': None,
+            'check_three': None,
+            'check_four': None,
+        }
+        functions = {
+            'amount': lambda: run_in_thread(self.check_amount),
+            'validate': lambda: checks.asend_validation_request(self.payload),
+        }
+        for stage, check, function in self.get_checks():
+            with self.stage(stage):
+                if stage in functions:
+                    checks_run[check] = await functions[stage]()
+                else:
+                    checks_run[check] = function()
+            if checks_run[check] is False:
+                break
+        return self.set_results(all(checks_run.values()), checks_run)
 
-        # Security check 4:
-        # Perform a server request to confirm the details.
-        check_four = checks.send_validation_request(self.payload)
-
-        if (
-            check_one
-            and check_two
-            and check_three
-            and check_four
-        ):
-            # Successful payment.
-            passed = True
-        else:
-            # According to PayFast:
-            # Check payment manually and log for investigation.
-            passed = False
 
-        # TODO REVIEW
+    def run_stage(self, stage, function):
+        with self.stage(stage):
+            return function()
+
+
+    def set_results(self, passed, checks_run):
         results = {
-            'security_checks': {
-                'check_one': check_one,
-                'check_two': check_two,
-                'check_three': check_three,
-                'check_four': check_four,
-            },
+            'security_checks': checks_run,
         }
         self.secchecks_passed = passed
         self.secchecks_results = results
         return passed, results
+
+
+
+
+def process_itn(data, payfast_ipaddr=None) -> bool:
+    """
+    Runs the security checks, the upgrade (if any) and the
+    ``payment_done`` callbacks for the ITN data, with the current merchant.
+    Returns whether the security checks passed.
+
+    The subscriptions are only fetched (and upgrades only done) for ITNs
+    that no security check failed for (see ``ITN.secchecks_ok``); checks
+    that were skipped, e.g. without an expected amount callback, don't
+    count. With ``ITN_CONCURRENT`` they are fetched during the remote
+    checks, once the signature and the IP address have been checked. For
+    other ITNs, ``itn.sub`` and ``itn.upgrade`` are ``None`` in the
+    callbacks unless they were already fetched.
+    """
+    itn = ITN(data, payfast_ipaddr=payfast_ipaddr)
+    if settings.ITN_CONCURRENT:
+        passed, security_check_results = itn.do_concurrent_checks()
+    else:
+        passed, security_check_results = itn.do_security_checks()
+        if itn.secchecks_ok:
+            itn.enrich()
+
+    if itn.secchecks_ok:
+        if itn.upgrade:
+            itn.upgrade.do(itn=itn)
+
+    callbacks._payment_done(itn)
+    logger.debug(f'PayFast ITN "{itn.pf_payment_id}" timings: {itn.timings}')
+    return passed
+
+
+
+
+async def aprocess_itn(data, payfast_ipaddr=None) -> bool:
+    """
+    Same as ``process_itn`` for asyncio. The parts that use the synchronous
+    API client or the merchant's callbacks run in threads.
+    """
+    itn = ITN(data, payfast_ipaddr=payfast_ipaddr)
+    passed, security_check_results = await itn.ado_security_checks()
+
+    if itn.secchecks_ok:
+        await run_in_thread(itn.enrich)
+        if itn.upgrade:
+            await run_in_thread(itn.upgrade.do, itn=itn)
+
+    await run_in_thread(callbacks._payment_done, itn)
+    logger.debug(f'PayFast ITN "{itn.pf_payment_id}" timings: {itn.timings}')
+    return passed
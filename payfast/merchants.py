@@ -0,0 +1,212 @@
+"""
+Multiple PayFast merchant accounts in one process.
+
+A ``Merchant`` holds the credentials and URLs of one merchant account. The
+"current" merchant is context-local (see ``contextvars``) so that threads
+and asyncio tasks can serve different merchants at the same time. Signing,
+the API clients' connection pools and the subscription cache keys all use
+the current merchant. When no merchant is set, the merchant from the
+settings is used; the settings are read when they are needed, not when
+``payfast`` is imported.
+
+Usage::
+
+    from payfast.merchants import Merchant, merchants, use_merchant
+
+    merchants.register(Merchant(10000100, '46f0cd694581a', 'passphrase'))
+
+    with use_merchant(10000100):
+        payment = payfast.payment(10.00, 'Things')
+
+``NotifyEndpoint`` sets the current merchant from the ``merchant_id`` that
+PayFast posts.
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from payfast.conf import settings
+from payfast.signature import get_signer
+
+
+
+
+class Merchant:
+
+    def __init__(
+        self,
+        merchant_id,
+        merchant_key,
+        passphrase,
+        return_url=None,
+        cancel_url=None,
+        notify_url=None,
+        api_root=None,
+        cache_key_prefix=None,
+    ):
+        """
+        :param cache_key_prefix: Defaults to ``CACHE_KEY_PREFIX`` followed
+                                 by the merchant ID so that merchants don't
+                                 share cached subscriptions.
+        """
+        if passphrase and len(passphrase) > 32:
+            raise ValueError(
+                'The PayFast salt passphrase must be no longer than '
+                '32 characters'
+            )
+        self.merchant_id = int(merchant_id)
+        self.merchant_key = merchant_key
+        self.passphrase = passphrase
+        self.return_url = return_url or None
+        self.cancel_url = cancel_url or None
+        self.notify_url = notify_url or None
+        self.api_root = api_root or settings.API_ROOT
+        if cache_key_prefix is None:
+            cache_key_prefix = f'{settings.CACHE_KEY_PREFIX}:{self.merchant_id}'
+        self.cache_key_prefix = cache_key_prefix
+
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            settings.MERCHANT_ID,
+            settings.MERCHANT_KEY,
+            settings.SALT_PASSPHRASE,
+            return_url=settings.RETURN_URL,
+            cancel_url=settings.CANCEL_URL,
+            notify_url=settings.NOTIFY_URL,
+            api_root=settings.API_ROOT,
+            # Keep the keys that were cached before there were merchants.
+            cache_key_prefix=settings.CACHE_KEY_PREFIX,
+        )
+
+
+    @property
+    def signer(self):
+        return get_signer(self.passphrase)
+
+
+    @property
+    def pool_key(self) -> tuple:
+        return (str(self.merchant_id), self.api_root)
+
+
+    @property
+    def payment_fields(self) -> dict:
+        """
+        The merchant fields of a payment.
+        """
+        return {
+            'merchant_id': self.merchant_id,
+            'merchant_key': self.merchant_key,
+            'return_url': self.return_url,
+            'cancel_url': self.cancel_url,
+            'notify_url': self.notify_url,
+        }
+
+
+    def __repr__(self):
+        return f'<Merchant {self.merchant_id}>'
+
+
+
+
+def int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+
+
+class MerchantRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._merchants = {}
+        # The merchant from the settings and the settings version that it
+        # was built from.
+        self._default = None
+
+
+    def register(self, merchant):
+        with self._lock:
+            self._merchants[merchant.merchant_id] = merchant
+        return merchant
+
+
+    def unregister(self, merchant_id):
+        with self._lock:
+            self._merchants.pop(int(merchant_id), None)
+
+
+    def default(self) -> Merchant:
+        """
+        The merchant from the settings, unless it was registered explicitly.
+        It is built again when the settings change.
+        """
+        default = self._default
+        if default is None or default[0] != settings.version:
+            merchant = Merchant.from_settings()
+            # Read after building it, as that resolves settings.
+            default = (settings.version, merchant)
+            self._default = default
+        merchant = default[1]
+        return self._merchants.get(merchant.merchant_id, merchant)
+
+
+    def get(self, merchant_id=None, default=True):
+        """
+        Returns the registered merchant. Unknown merchant IDs return the
+        default merchant, or ``None`` if ``default`` is ``False``.
+        """
+        merchant_id = int_or_none(merchant_id)
+        merchant = self._merchants.get(merchant_id, None)
+        if merchant is None:
+            fallback = self.default()
+            if default or merchant_id == fallback.merchant_id:
+                merchant = fallback
+        return merchant
+
+
+    def clear(self):
+        with self._lock:
+            self._merchants.clear()
+            self._default = None
+
+
+    def __iter__(self):
+        return iter(list(self._merchants.values()))
+
+
+
+
+merchants = MerchantRegistry()
+_current = ContextVar('payfast_merchant', default=None)
+
+
+
+
+def current_merchant() -> Merchant:
+    merchant = _current.get()
+    if merchant is None:
+        merchant = merchants.default()
+    return merchant
+
+
+
+
+@contextmanager
+def use_merchant(merchant):
+    """
+    Make ``merchant`` the current merchant in this context. Accepts a
+    ``Merchant`` or the ID of a registered merchant.
+    """
+    if not isinstance(merchant, Merchant):
+        merchant = merchants.get(merchant)
+    token = _current.set(merchant)
+    try:
+        yield merchant
+    finally:
+        _current.reset(token)
@@ -1,9 +1,3 @@
-try:
-    from django.contrib.auth import get_user_model
-except ImportError:
-    get_user_model = None
-
-import json
 from typing import Union
 from decimal import Decimal
 from datetime import datetime, timedelta
@@ -11,22 +5,65 @@ from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
 from payfast import (
+    codec,
     constants,
     timezone,
 )
 from payfast.conf import settings
 from payfast.utils import get_freq_delta, get_delta_freq, get_freq_name
-from payfast.signature import make_signature
-from payfast.templates import render_to_string
+from payfast.signature import FIELD_RANK, PrefixSigner, PREFIX_FIELDS
+from payfast.merchants import current_merchant
+from payfast.users import resolver
+from payfast.templates import render_to_string, render_form
 from payfast.exceptions import (
     PayFastException,
     PayFastMinAmountException,
 )
 from payfast.validation import (
+    validate,
     PaymentValidator,
     SubscriptionPaymentValidator,
+    TokenizedSubValidator,
 )
-from payfast.serialization import PayFastJSONEncoder
+
+
+
+
+def convert_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, bool):
+        if value:
+            return 'true'
+        return 'false'
+    return value
+
+
+
+
+def convert_email_confirmation(value):
+    if value is True:
+        return constants.BooleanInteger.ON.value
+    if value is False:
+        return constants.BooleanInteger.OFF.value
+    return None
+
+
+
+
+def convert_billing_date(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    return convert_value(value)
+
+
+
+
+# Fields that need more than ``convert_value``.
+CONVERTERS = {
+    'email_confirmation': convert_email_confirmation,
+    'billing_date': convert_billing_date,
+}
 
 
 
@@ -108,6 +145,9 @@ class PaymentMixin:
                 "is_upgrade": false,
                 "upgrade_to_id": null
             }
+
+        The metadata is JSON or, with ``METADATA_FORMAT = "compact"``,
+        packed by ``payfast.codec``.
         """
         from payfast import callbacks
 
@@ -121,11 +161,12 @@ class PaymentMixin:
         self.item_description = kwargs.get('item_description', None)
 
         # Merchant details
-        self.merchant_id = kwargs.get('merchant_id', settings.MERCHANT_ID)
-        self.merchant_key = kwargs.get('merchant_key', settings.MERCHANT_KEY)
-        self.return_url = kwargs.get('return_url', settings.RETURN_URL)
-        self.cancel_url = kwargs.get('cancel_url', settings.CANCEL_URL)
-        self.notify_url = kwargs.get('notify_url', settings.NOTIFY_URL)
+        self.merchant = kwargs.get('merchant', None) or current_merchant()
+        self.merchant_id = kwargs.get('merchant_id', self.merchant.merchant_id)
+        self.merchant_key = kwargs.get('merchant_key', self.merchant.merchant_key)
+        self.return_url = kwargs.get('return_url', self.merchant.return_url)
+        self.cancel_url = kwargs.get('cancel_url', self.merchant.cancel_url)
+        self.notify_url = kwargs.get('notify_url', self.merchant.notify_url)
 
         # Handle blank strings
         if not self.return_url:
@@ -135,6 +176,9 @@ class PaymentMixin:
         if not self.notify_url:
             self.notify_url = None
 
+        # A ``PrefixSigner`` from ``PaymentTemplate``; see ``prep``.
+        self.signer = kwargs.get('signer', None)
+
         # Customer details
         self.name_first = kwargs.get('name_first', None)
         self.name_last = kwargs.get('name_last', None)
@@ -150,6 +194,9 @@ class PaymentMixin:
         # TODO: perhaps warn if custom_str1 in kwargs
         self.subscription_token = kwargs.get('subscription_token', None)
         self.user_id = kwargs.get('user_id', None)
+        # A user object or a dictionary with "first_name", "last_name" and
+        # "email"; saves looking up the user by "user_id".
+        self.user = kwargs.get('user', None)
         self.account_id = kwargs.get('account_id', None)
         self.plan_id = kwargs.get('plan_id', None)
         self.is_upgrade = kwargs.get('is_upgrade', False)
@@ -210,32 +257,27 @@ class PaymentMixin:
             pass
 
         # Ready for PayFast
+        self.pre_prep()
         self.data_for_payfast = self.prep()
         self.validate(self.data_for_payfast)
 
 
     def get_django_user(self):
-        User = None
-        if get_user_model:
-            User = get_user_model()
-
-        user = None
-        if User and self.user_id:
-            # TODO REVIEW
-            # Django is being used. Try to get the user.
-            try:
-                user = User.objects.get(pk=self.user_id)
-            except User.DoesNotExist:
-                pass
-
-        self.user = user
-        if self.user:
+        """
+        Fill in the customer details from the user. The database is not
+        queried if they are supplied or if the user was passed or
+        prefetched (see ``payfast.users``).
+        """
+        if self.name_first and self.name_last and self.email_address:
+            return
+        self.user, contact = resolver.resolve(self.user_id, self.user)
+        if contact:
             if not self.name_first:
-                self.name_first = self.user.first_name
+                self.name_first = contact['first_name']
             if not self.name_last:
-                self.name_last = self.user.last_name
+                self.name_last = contact['last_name']
             if not self.email_address:
-                self.email_address = self.user.email
+                self.email_address = contact['email']
 
 
     @property
@@ -243,7 +285,7 @@ class PaymentMixin:
         trial_started_at = getattr(self, 'trial_started_at', None)
         trial_expires_at = getattr(self, 'trial_expires_at', None)
         trial = [trial_started_at, trial_expires_at]
-        value = json.dumps({
+        value = codec.dumps({
             'user_id': self.user_id,
             'plan_id': self.plan_id,
 
@@ -251,7 +293,7 @@ class PaymentMixin:
             'run_date': getattr(self, 'billing_date', None),
             'recurring_amount': getattr(self, 'recurring_amount', None),
             'is_tokenized': getattr(self, 'is_tokenized', False),
-        }, cls=PayFastJSONEncoder)
+        })
         length = len(value)
         if length > 255:
             raise ValueError(
@@ -267,48 +309,65 @@ class PaymentMixin:
         return self.custom_str1
 
 
+    @classmethod
+    def get_schema(cls) -> tuple:
+        """
+        The fields that can be sent to PayFast, in signature order, with
+        their converters. Compiled once per class.
+
+        Each item is ``(field, converter, computed)``. Computed fields are
+        properties or class attributes; the others are only sent if they
+        were set on the instance.
+        """
+        schema = cls.__dict__.get('_schema', None)
+        if schema is not None:
+            return schema
+        last = len(FIELD_RANK)
+        fields = sorted(
+            cls.allowed_fields,
+            key=lambda field: (FIELD_RANK.get(field, last), field),
+        )
+        schema = tuple(
+            (field, CONVERTERS.get(field, convert_value), hasattr(cls, field))
+            for field in fields
+        )
+        cls._schema = schema
+        return schema
+
+
+    def pre_prep(self):
+        """
+        Called right before the data for PayFast is prepared.
+        """
+
+
     def prep(self):
         data = {}
-        # Don't get private attributes or magic methods; those are not
-        # meant to be sent to PayFast.
-        attributes = [a for a in dir(self) if not a.startswith('_')]
-        for attr in attributes:
-            if attr not in self.allowed_fields:
-                continue
-
-            value = getattr(self, attr)
-            if callable(value):
+        # Only the allowed fields are read; private attributes, methods and
+        # properties like "metadata" are never touched, and "custom_str1"
+        # is computed once.
+        attributes = self.__dict__
+        for field, convert, computed in self.get_schema():
+            if field in attributes:
+                value = attributes[field]
+            elif computed:
+                value = getattr(self, field)
+                if callable(value):
+                    continue
+            else:
                 continue
-
-            if isinstance(value, Decimal):
-                value = str(value)
-
-            if attr in ['email_confirmation']:
-                if value is True:
-                    value = constants.BooleanInteger.ON.value
-                elif value is False:
-                    value = constants.BooleanInteger.OFF.value
-                else:
-                    value = None
-
-            if attr in ['billing_date']:
-                if isinstance(value, datetime):
-                    value = value.strftime('%Y-%m-%d')
-
-            if isinstance(value, bool):
-                if value:
-                    value = 'true'
-                else:
-                    value = 'false'
-
-            data[attr] = value
-        signature = make_signature(data, a12y=False)
+            data[field] = convert(value)
+        signer = self.signer
+        if signer is None:
+            signer = self.merchant.signer
+        # The encoded pairs are kept for ``get_url``.
+        signature, self._query = signer.sign(data)
         data['signature'] = signature
         return data
 
 
     def validate(self, data):
-        self.validator(**data)
+        validate(self.validator, data)
 
 
     def get_inputs(self, data: dict):
@@ -331,16 +390,36 @@ class PaymentMixin:
         return inputs
 
 
-    def get_form(self):
+    def get_url(self) -> str:
+        """
+        The signed URL that sends the buyer to PayFast, e.g. for API-driven
+        frontends and emailed payment links. The querystring is the one
+        that was encoded for the signature, so nothing is encoded twice.
+        """
+        query = self._query.decode()
+        signature = self.data_for_payfast['signature']
+        return f'{settings.PROCESS_URL}?{query}&signature={signature}'
+
+
+    def get_form_context(self) -> dict:
         data = self.data_for_payfast
         inputs = self.get_inputs(data)
-        context = {
-            **data,
+        return {
             'inputs': inputs,
             'debug': settings.DEBUG,
             'payfast_process_url': settings.PROCESS_URL,
             'button_name': 'Proceed to PayFast',
         }
+
+
+    def get_form(self):
+        context = self.get_form_context()
+        if settings.FORM_RENDERER == 'string':
+            return render_form(
+                context['inputs'],
+                context['payfast_process_url'],
+                context['button_name'],
+            )
         rendered = render_to_string('payfast/form.html', context)
         return rendered
 
@@ -477,15 +556,15 @@ class TokenizedPayment(Payment):
 # TODO REVIEW
 class TokenizedSub(SubscriptionPayment):
 
-    def __init__(self, amount, item_name, **kwargs):
-        super().__init__(amount, item_name, **kwargs)
+    validator = TokenizedSubValidator
+
+
+    def pre_prep(self):
         self.subscription_type = constants.SubscriptionType.TOKENIZATION.value
         self.is_tokenized = True
         del self.frequency
         del self.cycles
         del self.recurring_amount
-        # Prep again
-        self.data_for_payfast = self.prep()
 
 
 
@@ -499,3 +578,54 @@ class OnsitePayment(Payment):
         # Required if email is not set
         self.cell_number = kwargs.get('cell_number', None)
         super().__init__(amount, item_name, **kwargs)
+
+
+
+
+class PaymentTemplate:
+    """
+    Creates payments that share the same merchant details. The signature
+    of the merchant fields is hashed once and reused for every payment,
+    which speeds up creating many payments, e.g. for bulk invoicing::
+
+        template = PaymentTemplate(notify_url='https://example.com/notify/')
+        for invoice in invoices:
+            payment = template.payment(invoice.amount, invoice.name)
+
+    The merchant defaults to the current merchant when the template is
+    created; see ``payfast.merchants``.
+    """
+
+    def __init__(self, merchant=None, **kwargs):
+        self.merchant = merchant or current_merchant()
+        defaults = self.merchant.payment_fields
+        self.merchant_fields = {
+            field: kwargs.get(field, defaults[field]) or None
+            for field in PREFIX_FIELDS
+        }
+        unknown = set(kwargs) - set(PREFIX_FIELDS)
+        if unknown:
+            raise ValueError(
+                f'"PaymentTemplate" only accepts the merchant fields '
+                f'{", ".join(PREFIX_FIELDS)}; got {", ".join(sorted(unknown))}.'
+            )
+        self.signer = PrefixSigner(self.merchant.signer, self.merchant_fields)
+
+
+    def create(self, payment_class, amount, item_name, **kwargs):
+        kwargs = {**self.merchant_fields, **kwargs}
+        kwargs['merchant'] = self.merchant
+        kwargs['signer'] = self.signer
+        return payment_class(amount, item_name, **kwargs)
+
+
+    def payment(self, amount, item_name, **kwargs) -> Payment:
+        return self.create(Payment, amount, item_name, **kwargs)
+
+
+    def subscription(self, amount, item_name, **kwargs) -> SubscriptionPayment:
+        return self.create(SubscriptionPayment, amount, item_name, **kwargs)
+
+
+    def tokenized(self, amount, item_name, **kwargs) -> TokenizedPayment:
+        return self.create(TokenizedPayment, amount, item_name, **kwargs)
@@ -0,0 +1,516 @@
+"""
+A durable queue for processing ITNs in the background.
+
+In the "queue" ``ITN_MODE`` the notify endpoint only checks the signature
+and the source IP address of an ITN, adds the ITN to the queue and
+responds to PayFast immediately. A pool of worker threads takes the ITNs
+from the queue and processes them (see ``payfast.itn.process_itn``): the
+subscription is fetched, the amount and the data are validated with
+PayFast, upgrades are done and the ``payment_done`` callbacks are called.
+
+The default backend keeps the queue in a SQLite database so that queued
+ITNs survive a restart and can be shared by worker processes. An ITN that
+fails is retried later, up to ``ITN_QUEUE_MAX_ATTEMPTS`` times, after which
+it is kept as "dead" for investigation. When the queue is
+``ITN_QUEUE_MAX_DEPTH`` deep new ITNs are rejected with
+``PayFastQueueFull`` so that PayFast retries them later.
+
+Usage::
+
+    from payfast.queue import itn_queue
+
+    itn_queue.start()
+    itn_queue.metrics()  # {'depth': 0, 'age': 0.0, ...}
+
+Exposes the following settings:
+
+.. data:: ITN_MODE
+
+.. data:: ITN_QUEUE_BACKEND
+
+.. data:: ITN_QUEUE_PATH
+
+.. data:: ITN_QUEUE_MAX_DEPTH
+
+.. data:: ITN_QUEUE_WORKERS
+
+.. data:: ITN_QUEUE_MAX_ATTEMPTS
+
+.. data:: ITN_QUEUE_LEASE
+"""
+import os
+import json
+import time
+import logging
+import sqlite3
+import tempfile
+import threading
+from collections import Counter
+
+from payfast.conf import settings, import_string
+from payfast.utils import call_in_worker
+from payfast.exceptions import PayFastQueueFull
+
+logger = logging.getLogger('payfast.itn')
+
+# Seconds between checks for new ITNs when the queue is empty.
+POLL_INTERVAL = 1.0
+# Seconds before the first retry of a failed ITN; doubled for each attempt.
+RETRY_DELAY = 10.0
+MAX_RETRY_DELAY = 3600.0
+
+PENDING = 'pending'
+DEAD = 'dead'
+
+
+
+
+class QueuedITN:
+
+    def __init__(self, id, data, ipaddr, attempts=0, enqueued_at=None):
+        self.id = id
+        self.data = data
+        self.ipaddr = ipaddr
+        self.attempts = attempts
+        self.enqueued_at = enqueued_at
+
+
+    def __repr__(self):
+        return f'<QueuedITN {self.id} {self.data.get("pf_payment_id", None)}>'
+
+
+
+
+def get_retry_delay(attempts) -> float:
+    return min(RETRY_DELAY * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY)
+
+
+
+
+class MemoryBackend:
+    """
+    Keeps the queue in this process only. Queued ITNs are lost on restart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = {}
+        self._next_id = 1
+
+
+    def put(self, data, ipaddr, max_depth):
+        """
+        Returns the ID of the queued ITN, or ``None`` if the queue is full.
+        """
+        now = time.time()
+        with self._lock:
+            depth = sum(1 for item in self._items.values() if item['status'] == PENDING)
+            if max_depth and depth >= max_depth:
+                return None
+            item_id = self._next_id
+            self._next_id += 1
+            self._items[item_id] = {
+                'data': dict(data),
+                'ipaddr': ipaddr,
+                'enqueued_at': now,
+                'available_at': now,
+                'attempts': 0,
+                'status': PENDING,
+                'error': None,
+            }
+        return item_id
+
+
+    def claim(self, limit, lease) -> list:
+        """
+        Take up to ``limit`` ITNs that are due. They are given to another
+        worker if they are not acknowledged within ``lease`` seconds.
+        """
+        now = time.time()
+        claimed = []
+        with self._lock:
+            for item_id, item in self._items.items():
+                if len(claimed) >= limit:
+                    break
+                if item['status'] != PENDING or item['available_at'] > now:
+                    continue
+                item['available_at'] = now + lease
+                item['attempts'] += 1
+                claimed.append(QueuedITN(
+                    item_id,
+                    dict(item['data']),
+                    item['ipaddr'],
+                    item['attempts'],
+                    item['enqueued_at'],
+                ))
+        return claimed
+
+
+    def ack(self, item_id):
+        with self._lock:
+            self._items.pop(item_id, None)
+
+
+    def retry(self, item_id, delay, error, max_attempts) -> bool:
+        """
+        Make a failed ITN available again after ``delay`` seconds. Returns
+        whether the ITN is dead instead because it has been attempted
+        ``max_attempts`` times.
+        """
+        with self._lock:
+            item = self._items.get(item_id, None)
+            if item is None:
+                return False
+            item['error'] = error
+            item['available_at'] = time.time() + delay
+            if item['attempts'] >= max_attempts:
+                item['status'] = DEAD
+                return True
+        return False
+
+
+    def stats(self) -> tuple:
+        """
+        Returns the number of pending ITNs, the time the oldest pending ITN
+        was queued (or ``None``) and the number of dead ITNs.
+        """
+        with self._lock:
+            pending = [
+                item['enqueued_at'] for item in self._items.values()
+                if item['status'] == PENDING
+            ]
+            dead = len(self._items) - len(pending)
+        return len(pending), min(pending, default=None), dead
+
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+
+
+class SQLiteBackend:
+    """
+    Keeps the queue in a SQLite database that is shared by all processes on
+    the host. ``BEGIN IMMEDIATE`` serialises the updates.
+    """
+
+    def __init__(self, path=None):
+        if not path:
+            path = os.path.join(tempfile.gettempdir(), 'payfast-itns.sqlite3')
+        self.path = path
+        self._local = threading.local()
+
+
+    @property
+    def connection(self):
+        # sqlite3 connections can't be shared between threads.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path,
+                timeout=30,
+                isolation_level=None,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS payfast_itns ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT, ipaddr TEXT, '
+                'enqueued_at REAL, available_at REAL, attempts INTEGER, '
+                'status TEXT, error TEXT)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS payfast_itns_due '
+                'ON payfast_itns (status, available_at)'
+            )
+            self._local.connection = connection
+        return connection
+
+
+    def transaction(self, function, *args):
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = function(connection, *args)
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return result
+
+
+    def put(self, data, ipaddr, max_depth):
+        def put(connection):
+            if max_depth:
+                depth = connection.execute(
+                    'SELECT COUNT(*) FROM payfast_itns WHERE status = ?',
+                    (PENDING,),
+                ).fetchone()[0]
+                if depth >= max_depth:
+                    return None
+            now = time.time()
+            cursor = connection.execute(
+                'INSERT INTO payfast_itns (data, ipaddr, enqueued_at, '
+                'available_at, attempts, status) VALUES (?, ?, ?, ?, 0, ?)',
+                (json.dumps(data, default=str), ipaddr, now, now, PENDING),
+            )
+            return cursor.lastrowid
+        return self.transaction(put)
+
+
+    def claim(self, limit, lease) -> list:
+        def claim(connection):
+            now = time.time()
+            rows = connection.execute(
+                'SELECT id, data, ipaddr, attempts, enqueued_at FROM payfast_itns '
+                'WHERE status = ? AND available_at <= ? ORDER BY id LIMIT ?',
+                (PENDING, now, limit),
+            ).fetchall()
+            connection.executemany(
+                'UPDATE payfast_itns SET available_at = ?, '
+                'attempts = attempts + 1 WHERE id = ?',
+                [(now + lease, row[0]) for row in rows],
+            )
+            return [
+                QueuedITN(item_id, json.loads(data), ipaddr, attempts + 1, enqueued_at)
+                for item_id, data, ipaddr, attempts, enqueued_at in rows
+            ]
+        return self.transaction(claim)
+
+
+    def ack(self, item_id):
+        self.connection.execute('DELETE FROM payfast_itns WHERE id = ?', (item_id,))
+
+
+    def retry(self, item_id, delay, error, max_attempts) -> bool:
+        def retry(connection):
+            row = connection.execute(
+                'SELECT attempts FROM payfast_itns WHERE id = ?',
+                (item_id,),
+            ).fetchone()
+            if row is None:
+                return False
+            dead = row[0] >= max_attempts
+            connection.execute(
+                'UPDATE payfast_itns SET available_at = ?, error = ?, '
+                'status = ? WHERE id = ?',
+                (time.time() + delay, error, DEAD if dead else PENDING, item_id),
+            )
+            return dead
+        return self.transaction(retry)
+
+
+    def stats(self) -> tuple:
+        pending, oldest = self.connection.execute(
+            'SELECT COUNT(*), MIN(enqueued_at) FROM payfast_itns WHERE status = ?',
+            (PENDING,),
+        ).fetchone()
+        dead = self.connection.execute(
+            'SELECT COUNT(*) FROM payfast_itns WHERE status = ?',
+            (DEAD,),
+        ).fetchone()[0]
+        return pending, oldest, dead
+
+
+    def clear(self):
+        self.connection.execute('DELETE FROM payfast_itns')
+
+
+
+
+def get_backend():
+    backend = settings.ITN_QUEUE_BACKEND
+    if backend == 'sqlite':
+        return SQLiteBackend(settings.ITN_QUEUE_PATH)
+    if backend == 'memory':
+        return MemoryBackend()
+    try:
+        return import_string(backend)()
+    except ImportError:
+        raise ValueError(
+            f'"ITN_QUEUE_BACKEND" must be "sqlite", "memory" or the dotted '
+            f'path to a backend class, not "{backend}".'
+        )
+
+
+
+
+def process(item):
+    """
+    Process a queued ITN with its merchant.
+    """
+    from payfast.itn import process_itn
+    from payfast.merchants import merchants, use_merchant
+
+    with use_merchant(merchants.get(item.data.get('merchant_id', None))):
+        process_itn(item.data, payfast_ipaddr=item.ipaddr)
+
+
+
+
+class ITNQueue:
+
+    def __init__(
+        self,
+        backend=None,
+        handler=None,
+        max_depth=None,
+        max_attempts=None,
+        lease=None,
+    ):
+        """
+        :param backend: Defaults to ``ITN_QUEUE_BACKEND``.
+        :param handler: Called with each ``QueuedITN``. Defaults to
+                        ``process``.
+        """
+        if max_depth is None:
+            max_depth = settings.ITN_QUEUE_MAX_DEPTH
+        if max_attempts is None:
+            max_attempts = settings.ITN_QUEUE_MAX_ATTEMPTS
+        if lease is None:
+            lease = settings.ITN_QUEUE_LEASE
+        self._backend = backend
+        self.handler = handler or process
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._workers = []
+
+
+    @property
+    def backend(self):
+        # Created when it is first used so that importing this module
+        # doesn't touch the database.
+        if self._backend is None:
+            self._backend = get_backend()
+        return self._backend
+
+
+    def count(self, counter, value=1):
+        with self._lock:
+            self.counters[counter] += value
+
+
+    def enqueue(self, data, ipaddr=None):
+        """
+        Add the ITN data to the queue. Raises ``PayFastQueueFull`` if the
+        queue is full.
+        """
+        item_id = self.backend.put(dict(data), ipaddr, self.max_depth)
+        if item_id is None:
+            self.count('rejected')
+            raise PayFastQueueFull(self.max_depth)
+        self.count('enqueued')
+        self._wakeup.set()
+        return item_id
+
+
+    def run_once(self, limit=1) -> int:
+        """
+        Process up to ``limit`` ITNs that are due in this thread. Returns the
+        number of ITNs taken from the queue.
+        """
+        items = self.backend.claim(limit, self.lease)
+        for item in items:
+            try:
+                call_in_worker(self.handler, item)
+            except Exception as exc:
+                logger.exception(f'Could not process queued PayFast ITN {item!r}.')
+                self.count('failed')
+                dead = self.backend.retry(
+                    item.id,
+                    get_retry_delay(item.attempts),
+                    repr(exc),
+                    self.max_attempts,
+                )
+                if dead:
+                    logger.error(
+                        f'Giving up on queued PayFast ITN {item!r} after '
+                        f'{item.attempts} attempts.'
+                    )
+                continue
+            self.backend.ack(item.id)
+            self.count('processed')
+            self.count('latency', time.time() - item.enqueued_at)
+        return len(items)
+
+
+    def drain(self) -> int:
+        """
+        Process the ITNs that are due until there are none left. Returns the
+        number of ITNs taken from the queue.
+        """
+        total = 0
+        while True:
+            count = self.run_once(limit=100)
+            if not count:
+                return total
+            total += count
+
+
+    def work(self):
+        while not self._stopping.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception:
+                logger.exception('The PayFast ITN queue worker failed.')
+            self._wakeup.wait(POLL_INTERVAL)
+            self._wakeup.clear()
+
+
+    def start(self, workers=None):
+        """
+        Start the worker threads, unless they are running. Defaults to
+        ``ITN_QUEUE_WORKERS``; use 0 to process the queue elsewhere, e.g.
+        with ``drain`` in another process.
+        """
+        if workers is None:
+            workers = settings.ITN_QUEUE_WORKERS
+        with self._lock:
+            self._stopping.clear()
+            while len(self._workers) < workers:
+                thread = threading.Thread(
+                    target=self.work,
+                    name=f'payfast-itn-{len(self._workers)}',
+                    daemon=True,
+                )
+                thread.start()
+                self._workers.append(thread)
+
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._workers:
+            thread.join(timeout)
+        self._workers = []
+
+
+    def metrics(self) -> dict:
+        """
+        - ``depth``: pending ITNs.
+        - ``age``: seconds since the oldest pending ITN was queued.
+        - ``dead``: ITNs that were given up on.
+        - ``enqueued``, ``rejected``, ``processed`` and ``failed``: counters
+          for this process.
+        - ``latency``: total seconds from queueing to processing of the
+          processed ITNs.
+        """
+        depth, oldest, dead = self.backend.stats()
+        age = 0.0
+        if oldest is not None:
+            age = max(0.0, time.time() - oldest)
+        with self._lock:
+            counters = dict(self.counters)
+        return {'depth': depth, 'age': age, 'dead': dead, **counters}
+
+
+
+
+itn_queue = ITNQueue()
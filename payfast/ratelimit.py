@@ -0,0 +1,315 @@
+"""
+A token-bucket rate limiter for outbound requests to the PayFast API.
+
+There is one bucket per endpoint (see ``payfast.utils.get_endpoint``). The
+buckets can be shared between worker processes with ``SQLiteBackend`` so
+that bulk jobs don't trip PayFast's own throttling. No external service
+is needed.
+
+Exposes the following settings:
+
+.. data:: RATE_LIMIT
+
+.. data:: RATE_LIMIT_BURST
+
+.. data:: RATE_LIMITS
+
+.. data:: RATE_LIMIT_BLOCKING
+
+.. data:: RATE_LIMIT_TIMEOUT
+
+.. data:: RATE_LIMIT_BACKEND
+
+.. data:: RATE_LIMIT_PATH
+"""
+import os
+import time
+import math
+import asyncio
+import sqlite3
+import tempfile
+import threading
+from functools import lru_cache
+from collections import Counter
+
+from payfast.conf import settings
+
+
+
+
+def refill(tokens, updated, now, rate, burst):
+    tokens = min(burst, tokens + (now - updated) * rate)
+    return tokens
+
+
+
+
+def take_token(tokens, rate, max_wait):
+    """
+    Returns the new number of tokens, whether a token was taken and how
+    long the caller must wait before using it. A token is taken (and the
+    bucket may go into debt) only if the wait is within ``max_wait``.
+    """
+    wait = max(0.0, (1 - tokens) / rate)
+    if wait > max_wait:
+        return tokens, False, wait
+    return tokens - 1, True, wait
+
+
+
+
+class MemoryBackend:
+    """
+    Keeps the buckets in this process only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+
+    def take(self, key, rate, burst, max_wait):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = refill(tokens, updated, now, rate, burst)
+            tokens, taken, wait = take_token(tokens, rate, max_wait)
+            self._buckets[key] = (tokens, now)
+        return taken, wait
+
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+
+
+class SQLiteBackend:
+    """
+    Keeps the buckets in a SQLite database that is shared by all processes
+    on the host. ``BEGIN IMMEDIATE`` serialises the updates.
+    """
+
+    def __init__(self, path=None):
+        if not path:
+            path = os.path.join(tempfile.gettempdir(), 'payfast-ratelimit.sqlite3')
+        self.path = path
+        self._local = threading.local()
+
+
+    @property
+    def connection(self):
+        # sqlite3 connections can't be shared between threads.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path,
+                timeout=30,
+                isolation_level=None,
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS payfast_buckets ('
+                'key TEXT PRIMARY KEY, tokens REAL, updated REAL)'
+            )
+            self._local.connection = connection
+        return connection
+
+
+    def take(self, key, rate, burst, max_wait):
+        # time.monotonic() is not comparable between processes.
+        now = time.time()
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT tokens, updated FROM payfast_buckets WHERE key = ?',
+                (key,),
+            ).fetchone()
+            tokens, updated = row or (burst, now)
+            tokens = refill(tokens, updated, now, rate, burst)
+            tokens, taken, wait = take_token(tokens, rate, max_wait)
+            connection.execute(
+                'INSERT OR REPLACE INTO payfast_buckets (key, tokens, updated) '
+                'VALUES (?, ?, ?)',
+                (key, tokens, now),
+            )
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return taken, wait
+
+
+    def clear(self):
+        self.connection.execute('DELETE FROM payfast_buckets')
+
+
+
+
+class RateLimiterStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+
+    def add(self, taken, wait):
+        with self._lock:
+            if not taken:
+                self.counters['rejected'] += 1
+                return
+            self.counters['acquired'] += 1
+            if wait > 0:
+                self.counters['waited'] += 1
+                self.counters['wait_time'] += wait
+
+
+    def snapshot(self) -> dict:
+        """
+        Counters:
+
+        - ``acquired``: tokens acquired.
+        - ``waited``: acquisitions that had to wait for a token.
+        - ``wait_time``: total seconds spent waiting for tokens.
+        - ``rejected``: acquisitions that failed.
+        """
+        with self._lock:
+            return dict(self.counters)
+
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+
+
+
+
+def parse_limits(value) -> dict:
+    """
+    Parse ``"subscriptions/adhoc=2,subscriptions/update=5"`` into a
+    dictionary of endpoints and rates.
+    """
+    limits = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            endpoint, rate = item.split('=')
+            limits[endpoint.strip()] = float(rate)
+        except ValueError:
+            raise ValueError(
+                f'Invalid value "{item}" in "RATE_LIMITS". Expected '
+                f'"<endpoint>=<requests per second>".'
+            )
+    return limits
+
+
+
+
+class RateLimiter:
+
+    def __init__(self, backend=None, rate=None, burst=None, limits=None):
+        """
+        :param rate: The default number of requests per second for each
+                     endpoint. Use 0 to only limit the endpoints in
+                     ``limits``.
+        :param burst: The capacity of the buckets. Defaults to the rate.
+        :param limits: A dictionary of endpoints and their rates.
+        """
+        if backend is None:
+            backend = get_backend()
+        if rate is None:
+            rate = settings.RATE_LIMIT
+        if burst is None:
+            burst = settings.RATE_LIMIT_BURST
+        if limits is None:
+            limits = parse_limits(settings.RATE_LIMITS)
+        self.backend = backend
+        self.rate = rate
+        self.burst = burst
+        self.limits = limits
+        self.stats = RateLimiterStats()
+
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rate or self.limits)
+
+
+    def get_rate(self, endpoint):
+        return self.limits.get(endpoint, self.rate)
+
+
+    def get_burst(self, rate):
+        return self.burst or max(rate, 1)
+
+
+    def reserve(self, endpoint, blocking=True, timeout=None):
+        """
+        Take a token for the endpoint without waiting for it. Returns
+        whether a token was taken and the number of seconds the caller
+        must wait before using it.
+        """
+        rate = self.get_rate(endpoint)
+        if not rate:
+            return True, 0.0
+        max_wait = 0.0
+        if blocking:
+            max_wait = timeout if timeout else math.inf
+        taken, wait = self.backend.take(
+            endpoint,
+            rate,
+            self.get_burst(rate),
+            max_wait,
+        )
+        self.stats.add(taken, wait)
+        return taken, wait
+
+
+    def acquire(self, endpoint, blocking=True, timeout=None) -> bool:
+        """
+        :param blocking: Wait for a token if none is available.
+        :param timeout: The maximum number of seconds to wait. ``None``
+                        waits as long as it takes.
+        """
+        taken, wait = self.reserve(endpoint, blocking, timeout)
+        if taken and wait:
+            time.sleep(wait)
+        return taken
+
+
+    async def acquire_async(self, endpoint, blocking=True, timeout=None) -> bool:
+        taken, wait = self.reserve(endpoint, blocking, timeout)
+        if taken and wait:
+            await asyncio.sleep(wait)
+        return taken
+
+
+    def reset(self):
+        self.backend.clear()
+        self.stats.reset()
+
+
+
+
+def get_backend():
+    if settings.RATE_LIMIT_BACKEND == 'sqlite':
+        return SQLiteBackend(settings.RATE_LIMIT_PATH)
+    if settings.RATE_LIMIT_BACKEND == 'memory':
+        return MemoryBackend()
+    raise ValueError(
+        f'"RATE_LIMIT_BACKEND" must be either "memory" or "sqlite", not '
+        f'"{settings.RATE_LIMIT_BACKEND}".'
+    )
+
+
+
+
+@lru_cache(maxsize=None)
+def get_limiter() -> RateLimiter:
+    """
+    Returns the shared ``RateLimiter``, built on first use.
+    """
+    return RateLimiter()
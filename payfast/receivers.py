@@ -0,0 +1,306 @@
+"""
+An ITN endpoint that doesn't need Django or Django REST framework.
+
+``ITNReceiver`` is a WSGI and an ASGI application that accepts the POST
+requests that PayFast sends to the ``notify_url`` and processes them the
+same way as ``payfast.views.NotifyEndpoint``: copies of ITNs are
+deduplicated (see ``payfast.idempotency``), the ITN is processed with the
+merchant that it is for and, if ``ITN_MODE`` is ``"queue"``, queued for
+the workers (see ``payfast.queue``). The response is an empty JSON object
+with the same status codes.
+
+With ASGI, the validation request to PayFast uses async I/O so that a
+worker can wait on many of them at once.
+
+Usage with any ASGI server::
+
+    # asgi.py
+    from payfast.receivers import ITNReceiver
+
+    application = ITNReceiver()
+
+    $ uvicorn asgi:application
+
+Or mounted in another WSGI app, e.g. Flask::
+
+    from werkzeug.middleware.dispatcher import DispatcherMiddleware
+
+    app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {
+        '/payfast/notify': ITNReceiver(),
+    })
+"""
+import json
+import logging
+from http import HTTPStatus
+from urllib.parse import parse_qsl
+
+from payfast.conf import settings
+from payfast.utils import get_client_ip, run_in_thread
+from payfast.itn import process_itn, aprocess_itn
+from payfast.merchants import merchants, use_merchant
+from payfast.security_checks import local_checks
+from payfast.exceptions import PayFastQueueFull
+from payfast.idempotency import NEW, IN_PROGRESS, itn_store
+
+logger = logging.getLogger('payfast.itn')
+
+# PayFast's ITNs are a few kilobytes.
+MAX_BODY_SIZE = 65536
+
+
+
+
+def parse_body(body: bytes, content_type: str = '') -> dict:
+    """
+    Returns the ITN data of a request body. PayFast posts the data
+    urlencoded; JSON is accepted as well.
+    """
+    if content_type.split(';')[0].strip() == 'application/json':
+        data = json.loads(body or b'{}')
+        if not isinstance(data, dict):
+            raise ValueError('Expected a JSON object.')
+        return {key: '' if value is None else str(value) for key, value in data.items()}
+    return dict(parse_qsl(body.decode('utf-8'), keep_blank_values=True))
+
+
+
+
+class ITNReceiver:
+
+    def __init__(self, trusted_proxies=None, max_body_size=MAX_BODY_SIZE):
+        """
+        :param trusted_proxies: Defaults to ``TRUSTED_PROXIES``.
+        :param max_body_size: Larger requests get a 413 response.
+        """
+        self._trusted_proxies = trusted_proxies
+        self.max_body_size = max_body_size
+
+
+    @property
+    def trusted_proxies(self):
+        if self._trusted_proxies is None:
+            return settings.TRUSTED_PROXIES
+        return self._trusted_proxies
+
+
+    def get_ip(self, x_forwarded_for, remote_addr):
+        return get_client_ip(x_forwarded_for, remote_addr, self.trusted_proxies)
+
+
+    def begin(self, data):
+        """
+        Returns the status code for a copy of an ITN, or ``None`` if the ITN
+        must be processed.
+        """
+        state = itn_store.begin(data)
+        if state == NEW:
+            return None
+        pf_payment_id = data.get('pf_payment_id', None)
+        logger.info(f'Got a copy of PayFast ITN "{pf_payment_id}" ({state}).')
+        if state == IN_PROGRESS:
+            return HTTPStatus.SERVICE_UNAVAILABLE
+        return HTTPStatus.OK
+
+
+    def end(self, data, status):
+        if status == HTTPStatus.OK:
+            itn_store.finish(data)
+        else:
+            itn_store.release(data)
+        return status
+
+
+    def receive(self, data, ipaddr=None) -> int:
+        """
+        Process the ITN data. Returns the status code of the response.
+        """
+        status = self.begin(data)
+        if status is not None:
+            return status
+        try:
+            merchant = merchants.get(data.get('merchant_id', None))
+            with use_merchant(merchant):
+                if settings.ITN_MODE == 'queue':
+                    status = self.enqueue(data, ipaddr)
+                else:
+                    process_itn(data, payfast_ipaddr=ipaddr)
+                    status = HTTPStatus.OK
+        except BaseException:
+            itn_store.release(data)
+            raise
+        return self.end(data, status)
+
+
+    async def areceive(self, data, ipaddr=None) -> int:
+        """
+        Same as ``receive`` for asyncio.
+        """
+        status = self.begin(data)
+        if status is not None:
+            return status
+        try:
+            merchant = merchants.get(data.get('merchant_id', None))
+            with use_merchant(merchant):
+                if settings.ITN_MODE == 'queue':
+                    status = await run_in_thread(self.enqueue, data, ipaddr)
+                else:
+                    await aprocess_itn(data, payfast_ipaddr=ipaddr)
+                    status = HTTPStatus.OK
+        except BaseException:
+            itn_store.release(data)
+            raise
+        return self.end(data, status)
+
+
+    def enqueue(self, data, ipaddr=None) -> int:
+        """
+        Queue the ITN for the workers if the signature and the IP address
+        are valid. Returns 503 if the queue is full so that PayFast sends
+        the ITN again later.
+        """
+        from payfast.queue import itn_queue
+
+        passed, results = local_checks(data, ipaddr)
+        if not passed:
+            logger.warning(
+                f'Not queueing PayFast ITN "{data.get("pf_payment_id", None)}" '
+                f'from {ipaddr}; security checks: {results}.'
+            )
+            return HTTPStatus.OK
+        itn_queue.start()
+        try:
+            itn_queue.enqueue(data, ipaddr)
+        except PayFastQueueFull as exc:
+            logger.warning(str(exc))
+            return HTTPStatus.SERVICE_UNAVAILABLE
+        return HTTPStatus.OK
+
+
+    def check_request(self, method, content_length):
+        """
+        Returns the status code and the error message for requests that
+        are not processed, or ``None``.
+        """
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, f'Method "{method}" not allowed.'
+        if content_length is not None and content_length > self.max_body_size:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request body too large.'
+        return None
+
+
+    def make_response(self, status, detail=None):
+        """
+        Returns the status line, the headers and the body of a response.
+        """
+        status = HTTPStatus(status)
+        body = {} if detail is None else {'detail': detail}
+        body = json.dumps(body).encode('utf-8')
+        headers = [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+        ]
+        if status == HTTPStatus.METHOD_NOT_ALLOWED:
+            headers.append(('Allow', 'POST'))
+        return status, headers, body
+
+
+    def __call__(self, *args):
+        # WSGI apps get (environ, start_response); ASGI apps get
+        # (scope, receive, send).
+        if len(args) == 3:
+            return self.asgi(*args)
+        return self.wsgi(*args)
+
+
+    def wsgi(self, environ, start_response):
+        status, detail = self.handle_wsgi(environ)
+        status, headers, body = self.make_response(status, detail)
+        start_response(f'{status.value} {status.phrase}', headers)
+        return [body]
+
+
+    def handle_wsgi(self, environ):
+        try:
+            content_length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        error = self.check_request(environ.get('REQUEST_METHOD', 'GET'), content_length)
+        if error is not None:
+            return error
+        body = environ['wsgi.input'].read(content_length) if content_length else b''
+        try:
+            data = parse_body(body, environ.get('CONTENT_TYPE', ''))
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, 'Malformed request.'
+        logger.debug(json.dumps(data, indent=4))
+        ipaddr = self.get_ip(
+            environ.get('HTTP_X_FORWARDED_FOR', None),
+            environ.get('REMOTE_ADDR', None),
+        )
+        return self.receive(data, ipaddr), None
+
+
+    async def asgi(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Unsupported ASGI scope type "{scope["type"]}".')
+        status, detail = await self.handle_asgi(scope, receive)
+        status, headers, body = self.make_response(status, detail)
+        await send({
+            'type': 'http.response.start',
+            'status': status.value,
+            'headers': [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+    async def handle_asgi(self, scope, receive):
+        headers = {
+            name.decode('latin-1').lower(): value.decode('latin-1')
+            for name, value in scope.get('headers', [])
+        }
+        try:
+            content_length = int(headers.get('content-length', None) or 0)
+        except ValueError:
+            content_length = None
+        error = self.check_request(scope.get('method', 'GET'), content_length)
+        if error is not None:
+            return error
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return HTTPStatus.BAD_REQUEST, 'Client disconnected.'
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body_size:
+                return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request body too large.'
+            chunks.append(chunk)
+            more_body = message.get('more_body', False)
+        try:
+            data = parse_body(b''.join(chunks), headers.get('content-type', ''))
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, 'Malformed request.'
+        logger.debug(json.dumps(data, indent=4))
+        client = scope.get('client', None)
+        ipaddr = self.get_ip(
+            headers.get('x-forwarded-for', None),
+            client[0] if client else None,
+        )
+        return await self.areceive(data, ipaddr), None
+
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
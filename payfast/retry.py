@@ -0,0 +1,192 @@
+"""
+Retries with exponential backoff and jitter for requests to the PayFast API.
+
+Only idempotent requests are retried:
+
+- ``GET`` requests, e.g. ``/subscriptions/:token/fetch``, ``/process/query``
+  and ``/transactions/history``.
+- ``POST /subscriptions/:token/adhoc`` charges, but only when the payload
+  includes an ``m_payment_id`` that serves as the idempotency key.
+
+Exposes the following settings:
+
+.. data:: RETRY_MAX_ATTEMPTS
+
+.. data:: RETRY_BACKOFF
+
+.. data:: RETRY_BACKOFF_MAX
+
+.. data:: RETRY_DEADLINE
+"""
+import time
+import random
+import logging
+import threading
+from functools import lru_cache
+from collections import Counter
+from email.utils import parsedate_to_datetime
+
+from payfast.conf import settings
+
+logger = logging.getLogger('payfast.api')
+
+
+
+
+class RetryStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+
+    def snapshot(self) -> dict:
+        """
+        Counters:
+
+        - ``requests``: requests made through the policy.
+        - ``attempts``: HTTP attempts including the first attempt.
+        - ``retries``: attempts that were retries.
+        - ``retries:<reason>``: retries by reason, e.g. ``retries:503``.
+        - ``exhausted``: retryable requests that ran out of attempts or time.
+        - ``not_idempotent``: requests that were not eligible for retries.
+        """
+        with self._lock:
+            return dict(self.counters)
+
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+
+
+
+
+class RetryPolicy:
+
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+    IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+
+    def __init__(
+        self,
+        max_attempts=None,
+        backoff=None,
+        backoff_max=None,
+        deadline=None,
+        jitter=True,
+    ):
+        """
+        :param max_attempts: The maximum number of attempts including the
+                             first attempt. Use 1 to disable retries.
+        :param backoff: The base delay in seconds. The delay before retry
+                        ``n`` is ``backoff * 2 ** (n - 1)`` capped at
+                        ``backoff_max``.
+        :param deadline: The total time budget in seconds for all attempts.
+        :param jitter: Use "full jitter", i.e. a random delay between zero
+                       and the exponential delay.
+        """
+        if max_attempts is None:
+            max_attempts = settings.RETRY_MAX_ATTEMPTS
+        if backoff is None:
+            backoff = settings.RETRY_BACKOFF
+        if backoff_max is None:
+            backoff_max = settings.RETRY_BACKOFF_MAX
+        if deadline is None:
+            deadline = settings.RETRY_DEADLINE
+        self.max_attempts = max(int(max_attempts), 1)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.jitter = jitter
+        self.stats = RetryStats()
+
+
+    def is_idempotent(self, method, uri, payload=None) -> bool:
+        method = method.upper()
+        if method in self.IDEMPOTENT_METHODS:
+            return True
+        if method == 'POST' and uri.rstrip('/').endswith('/adhoc'):
+            # Never retry a charge blindly; PayFast uses the
+            # "m_payment_id" to detect duplicate charges.
+            if isinstance(payload, dict) and payload.get('m_payment_id'):
+                return True
+        return False
+
+
+    def get_timeout(self, started) -> float:
+        """
+        The timeout for the next attempt so that the deadline is respected.
+        """
+        remaining = self.deadline - (time.monotonic() - started)
+        return max(min(settings.API_TIMEOUT, remaining), 0.001)
+
+
+    def get_retry_after(self, response):
+        if response is None:
+            return None
+        value = response.headers.get('Retry-After', None)
+        if not value:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(retry_at.timestamp() - time.time(), 0)
+
+
+    def get_delay(self, attempt, response=None) -> float:
+        retry_after = self.get_retry_after(response)
+        if retry_after is not None:
+            return retry_after
+        delay = min(self.backoff * (2 ** (attempt - 1)), self.backoff_max)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+    def next_delay(self, attempt, started, reason, response=None):
+        """
+        Returns the number of seconds to wait before the next attempt or
+        ``None`` if the request must not be retried.
+
+        :param attempt: The number of the attempt that just failed.
+        :param started: The ``time.monotonic()`` value when the first
+                        attempt started.
+        :param reason: Why the attempt failed, e.g. "connection" or the
+                       HTTP status code.
+        """
+        if attempt >= self.max_attempts:
+            self.stats.incr('exhausted')
+            return None
+        delay = self.get_delay(attempt, response=response)
+        elapsed = time.monotonic() - started
+        if elapsed + delay >= self.deadline:
+            self.stats.incr('exhausted')
+            return None
+        self.stats.incr('retries')
+        self.stats.incr(f'retries:{reason}')
+        logger.info(
+            f'Retrying PayFast API request in {delay:.2f}s '
+            f'(attempt {attempt + 1} of {self.max_attempts}, reason: {reason}).'
+        )
+        return delay
+
+
+
+
+@lru_cache(maxsize=None)
+def get_default_policy() -> RetryPolicy:
+    """
+    Returns the shared ``RetryPolicy``, built on first use.
+    """
+    return RetryPolicy()
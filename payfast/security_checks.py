@@ -1,19 +1,33 @@
+import time
+import asyncio
 import hashlib
 import logging
+import threading
 from decimal import Decimal
-from ipaddress import ip_network, ip_address
+from weakref import WeakKeyDictionary
+from collections import Counter, OrderedDict, deque
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
 
 from payfast.conf import settings
+from payfast.utils import run_in_thread
 from payfast.signature import make_signature, make_querystring
+from payfast.merchants import current_merchant
+from payfast.allowlist import get_allowlist
 
 
 
 
 def signature_is_valid(posted_signature, payfast_data):
-    querystring = make_querystring(payfast_data)
-    signature = hashlib.md5(querystring.encode()).hexdigest()
+    signer = current_merchant().signer
+    signature = signer.signature(payfast_data)
     if posted_signature == signature:
         return True
     return False
@@ -24,23 +38,13 @@ def signature_is_valid(posted_signature, payfast_data):
 def request_is_from_payfast(ip_string):
     """
     Check that the notification has come from a valid PayFast domain.
-    """
-    valid_networks = settings.PAYFAST_NETWORKS
-    valid_ips = settings.PAYFAST_IP_LIST
-    try:
-        ip = ip_address(ip_string)
-    except ValueError:
-        # ValueError: <value> does not appear to be an IPv4 or IPv6 address
-        # We are unable to determine whether or not the request is from
-        # PayFast. Play it safe and return False.
-        return False, ip
+    Returns whether it has and the parsed IP address.
 
-    if ip in valid_ips:
-        return True, ip
-    for net in valid_networks:
-        if ip in net:
-            return True, ip
-    return False, ip
+    The address is ``None`` if it is invalid. We are unable to determine
+    whether or not the request is from PayFast so play it safe and return
+    False.
+    """
+    return get_allowlist().check(ip_string)
 
 
 
@@ -65,18 +69,311 @@ def payment_data_is_valid(total, amount_gross):
 
 
 
+class ValidateClient:
+    """
+    Sends the data of ITNs to PayFast's validation endpoint (security check
+    4). Connections are kept alive in a pool, the connect and read times
+    are bounded and failed requests are retried a few times; the request
+    is read-only so it is safe to retry.
+
+    ``VALID`` results can be cached for ``VALIDATE_CACHE_TTL`` seconds so
+    that replays of an ITN (e.g. PayFast's retries) are not validated
+    again. They are cached by merchant and signature (the signature is
+    checked first, see ``ITN.get_checks``), so the cache doesn't hold the
+    passphrase; data without a signature is not cached.
+    """
+
+    def __init__(
+        self,
+        url=None,
+        connect_timeout=None,
+        read_timeout=None,
+        retries=None,
+        cache_ttl=None,
+        cache_size=1024,
+        adapter=None,
+    ):
+        """
+        The settings are used for the arguments that are ``None``; see
+        ``VALIDATE_URL``, ``VALIDATE_CONNECT_TIMEOUT``,
+        ``VALIDATE_READ_TIMEOUT``, ``VALIDATE_RETRIES`` and
+        ``VALIDATE_CACHE_TTL``.
+        """
+        self._url = url
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._retries = retries
+        self._cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._adapter = adapter
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cache = OrderedDict()
+        # httpx clients can't be shared between event loops.
+        self._async_clients = WeakKeyDictionary()
+        self.counters = Counter()
+        self.latencies = deque(maxlen=1000)
+
+
+    @property
+    def url(self):
+        return self._url or settings.VALIDATE_URL
+
+
+    @property
+    def timeout(self) -> tuple:
+        connect_timeout = self._connect_timeout
+        if connect_timeout is None:
+            connect_timeout = settings.VALIDATE_CONNECT_TIMEOUT
+        read_timeout = self._read_timeout
+        if read_timeout is None:
+            read_timeout = settings.VALIDATE_READ_TIMEOUT
+        return (connect_timeout, read_timeout)
+
+
+    @property
+    def cache_ttl(self) -> float:
+        if self._cache_ttl is None:
+            return settings.VALIDATE_CACHE_TTL
+        return self._cache_ttl
+
+
+    def make_adapter(self) -> HTTPAdapter:
+        retries = self._retries
+        if retries is None:
+            retries = settings.VALIDATE_RETRIES
+        return HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.POOL_MAXSIZE,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=0.2,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=frozenset({'POST'}),
+                raise_on_status=False,
+            ),
+        )
+
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        A session for the current thread. The sessions of all threads share
+        one connection pool.
+        """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            with self._lock:
+                if self._adapter is None:
+                    self._adapter = self.make_adapter()
+            session = requests.Session()
+            session.mount('https://', self._adapter)
+            session.mount('http://', self._adapter)
+            session.headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            self._local.session = session
+        return session
+
+
+    def count(self, counter, value=1):
+        with self._lock:
+            self.counters[counter] += value
+
+
+    def cache_key(self, payfast_data):
+        signature = payfast_data.get('signature', None)
+        if not signature:
+            return None
+        return (str(current_merchant().merchant_id), signature)
+
+
+    def cached(self, key) -> bool:
+        if key is None or self.cache_ttl <= 0:
+            return False
+        with self._lock:
+            expires_at = self._cache.get(key, None)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._cache[key]
+                return False
+            self._cache.move_to_end(key)
+            self.counters['cache_hits'] += 1
+            return True
+
+
+    def remember(self, key):
+        with self._lock:
+            self._cache[key] = time.monotonic() + self.cache_ttl
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+    def validate(self, payfast_data) -> bool:
+        """
+        Returns whether PayFast says the data is valid. Raises
+        ``requests.RequestException`` if PayFast can't be reached so that
+        the ITN can be retried.
+        """
+        key = self.cache_key(payfast_data)
+        if self.cached(key):
+            return True
+        querystring = make_querystring(payfast_data)
+        started = time.perf_counter()
+        try:
+            response = self.session.post(
+                self.url,
+                data=querystring,
+                timeout=self.timeout,
+            )
+        except requests.RequestException:
+            self.count('errors')
+            raise
+        finally:
+            self.record(started)
+        return self.check_response(key, response.text)
+
+
+    def make_async_client(self):
+        connect_timeout, read_timeout = self.timeout
+        retries = self._retries
+        if retries is None:
+            retries = settings.VALIDATE_RETRIES
+        max_connections = settings.POOL_MAXSIZE
+        if not settings.POOL_BLOCK:
+            # Like urllib3, open extra connections when the pool is
+            # exhausted instead of waiting for one to be released.
+            max_connections = None
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            # httpx only retries failed connections.
+            transport=httpx.AsyncHTTPTransport(
+                retries=retries,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=settings.POOL_MAXSIZE,
+                ),
+            ),
+            headers={'Content-Type': 'application/x-www-form-urlencoded'},
+        )
+
+
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop, None)
+            if client is None:
+                client = self.make_async_client()
+                self._async_clients[loop] = client
+        return client
+
+
+    async def avalidate(self, payfast_data) -> bool:
+        """
+        Same as ``validate``, with ``httpx`` if it is installed. Otherwise
+        ``validate`` runs in a thread.
+        """
+        if httpx is None:
+            return await run_in_thread(self.validate, payfast_data)
+        key = self.cache_key(payfast_data)
+        if self.cached(key):
+            return True
+        querystring = make_querystring(payfast_data)
+        started = time.perf_counter()
+        try:
+            response = await self.async_client().post(self.url, content=querystring)
+        except httpx.HTTPError:
+            self.count('errors')
+            raise
+        finally:
+            self.record(started)
+        return self.check_response(key, response.text)
+
+
+    def record(self, started):
+        latency = time.perf_counter() - started
+        with self._lock:
+            self.counters['requests'] += 1
+            self.counters['latency'] += latency
+            self.latencies.append(latency)
+
+
+    def check_response(self, key, text) -> bool:
+        if text == 'VALID':
+            logging.info('Got "VALID" response text from PayFast for security check.')
+            self.count('valid')
+            if key is not None and self.cache_ttl > 0:
+                self.remember(key)
+            return True
+        self.count('invalid')
+        return False
+
+
+    def metrics(self) -> dict:
+        """
+        - ``requests``: requests sent to PayFast, of which ``valid``,
+          ``invalid`` and ``errors``.
+        - ``cache_hits``: results that came from the cache.
+        - ``latency``: total seconds spent waiting for PayFast.
+        - ``p50`` and ``p99``: the latency percentiles of the last 1000
+          requests, in seconds.
+        """
+        with self._lock:
+            metrics = dict(self.counters)
+            latencies = sorted(self.latencies)
+        if latencies:
+            metrics['p50'] = latencies[int(len(latencies) * 0.5)]
+            metrics['p99'] = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+        return metrics
+
+
+    def reset(self):
+        with self._lock:
+            self._cache.clear()
+            self.counters.clear()
+            self.latencies.clear()
+
+
+
+
+validate_client = ValidateClient()
+
+
+
+
 def send_validation_request(payfast_data):
     """
     Validate the data received from PayFast by contacting the PayFast server
-    to confirm the order details.
+    to confirm the order details. See ``ValidateClient``.
+    """
+    return validate_client.validate(payfast_data)
+
+
+
+
+async def asend_validation_request(payfast_data):
+    return await validate_client.avalidate(payfast_data)
+
+
+
+
+def local_checks(payfast_data, ip_string):
+    """
+    The checks that don't contact PayFast or call the merchant's callbacks:
+    the signature and the source IP address. Returns whether both passed
+    and the results of each.
     """
-    url = settings.VALIDATE_URL
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded'
+    signature = payfast_data.get('signature', None)
+    try:
+        check_one = signature_is_valid(signature, payfast_data)
+    except ValueError:
+        # Fields that are not in the signature order.
+        check_one = False
+    check_two = False
+    if ip_string:
+        check_two = request_is_from_payfast(ip_string)[0]
+    results = {
+        'check_one': check_one,
+        'check_two': check_two,
     }
-    querystring = make_querystring(payfast_data)
-    response = requests.post(url, data=querystring, headers=headers)
-    if response.text == 'VALID':
-        logging.info('Got "VALID" response text from PayFast for security check.')
-        return True
-    return False
+    return check_one and check_two, results
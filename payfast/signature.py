@@ -1,16 +1,257 @@
+import re
 import hashlib
-import urllib.parse
+from functools import lru_cache
 from urllib.parse import quote_plus
-from urllib.parse import urlencode
-from urllib.parse import urljoin as join
-from collections import OrderedDict
 
-from payfast.conf import settings
 
 
 
+# The order in which PayFast expects the fields in the signature string
+# when the fields are not sorted alphabetically.
+FIELD_ORDER = [
+    'merchant_id',
+    'merchant_key',
+    'return_url',
+    'cancel_url',
+    'notify_url',
 
-def make_querystring(payfast_data, salt=settings.SALT_PASSPHRASE, a12y=False):
+    'name_first',
+    'name_last',
+    'email_address',
+    'cell_number',
+
+    'm_payment_id',
+
+    # From the ITN
+    'pf_payment_id',
+    'payment_status',
+
+    'amount',
+    'item_name',
+    'item_description',
+
+    # From the ITN
+    'amount_gross',
+    'amount_fee',
+    'amount_net',
+
+    'custom_int1',
+    'custom_int2',
+    'custom_int3',
+    'custom_int4',
+    'custom_int5',
+    'custom_str1',
+    'custom_str2',
+    'custom_str3',
+    'custom_str4',
+    'custom_str5',
+
+    'email_confirmation',
+    'confirmation_address',
+
+    'payment_method',
+
+    'subscription_type',
+    'token',
+    'billing_date',
+    'recurring_amount',
+    'frequency',
+    'cycles',
+    'subscription_notify_email',
+    'subscription_notify_webhook',
+    'subscription_notify_buyer',
+
+    # From ITN
+    'signature',
+]
+
+FIELD_RANK = {field: rank for rank, field in enumerate(FIELD_ORDER)}
+
+# Values that ``quote_plus`` would leave untouched. Most values (amounts,
+# IDs, tokens, dates) match this, which lets us skip quoting them.
+is_safe = re.compile(r'[A-Za-z0-9_.~-]*\Z').match
+
+
+
+
+def quote(value) -> bytes:
+    if is_safe(value):
+        return value.encode()
+    return quote_plus(value).encode()
+
+# "key=" for every known field, ready to be joined with the quoted value.
+FIELD_PREFIX = {
+    field: (quote_plus(field) + '=').encode() for field in FIELD_ORDER
+}
+
+
+
+
+class Signer:
+    """
+    Builds PayFast signature strings and signatures for one passphrase.
+
+    The output is byte-identical to ``urlencode`` of the ordered pairs
+    (see ``make_querystring``) but skips the intermediate dictionary and
+    the repeated sorting work. Build it once per merchant with
+    ``get_signer``.
+    """
+
+    def __init__(self, passphrase):
+        self.passphrase = passphrase
+        # The passphrase is always last in the ordered mode.
+        self.tail = b'&passphrase=' + quote_plus(str(passphrase)).encode()
+        self.passphrase_pair = self.tail[1:]
+
+
+    def sort_keys(self, keys, a12y=False):
+        if a12y:
+            keys = list(keys)
+            keys.append('passphrase')
+            return sorted(keys)
+        try:
+            return sorted(keys, key=FIELD_RANK.__getitem__)
+        except KeyError as exc:
+            # Same as "list.index" used to raise.
+            raise ValueError(f'{exc.args[0]!r} is not in list') from None
+
+
+    def encode_pairs(self, payfast_data, a12y=False, exclude=()) -> list:
+        """
+        Returns the encoded ``key=value`` pairs in order. The passphrase is
+        only included in the a12y mode.
+        """
+        parts = []
+        append = parts.append
+        for key in self.sort_keys(payfast_data.keys(), a12y=a12y):
+            if key == 'signature' or key in exclude:
+                continue
+            if key == 'passphrase':
+                if self.passphrase is not None:
+                    append(self.passphrase_pair)
+                continue
+            value = payfast_data[key]
+            if value is None:
+                continue
+            prefix = FIELD_PREFIX.get(key, None)
+            if prefix is None:
+                prefix = (quote_plus(key) + '=').encode()
+            append(prefix + quote(str(value)))
+        return parts
+
+
+    def encode(self, payfast_data, a12y=False) -> bytes:
+        """
+        Returns the signature string as bytes, including the passphrase.
+        """
+        encoded = b'&'.join(self.encode_pairs(payfast_data, a12y=a12y))
+        if not a12y:
+            if encoded:
+                encoded += self.tail
+            else:
+                encoded = self.passphrase_pair
+        return encoded
+
+
+    def querystring(self, payfast_data, a12y=False) -> str:
+        return self.encode(payfast_data, a12y=a12y).decode()
+
+
+    def signature(self, payfast_data, a12y=False) -> str:
+        encoded = self.encode(payfast_data, a12y=a12y)
+        return hashlib.md5(encoded).hexdigest()
+
+
+    def sign(self, payfast_data) -> tuple:
+        """
+        Signs the data in the ordered mode. Returns the signature and the
+        encoded data without the passphrase, which is also the querystring
+        of the payment's URL (without the signature).
+        """
+        query = b'&'.join(self.encode_pairs(payfast_data))
+        encoded = self.passphrase_pair
+        if query:
+            encoded = query + self.tail
+        return hashlib.md5(encoded).hexdigest(), query
+
+
+
+
+# The merchant fields that are the same for all of a merchant's payments.
+# They are always first in the ordered mode.
+PREFIX_FIELDS = (
+    'merchant_id',
+    'merchant_key',
+    'return_url',
+    'cancel_url',
+    'notify_url',
+)
+
+
+
+
+class PrefixSigner:
+    """
+    Signs data in the ordered (non-a12y) mode for payments that share the
+    same merchant fields. The constant prefix is hashed once and a copy of
+    the md5 state is used for each payment so only the per-payment fields
+    are hashed.
+
+    Data with different merchant fields is signed in full, so the result
+    is always the same as ``Signer.signature``.
+    """
+
+    def __init__(self, signer, prefix_data):
+        self.signer = signer
+        self.prefix_data = {
+            field: prefix_data.get(field, None) for field in PREFIX_FIELDS
+        }
+        self.prefix = b'&'.join(signer.encode_pairs(self.prefix_data))
+        self.hasher = None
+        if self.prefix:
+            self.hasher = hashlib.md5(self.prefix)
+
+
+    def matches(self, payfast_data) -> bool:
+        for field, value in self.prefix_data.items():
+            if payfast_data.get(field, None) != value:
+                return False
+        return True
+
+
+    def signature(self, payfast_data, a12y=False) -> str:
+        if a12y:
+            return self.signer.signature(payfast_data, a12y=a12y)
+        return self.sign(payfast_data)[0]
+
+
+    def sign(self, payfast_data) -> tuple:
+        """
+        Same as ``Signer.sign``.
+        """
+        if self.hasher is None or not self.matches(payfast_data):
+            return self.signer.sign(payfast_data)
+        parts = self.signer.encode_pairs(payfast_data, exclude=PREFIX_FIELDS)
+        hasher = self.hasher.copy()
+        query = self.prefix
+        if parts:
+            suffix = b'&' + b'&'.join(parts)
+            hasher.update(suffix)
+            query += suffix
+        hasher.update(self.signer.tail)
+        return hasher.hexdigest(), query
+
+
+
+
+@lru_cache(maxsize=None)
+def get_signer(passphrase) -> Signer:
+    return Signer(passphrase)
+
+
+
+
+def make_querystring(payfast_data, salt=None, a12y=False):
     """
     List in format:
 
@@ -21,101 +262,19 @@ def make_querystring(payfast_data, salt=settings.SALT_PASSPHRASE, a12y=False):
             ('item_name', data['item_name']),
             ('passphrase', data['passphrase'])
         ]
-    """
-    correct_order = [
-        'merchant_id',
-        'merchant_key',
-        'return_url',
-        'cancel_url',
-        'notify_url',
-
-        'name_first',
-        'name_last',
-        'email_address',
-        'cell_number',
-
-        'm_payment_id',
-
-        # From the ITN
-        'pf_payment_id',
-        'payment_status',
-
-        'amount',
-        'item_name',
-        'item_description',
-
-        # From the ITN
-        'amount_gross',
-        'amount_fee',
-        'amount_net',
-
-        'custom_int1',
-        'custom_int2',
-        'custom_int3',
-        'custom_int4',
-        'custom_int5',
-        'custom_str1',
-        'custom_str2',
-        'custom_str3',
-        'custom_str4',
-        'custom_str5',
-
-        'email_confirmation',
-        'confirmation_address',
-
-        'payment_method',
-
-        'subscription_type',
-        'token',
-        'billing_date',
-        'recurring_amount',
-        'frequency',
-        'cycles',
-        'subscription_notify_email',
-        'subscription_notify_webhook',
-        'subscription_notify_buyer',
-
-        # From ITN
-        'signature',
-    ]
-    data = payfast_data
-    list_for_get_string = []
-    keys = list(payfast_data.keys())
-    sorted_keys = []
-
-    if a12y:
-        keys.append('passphrase')
-        sorted_keys = sorted(keys)
-    else:
-        sorted_keys = sorted(keys, key=correct_order.index)
-
-    for key in sorted_keys:
-        if key == 'signature':
-            continue
-        if key == 'passphrase':
-            value = salt
-        else:
-            value = payfast_data[key]
 
-        if value is not None:
-            value = str(value)
-            list_for_get_string.append(
-                (key, value),
-            )
-
-    if not a12y:
-        list_for_get_string.append(
-            ('passphrase', salt),
-        )
-    ordered_dict = OrderedDict(list_for_get_string)
-    get_string = urlencode(ordered_dict)
-    return get_string
+    ``salt`` defaults to the passphrase of the current merchant (see
+    ``payfast.merchants``).
+    """
+    if salt is None:
+        from payfast.merchants import current_merchant
+        salt = current_merchant().passphrase
+    return get_signer(salt).querystring(payfast_data, a12y=a12y)
 
 
 
 
 def make_signature(payfast_data, a12y=False):
-    querystring = make_querystring(payfast_data, a12y=a12y)
-    signature = hashlib.md5(querystring.encode()).hexdigest()
-    signature = signature.lower()
-    return signature
+    from payfast.merchants import current_merchant
+    signer = current_merchant().signer
+    return signer.signature(payfast_data, a12y=a12y)
@@ -0,0 +1,132 @@
+"""
+Request coalescing for concurrent identical requests.
+
+Concurrent callers that ask for the same key share one in-flight call and
+get its result, or its exception. Nothing is cached once the call is done.
+
+The caller that made the call gets the result itself; the other callers
+get shallow copies of it, so that one caller's changes to e.g. a
+``Subscription`` don't leak to the others, and copies of the exception.
+"""
+import copy
+import asyncio
+import threading
+from collections import Counter
+from weakref import WeakKeyDictionary
+
+
+
+
+def copy_exception(exc):
+    """
+    A copy of the shared exception for another caller to raise, so that
+    the callers don't add their frames to one traceback. The original
+    exception, with the traceback of the call, is the copy's cause.
+    """
+    cls = type(exc)
+    try:
+        # Without calling __init__, whose arguments may differ from args.
+        copied = cls.__new__(cls, *exc.args)
+        copied.args = exc.args
+        copied.__dict__.update(getattr(exc, '__dict__', {}))
+    except Exception:
+        return exc.with_traceback(None)
+    copied.__cause__ = exc
+    return copied
+
+
+
+
+class Call:
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+
+
+class SingleFlight:
+    """
+    For threaded callers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = Counter()
+
+
+    def do(self, key, function, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key, None)
+            leader = call is None
+            if leader:
+                call = Call()
+                self._calls[key] = call
+            self.stats['calls'] += 1
+            if not leader:
+                self.stats['shared'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.exception is not None:
+                raise copy_exception(call.exception)
+            return copy.copy(call.result)
+
+        try:
+            call.result = function(*args, **kwargs)
+        except BaseException as exc:
+            call.exception = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+
+
+class AsyncSingleFlight:
+    """
+    For ``asyncio`` callers. Calls are coalesced per event loop.
+    """
+
+    def __init__(self):
+        self._calls = WeakKeyDictionary()
+        self.stats = Counter()
+
+
+    async def do(self, key, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        task = calls.get(key, None)
+        self.stats['calls'] += 1
+        leader = task is None
+        if leader:
+            task = loop.create_task(function(*args, **kwargs))
+            calls[key] = task
+
+            def forget(task):
+                if calls.get(key, None) is task:
+                    del calls[key]
+            task.add_done_callback(forget)
+        else:
+            self.stats['shared'] += 1
+        # Don't let one caller's cancellation cancel the call for the
+        # other callers.
+        if leader:
+            return await asyncio.shield(task)
+        try:
+            result = await asyncio.shield(task)
+        except Exception as exc:
+            raise copy_exception(exc)
+        return copy.copy(result)
+
+
+
+
+flight = SingleFlight()
+async_flight = AsyncSingleFlight()
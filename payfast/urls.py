@@ -6,8 +6,14 @@ try:
 
     app_name = 'payfast'
 
+    # Without Django REST framework, the ITNs go to the async view.
+    if views.status is None:
+        notify_view = views.notify_endpoint
+    else:
+        notify_view = views.NotifyEndpoint.as_view()
+
     urlpatterns = [
-        path('notify/', views.NotifyEndpoint.as_view(), name='notify_url'),
+        path('notify/', notify_view, name='notify_url'),
         path('cancel/', views.cancel_endpoint, name='cancel_url'),
         path('return/', views.return_endpoint, name='return_url'),
         path('sandbox/', views.sandbox, name='sandbox'),
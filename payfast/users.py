@@ -0,0 +1,198 @@
+"""
+Resolves the Django users of payments and ITNs.
+
+A payment fills in ``name_first``, ``name_last`` and ``email_address`` from
+the user with ``user_id``. To avoid a query per payment:
+
+- pass the user (a user object or a dictionary with ``first_name``,
+  ``last_name`` and ``email``) as ``user``, or supply the three fields;
+  the database is not queried then;
+- prefetch the users of many payments with one ``in_bulk`` query::
+
+      with resolver.prefetch(user_ids):
+          payments = [payfast.payment(...) for ...]
+
+  ``PaymentBatch`` does this for every chunk of specs;
+- set ``USER_CACHE_SIZE`` to keep the contact fields of recently resolved
+  users for ``USER_CACHE_TIMEOUT`` seconds.
+
+Prefetched users are context-local (see ``contextvars``), so a prefetch
+also works as a request-scoped cache.
+
+Exposes the following settings:
+
+.. data:: USER_CACHE_SIZE
+
+.. data:: USER_CACHE_TIMEOUT
+"""
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from payfast.conf import settings
+
+CONTACT_FIELDS = ('first_name', 'last_name', 'email')
+
+_prefetched = ContextVar('payfast_users', default=None)
+
+
+
+
+def get_user_model():
+    """
+    Returns the Django user model, or ``None`` if Django is not installed.
+    """
+    try:
+        from django.contrib.auth import get_user_model
+    except ImportError:
+        return None
+    return get_user_model()
+
+
+
+
+def get_contact(user) -> dict:
+    """
+    The contact fields of a user object or dictionary.
+    """
+    if isinstance(user, dict):
+        return {field: user.get(field, None) for field in CONTACT_FIELDS}
+    return {field: getattr(user, field, None) for field in CONTACT_FIELDS}
+
+
+
+
+class UserResolver:
+
+    def __init__(self, cache_size=None, timeout=None):
+        """
+        :param cache_size: The number of users to keep the contact fields
+                           of. Defaults to ``USER_CACHE_SIZE``.
+        :param timeout: Defaults to ``USER_CACHE_TIMEOUT``.
+        """
+        self._cache_size = cache_size
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+
+
+    @property
+    def cache_size(self) -> int:
+        if self._cache_size is None:
+            return settings.USER_CACHE_SIZE
+        return self._cache_size
+
+
+    @property
+    def timeout(self) -> int:
+        if self._timeout is None:
+            return settings.USER_CACHE_TIMEOUT
+        return self._timeout
+
+
+    @contextmanager
+    def prefetch(self, user_ids):
+        """
+        Fetch the users with one query and use them in this context.
+        Yields the users by (string) ID.
+        """
+        users = dict(_prefetched.get() or {})
+        missing = {str(user_id) for user_id in user_ids if user_id}
+        missing.difference_update(users)
+        User = get_user_model() if missing else None
+        if User is not None:
+            for pk, user in User.objects.in_bulk(list(missing)).items():
+                users[str(pk)] = user
+                self.remember(pk, user)
+        token = _prefetched.set(users)
+        try:
+            yield users
+        finally:
+            _prefetched.reset(token)
+
+
+    def get_user(self, user_id):
+        """
+        Returns the user object, or ``None`` if there is no such user.
+        """
+        if not user_id:
+            return None
+        users = _prefetched.get()
+        if users is not None and str(user_id) in users:
+            return users[str(user_id)]
+        User = get_user_model()
+        if User is None:
+            return None
+        try:
+            user = User.objects.get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        self.remember(user_id, user)
+        return user
+
+
+    def resolve(self, user_id, user=None) -> tuple:
+        """
+        Returns the user (if there is one to return without a query from
+        the cache) and the user's contact fields, or ``None``.
+        """
+        if user is not None:
+            return user, get_contact(user)
+        if not user_id:
+            return None, None
+        users = _prefetched.get()
+        if users is not None and str(user_id) in users:
+            user = users[str(user_id)]
+            return user, get_contact(user)
+        contact = self.recall(user_id)
+        if contact is not None:
+            return None, contact
+        user = self.get_user(user_id)
+        if user is None:
+            return None, None
+        return user, get_contact(user)
+
+
+    def remember(self, user_id, user):
+        cache_size = self.cache_size
+        if not cache_size:
+            return
+        expires_at = time.monotonic() + self.timeout
+        with self._lock:
+            self._cache[str(user_id)] = (expires_at, get_contact(user))
+            self._cache.move_to_end(str(user_id))
+            while len(self._cache) > cache_size:
+                self._cache.popitem(last=False)
+
+
+    def recall(self, user_id):
+        with self._lock:
+            item = self._cache.get(str(user_id), None)
+            if item is None:
+                return None
+            expires_at, contact = item
+            if expires_at <= time.monotonic():
+                del self._cache[str(user_id)]
+                return None
+            self._cache.move_to_end(str(user_id))
+            return contact
+
+
+    def forget(self, user_id):
+        """
+        Remove a user from the cache, e.g. when the user's details change.
+        """
+        with self._lock:
+            self._cache.pop(str(user_id), None)
+
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+
+
+resolver = UserResolver()
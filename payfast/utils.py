@@ -1,9 +1,13 @@
 import os
 import csv
 import copy
+import asyncio
+import functools
+import contextvars
 from io import StringIO
 from decimal import Decimal
 from urllib.parse import urljoin as join
+from urllib.parse import urlsplit
 
 from dateutil.relativedelta import relativedelta
 
@@ -23,18 +27,125 @@ def urljoin(parts):
 
 
 
+def get_endpoint(uri) -> str:
+    """
+    Normalize an API URI to the endpoint that it calls by dropping the
+    tokens and IDs, e.g. ``/subscriptions/:token/fetch`` becomes
+    ``subscriptions/fetch``.
+    """
+    path = urlsplit(uri).path
+    parts = [part for part in path.split('/') if part.isalpha()]
+    return '/'.join(parts)
+
+
+
+
+def get_client_ip(x_forwarded_for, remote_addr, trusted_proxies=None):
+    """
+    :param trusted_proxies: The number of reverse proxies in front of the
+                            app. Each proxy appends the address it got the
+                            request from to ``X-Forwarded-For``, so the
+                            client is that many hops from the right of the
+                            chain (with ``REMOTE_ADDR`` as the last hop).
+                            ``None`` uses the leftmost address, which the
+                            client can spoof. If the chain is shorter than
+                            that, the request didn't come through all of
+                            the proxies and ``remote_addr`` is returned.
+    """
+    if not x_forwarded_for:
+        return remote_addr
+    chain = [addr.strip() for addr in x_forwarded_for.split(',')]
+    if trusted_proxies is None:
+        return chain[0]
+    if remote_addr:
+        chain.append(remote_addr)
+    if len(chain) <= trusted_proxies:
+        # The leftmost addresses would be the ones that the client sent.
+        return remote_addr
+    return chain[len(chain) - 1 - trusted_proxies]
+
+
+
+
 def get_ip(request):
-    addr = None
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        addr = x_forwarded_for.split(',')[0]
-    else:
-        addr = request.META.get('REMOTE_ADDR')
+    """
+    The address is parsed once per request. See ``TRUSTED_PROXIES``.
+    """
+    addr = getattr(request, '_payfast_ip', None)
+    if addr is None:
+        addr = get_client_ip(
+            request.META.get('HTTP_X_FORWARDED_FOR'),
+            request.META.get('REMOTE_ADDR'),
+            settings.TRUSTED_PROXIES,
+        )
+        request._payfast_ip = addr
     return addr
 
 
 
 
+@functools.lru_cache(maxsize=None)
+def get_django_db():
+    """
+    Returns ``django.apps.apps`` and ``django.db``, or ``None`` if Django
+    is not installed. The import is only tried once.
+    """
+    try:
+        from django import db
+        from django.apps import apps
+    except ImportError:
+        return None
+    return apps, db
+
+
+
+
+def close_old_connections():
+    """
+    Close this thread's Django database connections that are unusable or
+    older than ``CONN_MAX_AGE``, as Django does before and after each
+    request.
+    """
+    django_db = get_django_db()
+    if django_db is None:
+        return
+    apps, db = django_db
+    if apps.ready:
+        db.close_old_connections()
+
+
+
+
+def call_in_worker(function, *args, **kwargs):
+    """
+    Calls the function on a pool thread. The merchant's callbacks usually
+    query the database and the thread outlives the request, so its stale
+    connections are closed before and after the call, as Django does
+    around each request.
+    """
+    close_old_connections()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+
+
+async def run_in_thread(function, *args, **kwargs):
+    """
+    Runs the function in the event loop's default executor with the
+    current context (e.g. the merchant), like ``asyncio.to_thread`` on
+    Python 3.9+. See ``call_in_worker``.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, call_in_worker, function, *args, **kwargs)
+    return await loop.run_in_executor(None, call)
+
+
+
+
 def prorate(amount, start, end, usage=False) -> Decimal:
     """
     (days_left / total_days) * amount
@@ -155,7 +266,8 @@ def get_freq_name(freq: int):
 
 
 def make_key(token):
-    namespace = settings.CACHE_KEY_PREFIX
+    from payfast.merchants import current_merchant
+    namespace = current_merchant().cache_key_prefix
     token = str(token)
     token = token.replace('-', '')
     key = f'{namespace}:subscription:{token}'
@@ -165,8 +277,8 @@ def make_key(token):
 
 
 def cache_bust(token):
-    from payfast import PayFast
-    payfast = PayFast()
+    from payfast.clients import get_payfast
+    payfast = get_payfast()
 
     try:
         from django.core.cache import cache
@@ -181,3 +293,27 @@ def cache_bust(token):
     cache.delete(key)
 
     payfast.subs.get(token, cache=True)
+
+
+
+
+async def acache_bust(token, subscriptions):
+    """
+    The ``asyncio`` counterpart of ``cache_bust``.
+
+    :param subscriptions: The async subscriptions resource used to re-fetch
+                          the subscription after the cache key is deleted.
+    """
+    try:
+        from django.core.cache import cache
+        from django.apps import apps
+    except ImportError:
+        return
+
+    if not apps.ready:
+        return
+
+    key = make_key(token)
+    cache.delete(key)
+
+    await subscriptions.get(token, cache=True)
@@ -1,11 +1,25 @@
+"""
+Exposes the following settings:
+
+.. data:: VALIDATION
+"""
+import enum
 from decimal import Decimal
+from functools import lru_cache
 from typing import Optional, Union
 from datetime import datetime
 
+try:
+    from typing import Annotated, get_args, get_origin
+except ImportError:
+    # Python 3.8; pydantic depends on typing_extensions.
+    from typing_extensions import Annotated, get_args, get_origin
+
 import pydantic as dantic
 from pydantic import constr, conint
 
 from payfast import constants
+from payfast.conf import settings
 
 
 
@@ -14,37 +28,37 @@ class PaymentValidator(dantic.BaseModel):
 
     amount: str
     item_name: str
-    m_payment_id: str = None
-    item_description: str = None
+    m_payment_id: Optional[str] = None
+    item_description: Optional[str] = None
 
-    merchant_id: int = None
-    merchant_key: dantic.SecretStr = None
+    merchant_id: Optional[int] = None
+    merchant_key: Optional[dantic.SecretStr] = None
     # return_url: Optional[dantic.AnyHttpUrl] = None
     # cancel_url: Optional[dantic.AnyHttpUrl] = None
     # notify_url: Optional[dantic.AnyHttpUrl] = None
-    return_url: str = None
-    cancel_url: str = None
-    notify_url: str = None
-
-    name_first: str = None
-    name_last: str = None
-    email_address: str = None
-    cell_number: str = None
-
-    custom_int1: int = None
-    custom_int2: int = None
-    custom_int3: int = None
-    custom_int4: int = None
-    custom_int5: int = None
-
-    custom_str1: constr(max_length=255) = None
-    custom_str2: constr(max_length=255) = None
-    custom_str3: constr(max_length=255) = None
-    custom_str4: constr(max_length=255) = None
-    custom_str5: constr(max_length=255) = None
-
-    email_confirmation: Union[conint(ge=0, le=1), bool] = None
-    confirmation_address: str = None
+    return_url: Optional[str] = None
+    cancel_url: Optional[str] = None
+    notify_url: Optional[str] = None
+
+    name_first: Optional[str] = None
+    name_last: Optional[str] = None
+    email_address: Optional[str] = None
+    cell_number: Optional[str] = None
+
+    custom_int1: Optional[int] = None
+    custom_int2: Optional[int] = None
+    custom_int3: Optional[int] = None
+    custom_int4: Optional[int] = None
+    custom_int5: Optional[int] = None
+
+    custom_str1: Optional[constr(max_length=255)] = None
+    custom_str2: Optional[constr(max_length=255)] = None
+    custom_str3: Optional[constr(max_length=255)] = None
+    custom_str4: Optional[constr(max_length=255)] = None
+    custom_str5: Optional[constr(max_length=255)] = None
+
+    email_confirmation: Optional[Union[conint(ge=0, le=1), bool]] = None
+    confirmation_address: Optional[str] = None
     payment_method: constants.PaymentMethod
 
     signature: constr(min_length=32, max_length=32)
@@ -57,5 +71,190 @@ class SubscriptionPaymentValidator(PaymentValidator):
     cycles: conint(ge=0)
     subscription_type: constants.SubscriptionType
 
-    billing_date: Union[str, datetime] = None
-    recurring_amount: str = None
+    billing_date: Optional[Union[str, datetime]] = None
+    recurring_amount: Optional[str] = None
+
+
+
+
+class TokenizedSubValidator(PaymentValidator):
+    """
+    Tokenized subscriptions don't have a frequency, cycles or recurring
+    amount.
+    """
+    subscription_type: constants.SubscriptionType
+
+    billing_date: Optional[Union[str, datetime]] = None
+
+
+
+
+# Constraints of constrained types that the compiled validators check.
+CONSTRAINTS = ('min_length', 'max_length', 'gt', 'ge', 'lt', 'le')
+
+
+
+
+def get_fields(model):
+    """
+    Yields the name, type, extra constraints and whether the field is
+    required for every field of a pydantic 1 or 2 model.
+    """
+    fields = getattr(model, 'model_fields', None)
+    if fields is not None:
+        for name, field in fields.items():
+            yield name, field.annotation, field.metadata, field.is_required()
+        return
+    for name, field in model.__fields__.items():
+        yield name, field.outer_type_, [], field.required
+
+
+
+
+def get_limits(constraints) -> list:
+    limits = []
+    for constraint in constraints:
+        for name in CONSTRAINTS:
+            value = getattr(constraint, name, None)
+            if value is not None:
+                limits.append((name, value))
+        if getattr(constraint, 'regex', None) or getattr(constraint, 'pattern', None):
+            return None
+    return limits
+
+
+
+
+def within(value, limits) -> bool:
+    for name, limit in limits:
+        if name == 'min_length' and len(value) < limit:
+            return False
+        if name == 'max_length' and len(value) > limit:
+            return False
+        if name == 'gt' and not value > limit:
+            return False
+        if name == 'ge' and not value >= limit:
+            return False
+        if name == 'lt' and not value < limit:
+            return False
+        if name == 'le' and not value <= limit:
+            return False
+    return True
+
+
+
+
+def make_check(annotation, metadata=()):
+    """
+    Returns a function that returns ``True`` only if the value is certainly
+    valid for the type. Anything it doesn't understand is not certain.
+    """
+    if get_origin(annotation) is Union:
+        checks = [make_check(arg) for arg in get_args(annotation)]
+        return lambda value: any(check(value) for check in checks)
+    if get_origin(annotation) is Annotated:
+        annotation, *extra = get_args(annotation)
+        metadata = [*metadata, *extra]
+
+    if isinstance(annotation, type) and issubclass(annotation, enum.Enum):
+        values = frozenset(member.value for member in annotation)
+        return lambda value: isinstance(value, annotation) or value in values
+
+    # pydantic 1 constrained types are subclasses with the constraints as
+    # class attributes; pydantic 2 keeps them in the metadata.
+    limits = get_limits([annotation, *metadata])
+    if limits is None:
+        return lambda value: False
+    if annotation is bool:
+        return lambda value: value is True or value is False
+    if annotation is datetime:
+        return lambda value: isinstance(value, datetime)
+    if annotation is dantic.SecretStr:
+        return lambda value: isinstance(value, str)
+    if isinstance(annotation, type) and issubclass(annotation, str):
+        return lambda value: type(value) is str and within(value, limits)
+    if isinstance(annotation, type) and issubclass(annotation, int):
+        return lambda value: type(value) is int and within(value, limits)
+    return lambda value: False
+
+
+
+
+class CompiledValidator:
+    """
+    A checker generated from the fields of a pydantic model. Valid data,
+    which is nearly all of it, is checked without building the model.
+    Anything else goes through the model so that it gets the same
+    coercion and raises the same errors as the full validation.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.checks = [
+            (name, make_check(annotation, metadata), required)
+            for name, annotation, metadata, required in get_fields(model)
+        ]
+
+
+    def is_valid(self, data) -> bool:
+        for name, check, required in self.checks:
+            value = data.get(name, None)
+            if value is None:
+                if required:
+                    return False
+                continue
+            if not check(value):
+                return False
+        return True
+
+
+    def validate(self, data):
+        if not self.is_valid(data):
+            self.model(**data)
+
+
+
+
+@lru_cache(maxsize=None)
+def get_compiled_validator(model) -> CompiledValidator:
+    return CompiledValidator(model)
+
+
+
+
+def validate(model, data, mode=None):
+    """
+    Validate the data for PayFast with the model.
+
+    :param mode: ``full`` builds the pydantic model, ``compiled`` uses a
+                 ``CompiledValidator`` and ``off`` skips validation.
+                 Defaults to the ``VALIDATION`` setting.
+    """
+    if mode is None:
+        mode = settings.VALIDATION
+    if mode == 'full':
+        model(**data)
+    elif mode == 'compiled':
+        get_compiled_validator(model).validate(data)
+    elif mode != 'off':
+        raise ValueError(
+            f'"VALIDATION" must be "full", "compiled" or "off", not "{mode}".'
+        )
+
+
+
+
+def validate_many(model, payloads, mode=None):
+    """
+    Validate many payloads for PayFast with the same model. Raises the
+    error for the first invalid payload.
+    """
+    if mode is None:
+        mode = settings.VALIDATION
+    if mode == 'compiled':
+        validator = get_compiled_validator(model)
+        for data in payloads:
+            validator.validate(data)
+        return
+    for data in payloads:
+        validate(model, data, mode)
@@ -4,29 +4,30 @@ from functools import wraps
 from datetime import timedelta
 
 try:
-    from rest_framework import status
     from rest_framework.views import APIView
     from rest_framework.response import Response
 
+except ImportError:
+    # ``notify_endpoint`` doesn't need Django REST framework.
+    APIView = object
+    Response = None
+
+try:
     from django.shortcuts import render
-    from django.http import Http404
+    from django.http import Http404, JsonResponse
     from django.conf import settings as django_settings
 
 except ImportError:
-    status = None
-    APIView = None
-    Response = None
-
     render = None
     Http404 = None
+    JsonResponse = None
     django_settings = None
 
-from payfast import PayFast, constants, callbacks
+from payfast import constants
+from payfast.clients import get_payfast
 from payfast.utils import get_ip
-from payfast.conf import settings
-from payfast.itn import ITN
+from payfast.receivers import ITNReceiver, parse_body
 
-payfast = PayFast()
 logger = logging.getLogger('payfast.drf')
 
 
@@ -88,20 +89,39 @@ class NotifyEndpoint(APIView):
 
     def post(self, request, format=None):
         logger.debug(json.dumps(request.data, indent=4))
-        ipaddr = get_ip(request)
-        itn = ITN(request.data, payfast_ipaddr=ipaddr)
-        passed, security_check_results = itn.do_security_checks()
+        # Deduplicated, scoped to the merchant and queued or processed the
+        # same way as by ``ITNReceiver``.
+        status_code = receiver.receive(dict(request.data.items()), get_ip(request))
+        return Response({}, status=status_code)
+
+
 
-        if itn.upgrade:
-            itn.upgrade.do(itn=itn)
 
-        callbacks._payment_done(itn)
-        # TODO
-        # if not passed:
-        #     # TODO log this
-        #     # logger.warning('Security checks not passed')
-        #     return Response({}, status=status.HTTP_400_BAD_REQUEST)
-        return Response({}, status=status.HTTP_200_OK)
+receiver = ITNReceiver()
+
+
+
+
+async def notify_endpoint(request):
+    """
+    Same as ``NotifyEndpoint`` as an async view that doesn't need Django
+    REST framework. The validation request to PayFast uses async I/O when
+    the project runs under ASGI; see ``payfast.receivers``.
+    """
+    if request.method != 'POST':
+        response = JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+        response['Allow'] = 'POST'
+        return response
+    try:
+        data = parse_body(request.body, request.content_type or '')
+    except ValueError:
+        return JsonResponse({'detail': 'Malformed request.'}, status=400)
+    logger.debug(json.dumps(data, indent=4))
+    status_code = await receiver.areceive(data, get_ip(request))
+    return JsonResponse({}, status=status_code)
+
+# PayFast doesn't send a CSRF token.
+notify_endpoint.csrf_exempt = True
 
 
 
@@ -143,7 +163,7 @@ def return_endpoint(request):
 
 @debug_only
 def sandbox(request):
-    payment = payfast.payment(10.00, 'Things', user_id=request.user.pk)
+    payment = get_payfast().payment(10.00, 'Things', user_id=request.user.pk)
     form = payment.get_form()
     return render(request, 'payfast/sandbox.html', {
         'form': form,
@@ -155,7 +175,7 @@ def sandbox(request):
 @debug_only
 def subscription_sandbox(request):
     item_name = 'Things, but things every month'
-    payment = payfast.subscription(
+    payment = get_payfast().subscription(
         10.00,
         item_name,
         plan_id='test',
@@ -173,7 +193,7 @@ def subscription_sandbox(request):
 @debug_only
 def free_trial_sandbox(request):
     item_name = 'Things, but things every month'
-    payment = payfast.trial(
+    payment = get_payfast().trial(
         10.00,
         item_name,
         plan_id='test',
@@ -61,6 +61,7 @@ setuptools.setup(
     extras_require={
         'django': ['django'],
         'drf': ['djangorestframework'],
+        'async': ['httpx'],
         'docs': ['sphinx'],
         'dev': ['pytest', 'pytest-cov'],
     },
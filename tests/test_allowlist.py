@@ -0,0 +1,98 @@
+import os
+from ipaddress import ip_address
+
+import pytest
+
+from payfast import allowlist as allowlist_module
+from payfast.allowlist import IPAllowlist, get_intervals
+from payfast.security_checks import request_is_from_payfast
+from payfast.utils import get_client_ip
+
+
+
+
+def test_default_allowlist():
+    assert request_is_from_payfast('144.126.193.139') == (True, ip_address('144.126.193.139'))
+    assert request_is_from_payfast('197.97.145.150')[0]
+    assert request_is_from_payfast('41.74.179.223')[0]
+    assert not request_is_from_payfast('41.74.179.224')[0]
+    assert not request_is_from_payfast('::ffff:8.8.8.8')[0]
+    assert request_is_from_payfast('::ffff:144.126.193.139')[0]
+    assert request_is_from_payfast('not an ip') == (False, None)
+
+
+
+
+def test_intervals():
+    tables = get_intervals([
+        '10.0.0.0/25',
+        '10.0.0.128/25',
+        '10.0.0.5',
+        '10.0.2.0/24',
+        '2001:db8::/32',
+    ])
+    starts, ends = tables[4]
+    assert len(starts) == 2
+    assert ends[0] - starts[0] == 255
+    assert len(tables[6][0]) == 1
+
+    allowlist = IPAllowlist(['10.0.0.0/24', '10.0.2.0/24', '2001:db8::/32'])
+    for ip, expected in [
+        ('10.0.0.0', True),
+        ('10.0.0.255', True),
+        ('10.0.1.0', False),
+        ('10.0.2.10', True),
+        ('9.255.255.255', False),
+        ('2001:db8::1', True),
+        ('2001:db9::1', False),
+    ]:
+        # Twice to go through the cache.
+        assert (ip in allowlist) is expected
+        assert (ip in allowlist) is expected
+
+
+
+
+def test_reload(tmp_path, monkeypatch):
+    path = tmp_path / 'allowlist.txt'
+    path.write_text('# PayFast\n10.0.0.1\n')
+    allowlist = IPAllowlist(path=str(path))
+    assert '10.0.0.1' in allowlist
+    assert '10.0.0.2' not in allowlist
+
+    path.write_text('10.0.0.2 # new\n')
+    os.utime(path, (1, 1))
+    monkeypatch.setattr(allowlist_module, 'WATCH_INTERVAL', 0)
+    assert '10.0.0.1' not in allowlist
+    assert '10.0.0.2' in allowlist
+
+    # Invalid entries keep the previous allowlist.
+    path.write_text('nonsense\n')
+    allowlist.reload()
+    assert '10.0.0.2' in allowlist
+
+    entries = ['10.0.0.3']
+    allowlist = IPAllowlist(callback=lambda: entries)
+    assert '10.0.0.3' in allowlist
+    entries.append('10.0.0.4')
+    allowlist.reload()
+    assert '10.0.0.4' in allowlist
+    with pytest.raises(ValueError):
+        IPAllowlist(['nonsense'])
+
+
+
+
+def test_client_ip():
+    chain = '1.1.1.1, 144.126.193.139, 10.0.0.1'
+    assert get_client_ip(chain, '10.0.0.2') == '1.1.1.1'
+    assert get_client_ip(chain, '10.0.0.2', 0) == '10.0.0.2'
+    assert get_client_ip(chain, '10.0.0.2', 2) == '144.126.193.139'
+    assert get_client_ip(chain, '10.0.0.2', 3) == '1.1.1.1'
+    assert get_client_ip(None, '10.0.0.2', 2) == '10.0.0.2'
+
+    # A request that skipped some of the proxies can't pick its address.
+    assert get_client_ip(chain, '10.0.0.2', 4) == '10.0.0.2'
+    assert get_client_ip(chain, '10.0.0.2', 10) == '10.0.0.2'
+    assert get_client_ip('197.97.145.145', '10.0.0.2', 2) == '10.0.0.2'
+    assert get_client_ip('197.97.145.145', None, 1) is None
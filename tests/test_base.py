@@ -0,0 +1,101 @@
+import json
+import asyncio
+
+import httpx
+
+from payfast import AsyncPayFast
+from payfast.base import AsyncTransport
+
+
+
+
+def make_client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+
+
+def test_async_subscription_get():
+    token = 'a3b3ae55-ab8b-b388-df23-4e6882b86ce0'
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(200, json={
+            'code': 200,
+            'status': 'success',
+            'data': {
+                'response': {
+                    'amount': 1628,
+                    'cycles': 14,
+                    'cycles_complete': 9,
+                    'frequency': 3,
+                    'run_date': '2020-07-04T00:00:00+02:00',
+                    'status': 1,
+                    'status_reason': '',
+                    'status_text': 'ACTIVE',
+                    'token': token,
+                },
+            },
+        })
+
+    async def run():
+        transport = AsyncTransport('v1', client=make_client(handler))
+        async with AsyncPayFast(transport=transport) as payfast:
+            return await payfast.subscriptions.get(token)
+
+    sub = asyncio.run(run())
+    assert sub.token == token
+    assert sub.amount_cents == 1628
+    assert 'signature' in seen[0].headers
+    assert seen[0].url.path.endswith(f'/subscriptions/{token}/fetch')
+
+
+
+
+def test_async_cc_transaction_get():
+    def handler(request):
+        return httpx.Response(200, json={
+            'code': 200,
+            'status': 'success',
+            'data': {
+                'response': {
+                    'pf_payment_id': 69,
+                    'm_payment_id': 232345,
+                    'status': 'COMPLETE',
+                    'amount': 3600,
+                    'cc_status': '00',
+                    'cc_message': 'Approved or completed successfully (00)',
+                },
+                'message': 'Success',
+            },
+        })
+
+    async def run():
+        transport = AsyncTransport('v1', client=make_client(handler))
+        async with AsyncPayFast(transport=transport) as payfast:
+            return await payfast.cc_transactions.get('69')
+
+    transaction = asyncio.run(run())
+    assert transaction.amount_cents == 3600
+
+
+
+
+def test_response_not_json():
+    from payfast.base import PayFastResponse
+
+    class Response:
+        status_code = 502
+        ok = False
+        content = b'<html>Bad Gateway</html>'
+
+        def json(self):
+            # Like requests.JSONDecodeError when simplejson is installed,
+            # which isn't a json.JSONDecodeError.
+            raise ValueError('Expecting value')
+
+    response = PayFastResponse(Response())
+    assert response.text == '<html>Bad Gateway</html>'
+    assert response.code == 502
+    assert not response.ok
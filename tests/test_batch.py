@@ -0,0 +1,63 @@
+import io
+import json
+
+from payfast.payment import Payment
+from payfast.batch import PaymentBatch, build_payment_urls
+
+SPECS = [
+    {'amount': '10.00', 'item_name': 'Invoice 1', 'm_payment_id': '1'},
+    {'amount': '20.00', 'item_name': 'Invoice 2', 'm_payment_id': '2'},
+    {'amount': '30.00', 'item_name': 'Invoice 3', 'type': 'subscription', 'frequency': 3},
+]
+NOTIFY_URL = 'https://example.com/notify/'
+
+
+
+
+def test_payloads():
+    payloads = list(PaymentBatch(SPECS, notify_url=NOTIFY_URL))
+    assert len(payloads) == 3
+    expected = Payment('10.00', 'Invoice 1', m_payment_id='1', notify_url=NOTIFY_URL)
+    assert payloads[0] == expected.data_for_payfast
+    assert payloads[2]['frequency'] == 3
+
+
+
+
+def test_outputs():
+    urls = list(PaymentBatch(iter(SPECS), output='url'))
+    assert urls[0].startswith('https://')
+    assert 'signature=' in urls[0]
+    forms = list(PaymentBatch(SPECS, output='form'))
+    assert forms[1].startswith('<form')
+    assert forms[1] == Payment('20.00', 'Invoice 2', m_payment_id='2').get_form()
+
+
+
+
+def test_files(tmp_path):
+    path = tmp_path / 'invoices.csv'
+    path.write_text(
+        'amount,item_name,type,frequency\n'
+        '10.00,Invoice 1,,\n'
+        '20.00,Invoice 2,subscription,3\n'
+    )
+    fp = io.StringIO()
+    assert PaymentBatch(path).write(fp) == 2
+    lines = fp.getvalue().splitlines()
+    assert json.loads(lines[1])['frequency'] == 3
+
+    path = tmp_path / 'invoices.jsonl'
+    path.write_text('\n'.join(json.dumps(spec) for spec in SPECS))
+    output = tmp_path / 'payloads.jsonl'
+    assert PaymentBatch(str(path), workers=2, chunksize=1).write(output) == 3
+    payloads = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [p['item_name'] for p in payloads] == ['Invoice 1', 'Invoice 2', 'Invoice 3']
+
+
+
+
+def test_build_payment_urls():
+    urls = list(build_payment_urls(SPECS[:2], notify_url=NOTIFY_URL))
+    expected = Payment('20.00', 'Invoice 2', m_payment_id='2', notify_url=NOTIFY_URL)
+    assert urls[1] == expected.get_url()
@@ -0,0 +1,120 @@
+from payfast import circuit
+from payfast.circuit import CircuitBreaker, MemoryBackend, FileBackend
+from payfast.utils import get_endpoint
+
+
+
+
+def test_get_endpoint():
+    uri = 'https://api.payfast.co.za/subscriptions/a3b3ae55-ab8b/fetch?testing=true'
+    assert get_endpoint(uri) == 'subscriptions/fetch'
+    assert get_endpoint('https://api.payfast.co.za/process/query/69') == 'process/query'
+
+
+
+
+def make_breaker(backend, probe):
+    return CircuitBreaker(
+        backend=backend,
+        failure_rate=0.5,
+        min_requests=2,
+        window=60,
+        reset_timeout=0,
+        probe=probe,
+    )
+
+
+
+
+def test_circuit_opens_and_probes():
+    probes = []
+
+    def probe():
+        probes.append(True)
+        return len(probes) > 1
+
+    breaker = make_breaker(MemoryBackend(), probe)
+    breaker.reset_timeout = 60
+    endpoint = 'subscriptions/fetch'
+    breaker.record(endpoint, success=False)
+    assert breaker.before_request(endpoint) == circuit.ALLOW
+    breaker.record(endpoint, success=False)
+    assert breaker.before_request(endpoint) == circuit.REJECT
+
+    breaker.reset_timeout = 0
+    assert breaker.before_request(endpoint) == circuit.PROBE
+    breaker.probe_done(endpoint, breaker.probe())
+    assert breaker.get_state(endpoint)['state'] == circuit.OPEN
+
+    assert breaker.before_request(endpoint) == circuit.PROBE
+    breaker.probe_done(endpoint, breaker.probe())
+    assert breaker.get_state(endpoint)['state'] == circuit.CLOSED
+    assert breaker.before_request('ping') == circuit.ALLOW
+
+
+
+
+def test_file_backend(tmp_path):
+    path = str(tmp_path / 'circuit.json')
+    first = make_breaker(FileBackend(path), lambda: True)
+    second = make_breaker(FileBackend(path), lambda: True)
+    first.record('process/query', success=False)
+    first.record('process/query', success=False)
+    assert second.get_state('process/query')['state'] == circuit.OPEN
+
+
+
+
+class CountingBackend(MemoryBackend):
+
+    def __init__(self):
+        super().__init__()
+        self.updates = 0
+
+
+    def update(self, key, function):
+        self.updates += 1
+        return super().update(key, function)
+
+
+
+
+def test_one_update_per_request(tmp_path):
+    backend = CountingBackend()
+    breaker = make_breaker(backend, lambda: True)
+    for _ in range(3):
+        assert breaker.before_request('process/query') == circuit.ALLOW
+        breaker.record('process/query', success=True)
+    assert backend.updates == 3
+
+    # A circuit that another process opened is seen after the next request.
+    path = str(tmp_path / 'circuit.json')
+    first = make_breaker(FileBackend(path), lambda: True)
+    second = make_breaker(FileBackend(path), lambda: True)
+    first.reset_timeout = second.reset_timeout = 60
+    first.record('process/query', success=False)
+    first.record('process/query', success=False)
+    assert second.before_request('process/query') == circuit.ALLOW
+    second.record('process/query', success=True)
+    assert second.before_request('process/query') == circuit.REJECT
+
+
+
+
+def test_default_probe(monkeypatch):
+    from payfast.base import RequestsTransport
+    from payfast.conf import settings
+    from payfast.exceptions import PayFastTimeout
+
+    policies = []
+
+    def send(self, req, method, uri, payload=None):
+        policies.append(self.get_retry_policy())
+        raise PayFastTimeout()
+
+    monkeypatch.setattr(RequestsTransport, 'send', send)
+    monkeypatch.setattr(settings, 'CIRCUIT_PROBE_TIMEOUT', 2.0)
+    assert circuit.default_probe() is False
+    policy, = policies
+    assert policy.max_attempts == 1
+    assert policy.deadline == 2.0
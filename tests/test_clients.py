@@ -0,0 +1,40 @@
+import threading
+
+from payfast import PayFast
+from payfast.clients import registry, get_payfast, get_session
+
+
+
+
+def test_shared_pool():
+    pf1 = PayFast()
+    pf2 = PayFast()
+    adapter = registry.adapter()
+    session = pf1.subscriptions.transport.session
+    assert session is pf2.cards.transport.session
+    assert session.get_adapter('https://api.payfast.co.za') is adapter
+    assert get_session().get_adapter('https://api.payfast.co.za') is adapter
+
+
+
+
+def test_thread_sessions():
+    pf = PayFast()
+    sessions = []
+
+    def target():
+        sessions.append(pf.subscriptions.transport.session)
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    other = sessions[0]
+    assert other is not pf.subscriptions.transport.session
+    assert other.get_adapter('https://') is registry.adapter()
+
+
+
+
+def test_shared_client():
+    assert get_payfast() is get_payfast()
+    assert get_session(merchant_id='123') is not get_session()
@@ -0,0 +1,113 @@
+import json
+import uuid
+from decimal import Decimal
+from datetime import date, datetime
+
+import pytest
+
+from payfast import codec, timezone
+from payfast.conf import settings
+from payfast.itn import ITN
+from payfast.payment import SubscriptionPayment
+
+
+
+
+def test_round_trip():
+    token = str(uuid.uuid4())
+    metadata = {
+        'user_id': '456',
+        'plan_id': 7,
+        'trial': [datetime(2024, 2, 29, 23, 59, 59), None],
+        'run_date': timezone.joburg.localize(datetime(2030, 1, 2, 3, 4, 5, 678)),
+        'recurring_amount': Decimal('99.99'),
+        'amount': Decimal('0.125'),
+        'is_tokenized': True,
+        'cancel': False,
+        'token': token,
+        'upgrade_to_id': date(1969, 12, 31),
+        'extra': -300,
+        'item_name': 'Zoë & co',
+        'account_id': None,
+    }
+    packed = codec.pack(metadata)
+    assert packed.startswith('~1')
+    assert len(packed) < len(json.dumps(metadata, default=str))
+    assert codec.loads(packed) == {
+        **{key: value for key, value in metadata.items() if value is not None},
+        'trial': ['2024-02-29T23:59:59', None],
+        'run_date': datetime(2030, 1, 2, 3, 4, 5),
+        # Dates are read as ISO strings.
+        'upgrade_to_id': '1969-12-31',
+    }
+    for amount in ('10', '10.00', '-0.50', '1E+3', 'NaN'):
+        decoded = codec.loads(codec.pack({'amount': Decimal(amount)}))['amount']
+        assert str(decoded) == amount
+
+    # The JSON format is still read.
+    assert codec.loads(json.dumps({'user_id': '456', 'recurring_amount': '5.00'})) == {
+        'user_id': '456', 'recurring_amount': Decimal('5.00'),
+    }
+    for value in ('~2AQ', '~1AQ', '~1!!', '[1]', '', 'null'):
+        with pytest.raises(ValueError):
+            codec.loads(value)
+    with pytest.raises(ValueError):
+        codec.dumps({}, format='xml')
+
+
+
+
+def test_same_types():
+    metadata = {
+        'user_id': '456',
+        'plan_id': 7,
+        'trial': [datetime(2024, 2, 29, 23, 59, 59), datetime(2024, 3, 7)],
+        'run_date': '2030-01-02T03:04:05',
+        'recurring_amount': Decimal('99.99'),
+        'amount': 0.5,
+        'extra': Decimal('1.5'),
+        'ratio': -1.25,
+        'is_tokenized': True,
+        'token': str(uuid.uuid4()),
+    }
+    decoded = codec.loads(codec.dumps(metadata, format='compact'))
+    assert decoded == codec.loads(codec.dumps(metadata, format='json'))
+    assert decoded['trial'] == ['2024-02-29T23:59:59', '2024-03-07T00:00:00']
+    assert decoded['run_date'] == datetime(2030, 1, 2, 3, 4, 5)
+    assert decoded['amount'] == Decimal(0.5)
+    assert decoded['extra'] == '1.5'
+    assert decoded['ratio'] == -1.25
+    for key, value in decoded.items():
+        assert type(value) is type(codec.loads(codec.dumps(metadata, format='json'))[key])
+
+    # None values are left out of compact metadata.
+    assert codec.loads(codec.dumps({'user_id': None}, format='json')) == {'user_id': None}
+    assert codec.loads(codec.dumps({'user_id': None}, format='compact')) == {}
+
+
+
+
+def test_payments(monkeypatch):
+    monkeypatch.setattr(settings, 'METADATA_FORMAT', 'compact')
+    payment = SubscriptionPayment(10, 'Things', user_id='456', plan_id=2)
+    str1 = payment.data_for_payfast['custom_str1']
+    assert str1.startswith('~1')
+    metadata = codec.loads(str1)
+    assert metadata['user_id'] == '456'
+    assert metadata['recurring_amount'] == Decimal('10.00')
+
+    itn = ITN({
+        'm_payment_id': '1',
+        'pf_payment_id': '1089250',
+        'payment_status': 'COMPLETE',
+        'item_name': 'Things',
+        'amount_gross': '10.00',
+        'amount_fee': '-0.50',
+        'amount_net': '9.50',
+        'custom_str1': str1,
+        'merchant_id': '10000100',
+        'signature': 'ad8e7685c9522c24365d7ccea8cb3db7',
+    })
+    assert itn.user_id == '456'
+    assert itn.plan_id == 2
+    assert itn.run_date == payment.billing_date.replace(tzinfo=None, microsecond=0)
@@ -0,0 +1,23 @@
+import os
+import sys
+import subprocess
+
+from payfast.conf import settings
+
+
+
+
+def test_check():
+    settings.check()
+
+    # Invalid values don't fail the import, only the check.
+    code = (
+        'from payfast.conf import settings; '
+        'import payfast.base, payfast.security_checks; '
+        'settings.check()'
+    )
+    env = {**os.environ, 'PAYFAST_GRACE_PERIOD_DAYS': '2'}
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env)
+    assert result.returncode == 1
+    assert '"GRACE_PERIOD_DAYS" must be an integer bigger than 5.' in result.stderr
+    assert ', in check' in result.stderr
@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+from payfast.idempotency import (
+    NEW,
+    IN_PROGRESS,
+    DUPLICATE,
+    ITNStore,
+    MemoryBackend,
+    SQLiteBackend,
+    DjangoCacheBackend,
+    get_key,
+)
+
+DATA = {
+    'pf_payment_id': '1089250',
+    'payment_status': 'COMPLETE',
+    'signature': 'ad8e7685c9522c24365d7ccea8cb3db7',
+}
+
+
+
+
+class Cache:
+    """
+    The parts of Django's cache API that are used.
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key, None)
+
+    def add(self, key, value, timeout=None):
+        if key in self.values:
+            return False
+        self.values[key] = value
+        return True
+
+    def set(self, key, value, timeout=None):
+        self.values[key] = value
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+
+
+def test_get_key():
+    assert get_key(DATA) == '1089250:COMPLETE:ad8e7685c9522c24365d7ccea8cb3db7'
+    assert get_key({**DATA, 'payment_status': 'CANCELLED'}) != get_key(DATA)
+    assert get_key({'payment_status': 'COMPLETE'}) is None
+
+
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite', 'django'])
+def test_store(backend, tmp_path):
+    backend = {
+        'memory': lambda: MemoryBackend(cache_size=10),
+        'sqlite': lambda: SQLiteBackend(str(tmp_path / 'keys.sqlite3')),
+        'django': lambda: DjangoCacheBackend(Cache()),
+    }[backend]()
+    store = ITNStore(backend, timeout=60)
+    assert store.begin(DATA) == NEW
+    assert store.begin(DATA) == IN_PROGRESS
+    # Processing failed, so the next copy is processed.
+    store.release(DATA)
+    assert store.begin(DATA) == NEW
+    store.finish(DATA)
+    assert store.begin(DATA) == DUPLICATE
+    assert store.begin(DATA) == DUPLICATE
+    assert store.begin({**DATA, 'payment_status': 'CANCELLED'}) == NEW
+    # Without a "pf_payment_id" ITNs are always processed.
+    assert store.begin({'payment_status': 'COMPLETE'}) == NEW
+    metrics = store.metrics()
+    assert (metrics['hits'], metrics['misses']) == (3, 3)
+    assert metrics['duplicate'] == 2
+    assert metrics['hit_rate'] == 0.5
+
+
+
+
+def test_memory_backend():
+    backend = MemoryBackend(cache_size=2)
+    assert backend.add('a', 1, timeout=60)
+    assert not backend.add('a', 2, timeout=60)
+    backend.set('b', 1, timeout=60)
+    backend.get('a')
+    backend.set('c', 1, timeout=60)
+    # "b" was the least recently used key.
+    assert backend.get('b') is None
+    assert backend.get('a') == 1
+    backend.set('a', 1, timeout=0.01)
+    time.sleep(0.02)
+    assert backend.get('a') is None
+    assert backend.add('a', 3, timeout=60)
+
+
+
+
+def test_sqlite_purge(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'keys.sqlite3'), purge_interval=3)
+
+    def count():
+        return backend.connection.execute('SELECT COUNT(*) FROM payfast_itn_keys').fetchone()[0]
+
+    assert backend.add('a', IN_PROGRESS, timeout=0)
+    assert backend.add('b', IN_PROGRESS, timeout=60)
+    assert count() == 2
+    # Every third key that is added deletes the expired keys.
+    assert backend.add('c', IN_PROGRESS, timeout=60)
+    assert count() == 2
+    assert backend.get('b') == IN_PROGRESS
@@ -0,0 +1,65 @@
+import sys
+import subprocess
+
+HEAVY = ('requests', 'pydantic', 'jinja2', 'dateutil', 'httpx')
+
+
+
+
+def imported_modules(statement):
+    code = f'{statement}; import sys; print(" ".join(sys.modules))'
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.split())
+
+
+
+
+def test_lazy_imports():
+    modules = imported_modules('import payfast.signature, payfast.merchants')
+    assert not [name for name in HEAVY if name in modules]
+    assert 'payfast.core' not in modules
+
+
+
+
+def test_lazy_attributes():
+    modules = imported_modules('from payfast import PayFast')
+    assert 'payfast.core' in modules
+    assert 'jinja2' not in modules
+
+
+
+
+def test_lazy_submodules():
+    code = (
+        'import payfast; '
+        'print(payfast.payment.Payment, payfast.signature, payfast.conf.settings, '
+        'payfast.api.subscriptions.Subscriptions)'
+    )
+    subprocess.run([sys.executable, '-c', code], check=True)
+    result = subprocess.run(
+        [sys.executable, '-c', 'import payfast; payfast.nope'],
+        capture_output=True,
+        text=True,
+    )
+    assert "has no attribute 'nope'" in result.stderr
+
+
+
+
+def test_lazy_singletons():
+    # The shared breaker, retry policy, rate limiter and allowlist are
+    # built on first use, not when the modules are imported.
+    code = (
+        'import payfast.base, payfast.security_checks; '
+        'from payfast.conf import Settings, setting; '
+        'names = ("CIRCUIT_BACKEND", "RETRY_MAX_ATTEMPTS", "RATE_LIMIT", "ALLOWLIST_PATH"); '
+        'print([name for name in names if not isinstance(Settings.__dict__[name], setting)])'
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
@@ -2,6 +2,8 @@ import uuid
 import json
 from decimal import Decimal
 
+import pytest
+
 from payfast.itn import ITN
 
 
@@ -48,3 +50,206 @@ def test_itn():
     assert itn.amount_net == Decimal(data['amount_net']).quantize(Decimal('1.00'))
     assert itn.signature == data['signature']
     assert itn.user_id ==  metadata.get('user_id')
+
+
+
+
+def test_staged_checks(monkeypatch):
+    from payfast import callbacks, security_checks
+    from payfast.signature import make_signature
+
+    calls = []
+    monkeypatch.setattr(callbacks, '_get_expected_amount', lambda m_payment_id: calls.append('amount') or Decimal('200.00'))
+    monkeypatch.setattr(security_checks, 'send_validation_request', lambda data: calls.append('validate') or True)
+    data = {
+        'm_payment_id': '1',
+        'pf_payment_id': '1089250',
+        'payment_status': 'COMPLETE',
+        'amount_gross': '200.00',
+        'merchant_id': '10000100',
+        'token': str(uuid.uuid4()),
+    }
+    data['signature'] = make_signature(data)
+
+    # A forged ITN is rejected without fetching or calling anything.
+    itn = ITN({**data, 'amount_gross': '1.00'}, payfast_ipaddr='197.97.145.145')
+    passed, results = itn.do_security_checks()
+    assert not passed
+    assert results['security_checks'] == {
+        'check_one': False, 'check_two': None, 'check_three': None, 'check_four': None,
+    }
+    assert calls == []
+    assert set(itn.timings) == {'parse', 'signature'}
+
+    itn = ITN(data, payfast_ipaddr='10.0.0.1')
+    assert not itn.do_security_checks()[0]
+    assert calls == []
+
+    itn = ITN(data, payfast_ipaddr='197.97.145.145')
+    assert itn.do_security_checks()[0]
+    assert calls == ['amount', 'validate']
+    assert list(itn.timings) == ['parse', 'signature', 'ip', 'amount', 'validate']
+
+
+
+
+def test_concurrent_checks(monkeypatch):
+    import time
+    import pytest
+    from payfast import callbacks, security_checks
+    from payfast.exceptions import PayFastTimeout
+    from payfast.signature import make_signature
+
+    def slow(value):
+        def function(*args):
+            time.sleep(0.2)
+            return value
+        return function
+
+    monkeypatch.setattr(callbacks, '_get_expected_amount', slow(Decimal('200.00')))
+    monkeypatch.setattr(security_checks, 'send_validation_request', slow(True))
+    monkeypatch.setattr(ITN, 'get_subscription', slow('subscription'))
+    data = {
+        'pf_payment_id': '1089250',
+        'payment_status': 'COMPLETE',
+        'amount_gross': '200.00',
+        'merchant_id': '10000100',
+        'token': str(uuid.uuid4()),
+    }
+    data['signature'] = make_signature(data)
+
+    itn = ITN(data, payfast_ipaddr='197.97.145.145')
+    started = time.monotonic()
+    passed, results = itn.do_concurrent_checks(deadline=5)
+    assert time.monotonic() - started < 0.4
+    assert passed
+    assert set(results['security_checks'].values()) == {True}
+    assert {'amount', 'validate', 'enrich'} <= set(itn.timings)
+
+    # The results are combined in order, as if the checks ran one by one.
+    monkeypatch.setattr(security_checks, 'payment_data_is_valid', lambda **kwargs: False)
+    passed, results = ITN(data, payfast_ipaddr='197.97.145.145').do_concurrent_checks()
+    assert not passed
+    assert results['security_checks']['check_four'] is None
+
+    with pytest.raises(PayFastTimeout):
+        ITN(data, payfast_ipaddr='197.97.145.145').do_concurrent_checks(deadline=0.05)
+
+
+
+
+def test_lazy_subscription(monkeypatch):
+    from payfast import callbacks, security_checks
+    from payfast.itn import process_itn
+    from payfast.signature import make_signature
+
+    fetched = []
+    monkeypatch.setattr(ITN, 'get_subscription', lambda self: fetched.append(self.token) or 'subscription')
+    monkeypatch.setattr(callbacks, '_get_expected_amount', lambda m_payment_id: Decimal('200.00'))
+    monkeypatch.setattr(security_checks, 'send_validation_request', lambda data: True)
+    data = {
+        'pf_payment_id': '1089250',
+        'payment_status': 'COMPLETE',
+        'amount_gross': '200.00',
+        'merchant_id': '10000100',
+        'token': str(uuid.uuid4()),
+    }
+    data['signature'] = make_signature(data)
+
+    # Not checked yet.
+    itn = ITN(data, payfast_ipaddr='197.97.145.145')
+    assert itn.sub is None
+    assert itn.upgrade is None
+    assert fetched == []
+    assert itn.do_security_checks()[0]
+    assert itn.sub == 'subscription'
+    assert fetched == [data['token']]
+
+    # A forged ITN doesn't fetch anything from the payment done callback.
+    subs = []
+    monkeypatch.setattr(callbacks, '_payment_done', lambda itn: subs.append(itn.sub))
+    assert not process_itn({**data, 'amount_gross': '1.00'}, payfast_ipaddr='197.97.145.145')
+    assert subs == [None]
+    assert fetched == [data['token']]
+
+
+
+
+@pytest.mark.parametrize('mode', ['sync', 'concurrent', 'async'])
+def test_upgrade_without_expected_amount(mode, monkeypatch):
+    import asyncio
+    from payfast import callbacks, security_checks
+    from payfast.conf import settings
+    from payfast.itn import process_itn, aprocess_itn
+    from payfast.signature import make_signature
+
+    class Upgrade:
+        def do(self, itn=None):
+            done.append(itn)
+
+    done = []
+    validated = []
+    monkeypatch.setattr(settings, 'expected_amount_callback', None)
+    monkeypatch.setattr(settings, 'ITN_CONCURRENT', mode == 'concurrent')
+    monkeypatch.setattr(ITN, 'get_subscription', lambda self: 'subscription')
+    monkeypatch.setattr(ITN, 'get_upgrade', lambda self: Upgrade())
+    monkeypatch.setattr(security_checks, 'send_validation_request', lambda data: validated.append(data) or True)
+
+    async def asend_validation_request(data):
+        return security_checks.send_validation_request(data)
+
+    monkeypatch.setattr(security_checks, 'asend_validation_request', asend_validation_request)
+    subs = []
+    monkeypatch.setattr(callbacks, '_payment_done', lambda itn: subs.append(itn.sub))
+    data = {
+        'pf_payment_id': '1089250',
+        'payment_status': 'COMPLETE',
+        'amount_gross': '200.00',
+        'custom_str2': json.dumps({'token': str(uuid.uuid4()), 'plan_id': 2}),
+        'merchant_id': '10000100',
+        'token': str(uuid.uuid4()),
+    }
+    data['signature'] = make_signature(data)
+
+    if mode == 'async':
+        passed = asyncio.run(aprocess_itn(data, payfast_ipaddr='197.97.145.145'))
+    else:
+        passed = process_itn(data, payfast_ipaddr='197.97.145.145')
+    # The amount check was skipped, so the checks didn't all pass, but
+    # none failed: the ITN is validated, enriched and upgraded.
+    assert not passed
+    assert len(validated) == 1
+    assert len(done) == 1
+    assert done[0].secchecks_results['security_checks']['check_three'] is None
+    assert subs == ['subscription']
+
+
+
+
+def test_workers_close_old_connections(monkeypatch):
+    import threading
+    from types import SimpleNamespace
+    from payfast import callbacks, security_checks, utils
+    from payfast.signature import make_signature
+
+    closed = []
+    db = SimpleNamespace(close_old_connections=lambda: closed.append(threading.current_thread()))
+    monkeypatch.setattr(utils, 'get_django_db', lambda: (SimpleNamespace(ready=True), db))
+    monkeypatch.setattr(callbacks, '_get_expected_amount', lambda m_payment_id: Decimal('200.00'))
+    monkeypatch.setattr(security_checks, 'send_validation_request', lambda data: True)
+    monkeypatch.setattr(ITN, 'get_subscription', lambda self: 'subscription')
+    data = {
+        'pf_payment_id': '1089250',
+        'payment_status': 'COMPLETE',
+        'amount_gross': '200.00',
+        'merchant_id': '10000100',
+        'token': str(uuid.uuid4()),
+    }
+    data['signature'] = make_signature(data)
+
+    passed, results = ITN(data, payfast_ipaddr='197.97.145.145').do_concurrent_checks(deadline=5)
+    assert passed
+    # Before and after each of the amount, validate and enrich stages, on
+    # the executor's threads.
+    assert len(closed) == 6
+    assert threading.current_thread() not in closed
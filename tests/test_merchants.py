@@ -0,0 +1,135 @@
+from payfast import PayFast
+from payfast.conf import settings
+from payfast.base import RequestsTransport
+from payfast.clients import registry
+from payfast.payment import Payment, PaymentTemplate
+from payfast.signature import make_querystring, make_signature, get_signer
+from payfast.security_checks import signature_is_valid
+from payfast.utils import make_key
+from payfast.merchants import (
+    Merchant,
+    merchants,
+    current_merchant,
+    use_merchant,
+)
+
+OTHER = Merchant(
+    10000100,
+    '46f0cd694581a',
+    'other-passphrase',
+    notify_url='https://example.com/other/notify/',
+)
+
+
+
+
+def setup_function():
+    merchants.register(OTHER)
+
+
+
+
+def teardown_function():
+    merchants.clear()
+
+
+
+
+def test_default_merchant():
+    merchant = current_merchant()
+    assert merchant.merchant_id == settings.MERCHANT_ID
+    assert merchant.passphrase == settings.SALT_PASSPHRASE
+    assert merchant.cache_key_prefix == settings.CACHE_KEY_PREFIX
+    # Unknown merchants fall back to the default merchant.
+    assert merchants.get('123').merchant_id == settings.MERCHANT_ID
+    assert merchants.get('123', default=False) is None
+    assert merchants.get(str(settings.MERCHANT_ID), default=False) is not None
+
+
+
+
+def test_default_merchant_cached(monkeypatch):
+    merchant = current_merchant()
+    assert current_merchant() is merchant
+    # Built again when the settings change or the registry is cleared.
+    monkeypatch.setattr(settings, 'NOTIFY_URL', 'https://example.com/notify/')
+    assert current_merchant() is not merchant
+    assert current_merchant().notify_url == 'https://example.com/notify/'
+    merchant = current_merchant()
+    merchants.clear()
+    assert current_merchant() is not merchant
+
+
+
+
+def test_use_merchant():
+    data = {'merchant_id': OTHER.merchant_id, 'amount': '10.00'}
+    default_signature = make_signature(data)
+    with use_merchant('10000100') as merchant:
+        assert merchant is OTHER
+        assert current_merchant() is OTHER
+        assert make_signature(data) == get_signer('other-passphrase').signature(data)
+        assert make_querystring(data).endswith('passphrase=other-passphrase')
+        assert make_key('a-b') == f'{settings.CACHE_KEY_PREFIX}:10000100:subscription:ab'
+        assert registry.get_key() == OTHER.pool_key
+    assert make_signature(data) == default_signature
+    assert current_merchant().merchant_id == settings.MERCHANT_ID
+
+
+
+
+def test_payment():
+    with use_merchant(OTHER):
+        payment = Payment(10.00, 'Some things')
+        data = payment.data_for_payfast
+        assert data['merchant_id'] == OTHER.merchant_id
+        assert data['notify_url'] == OTHER.notify_url
+        assert signature_is_valid(data['signature'], data)
+    assert not signature_is_valid(data['signature'], data)
+
+    template = PaymentTemplate(merchant=OTHER)
+    assert template.payment(10.00, 'Some things').data_for_payfast == data
+
+    pf = PayFast(merchant=OTHER)
+    assert pf.payment(10.00, 'Some things').data_for_payfast == data
+
+
+
+
+def test_headers():
+    transport = RequestsTransport('v1', merchant=OTHER)
+    headers = transport.get_headers(None)
+    assert headers['merchant-id'] == '10000100'
+    with use_merchant(OTHER):
+        expected = make_signature({
+            'merchant-id': headers['merchant-id'],
+            'version': headers['version'],
+            'timestamp': headers['timestamp'],
+        }, a12y=True)
+    assert headers['signature'] == expected
+    assert transport.session is registry.session(*OTHER.pool_key)
+
+
+
+
+def test_api_root():
+    sandbox = Merchant(10000101, 'key', None, api_root='https://sandbox.example.com')
+    merchants.register(sandbox)
+    pf = PayFast(merchant=sandbox)
+    assert pf.subscriptions.uri == 'https://sandbox.example.com/subscriptions'
+    assert PayFast(base_uri='https://other.example.com').refunds.uri == 'https://other.example.com/refunds'
+
+    # The resources of the default client follow the current merchant.
+    pf = PayFast()
+    with use_merchant(sandbox):
+        assert pf.subscriptions.uri == 'https://sandbox.example.com/subscriptions'
+        shared = registry.payfast()
+        assert shared.merchant is sandbox
+        assert shared.cc_transactions.uri.startswith('https://sandbox.example.com/')
+    assert registry.payfast(*OTHER.pool_key).merchant is OTHER
+
+    # Requests for different merchants are never coalesced.
+    key = pf.subscriptions.flight_key('token', False)
+    with use_merchant(OTHER):
+        assert pf.subscriptions.flight_key('token', False) != key
+    assert pf.subscriptions.flight_key('token', False) == key
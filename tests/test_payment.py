@@ -1,4 +1,9 @@
+from urllib.parse import urlencode, parse_qsl
+
 from payfast import PayFast, timezone, constants
+from payfast.payment import Payment, PaymentTemplate
+from payfast.conf import settings
+from payfast.signature import FIELD_ORDER
 from payfast.exceptions import PayFastAPIException
 
 pf = PayFast()
@@ -20,3 +25,74 @@ def test_subscription_form():
         frequency=constants.Frequency.MONTHLY.value,
     )
     rendered = payment.get_form()
+
+
+
+
+def test_payment_template():
+    template = PaymentTemplate(notify_url='https://example.com/notify/')
+    payment = template.payment(10.00, 'Some things', name_first='Armandt')
+    expected = Payment(
+        10.00,
+        'Some things',
+        name_first='Armandt',
+        notify_url='https://example.com/notify/',
+    )
+    assert payment.data_for_payfast == expected.data_for_payfast
+    subscription = template.subscription(10.00, 'Some things, but every month')
+    assert subscription.data_for_payfast['notify_url'] == 'https://example.com/notify/'
+
+
+
+
+def test_prep():
+    payment = pf.subscription(
+        10.00,
+        'Some things, but every month',
+        email_confirmation=True,
+        billing_date=timezone.now(),
+    )
+    data = payment.data_for_payfast
+    keys = [key for key in data if key != 'signature']
+    assert keys == sorted(keys, key=FIELD_ORDER.index)
+    assert data['amount'] == '10.00'
+    assert data['email_confirmation'] == constants.BooleanInteger.ON.value
+    assert len(data['billing_date']) == 10
+    assert 'metadata' not in data
+
+    tokenized = pf.tokenized_sub(10.00, 'Some things')
+    data = tokenized.data_for_payfast
+    assert data['subscription_type'] == constants.SubscriptionType.TOKENIZATION.value
+    assert 'frequency' not in data
+    assert 'recurring_amount' not in data
+    assert '"is_tokenized": true' in data['custom_str1']
+
+
+
+
+def test_validation_modes(monkeypatch):
+    # The prepared data has None for the fields that aren't set; every
+    # validation mode must accept it.
+    results = []
+    for mode in ('full', 'compiled', 'off'):
+        monkeypatch.setattr(settings, 'VALIDATION', mode)
+        payment = pf.payment(10.00, 'Some things', custom_int1=5, email_confirmation=True)
+        assert payment.data_for_payfast['name_first'] is None
+        results.append(payment.data_for_payfast)
+    assert results[0] == results[1] == results[2]
+
+
+
+
+def test_get_url():
+    for payment in [
+        Payment(10.00, 'Things & stuff', name_first='Zoë'),
+        PaymentTemplate(notify_url='https://example.com/notify/').payment(10.00, 'Things'),
+    ]:
+        data = payment.data_for_payfast
+        pairs = [(key, str(value)) for key, value in data.items() if value is not None]
+        url = payment.get_url()
+        base, query = url.split('?')
+        assert base == settings.PROCESS_URL
+        assert query == urlencode(pairs)
+        assert parse_qsl(query)[-1] == ('signature', data['signature'])
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from payfast.signature import make_signature
+from payfast.security_checks import local_checks
+from payfast.exceptions import PayFastQueueFull
+from payfast import queue as itn_queue
+from payfast.queue import ITNQueue, MemoryBackend, SQLiteBackend
+
+DATA = {
+    'pf_payment_id': '1089250',
+    'payment_status': 'COMPLETE',
+    'amount_gross': '200.00',
+    'merchant_id': '10000100',
+}
+
+
+
+
+def test_local_checks():
+    data = {**DATA, 'signature': make_signature(DATA)}
+    assert local_checks(data, '197.97.145.145') == (True, {'check_one': True, 'check_two': True})
+    assert not local_checks(data, '10.0.0.1')[0]
+    assert not local_checks({**data, 'amount_gross': '1.00'}, '197.97.145.145')[0]
+    assert not local_checks({**data, 'unknown': '1'}, '197.97.145.145')[0]
+
+
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_queue(backend, tmp_path, monkeypatch):
+    monkeypatch.setattr(itn_queue, 'RETRY_DELAY', 0)
+    if backend == 'sqlite':
+        backend = SQLiteBackend(str(tmp_path / 'itns.sqlite3'))
+    else:
+        backend = MemoryBackend()
+    handled = []
+
+    def handler(item):
+        if item.data['pf_payment_id'] == 'bad':
+            raise ValueError('Bad ITN')
+        handled.append((item.data, item.ipaddr))
+
+    queue = ITNQueue(backend, handler, max_depth=2, max_attempts=2, lease=60)
+    queue.enqueue(DATA, '197.97.145.145')
+    queue.enqueue({**DATA, 'pf_payment_id': 'bad'})
+    with pytest.raises(PayFastQueueFull):
+        queue.enqueue(DATA)
+    metrics = queue.metrics()
+    assert metrics['depth'] == 2
+    assert metrics['age'] >= 0
+    assert metrics['rejected'] == 1
+
+    # The bad ITN is retried until it is given up on.
+    assert queue.drain() == 3
+    assert handled == [(DATA, '197.97.145.145')]
+    metrics = queue.metrics()
+    assert (metrics['depth'], metrics['dead']) == (0, 1)
+    assert (metrics['processed'], metrics['failed']) == (1, 2)
+
+    # Claimed ITNs are not given to other workers until the lease expires.
+    queue.enqueue(DATA)
+    assert len(backend.claim(10, lease=60)) == 1
+    assert backend.claim(10, lease=60) == []
+    assert queue.metrics()['depth'] == 1
+
+
+
+
+def test_workers():
+    handled = []
+    queue = ITNQueue(MemoryBackend(), handled.append, max_depth=0)
+    queue.start(workers=2)
+    try:
+        for index in range(20):
+            queue.enqueue({**DATA, 'pf_payment_id': str(index)})
+        deadline = time.monotonic() + 5
+        while len(handled) < 20 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        queue.stop(timeout=5)
+    assert sorted(int(item.data['pf_payment_id']) for item in handled) == list(range(20))
+    assert queue.metrics()['depth'] == 0
@@ -0,0 +1,43 @@
+import time
+
+from payfast.ratelimit import (
+    RateLimiter,
+    MemoryBackend,
+    SQLiteBackend,
+    parse_limits,
+)
+
+
+
+
+def test_parse_limits():
+    limits = parse_limits('subscriptions/adhoc=2, subscriptions/update=5')
+    assert limits == {'subscriptions/adhoc': 2.0, 'subscriptions/update': 5.0}
+
+
+
+
+def test_non_blocking():
+    limiter = RateLimiter(MemoryBackend(), rate=1, burst=2, limits={})
+    assert limiter.acquire('subscriptions/fetch', blocking=False)
+    assert limiter.acquire('subscriptions/fetch', blocking=False)
+    assert not limiter.acquire('subscriptions/fetch', blocking=False)
+    # Other endpoints have their own buckets.
+    assert limiter.acquire('process/query', blocking=False)
+    stats = limiter.stats.snapshot()
+    assert stats['acquired'] == 3
+    assert stats['rejected'] == 1
+
+
+
+
+def test_blocking(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'buckets.sqlite3'))
+    limiter = RateLimiter(backend, rate=0, limits={'subscriptions/adhoc': 20})
+    assert limiter.acquire('subscriptions/fetch', blocking=False)
+    start = time.monotonic()
+    for _ in range(22):
+        assert limiter.acquire('subscriptions/adhoc')
+    assert time.monotonic() - start >= 0.05
+    assert limiter.stats.snapshot()['waited'] >= 1
+    assert not limiter.acquire('subscriptions/adhoc', timeout=0.001)
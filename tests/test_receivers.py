@@ -0,0 +1,147 @@
+import io
+import json
+import asyncio
+from decimal import Decimal
+from urllib.parse import urlencode
+
+import pytest
+
+from payfast import callbacks, security_checks
+from payfast.conf import settings
+from payfast.signature import make_signature
+from payfast.idempotency import itn_store, MemoryBackend
+from payfast.receivers import ITNReceiver, parse_body
+
+DATA = {
+    'm_payment_id': '1',
+    'pf_payment_id': '1089250',
+    'payment_status': 'COMPLETE',
+    'item_name': '',
+    'amount_gross': '200.00',
+    'merchant_id': '10000100',
+}
+DATA['signature'] = make_signature(DATA)
+
+
+
+
+@pytest.fixture
+def done(monkeypatch):
+    done = []
+    monkeypatch.setattr(itn_store, '_backend', MemoryBackend(cache_size=100))
+    monkeypatch.setattr(callbacks, '_get_expected_amount', lambda m_payment_id: Decimal('200.00'))
+    monkeypatch.setattr(callbacks, '_payment_done', lambda itn: done.append(itn) or [])
+    monkeypatch.setattr(security_checks, 'send_validation_request', lambda data: True)
+
+    async def asend_validation_request(data):
+        return True
+
+    monkeypatch.setattr(security_checks, 'asend_validation_request', asend_validation_request)
+    return done
+
+
+
+
+def call_wsgi(app, data, method='POST', ipaddr='197.97.145.145'):
+    body = urlencode(data).encode('utf-8')
+    environ = {
+        'REQUEST_METHOD': method,
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': str(len(body)),
+        'REMOTE_ADDR': ipaddr,
+        'wsgi.input': io.BytesIO(body),
+    }
+    started = []
+    body = b''.join(app(environ, lambda status, headers: started.append((status, headers))))
+    return int(started[0][0].split()[0]), json.loads(body)
+
+
+
+
+def call_asgi(app, data, method='POST', ipaddr='197.97.145.145'):
+    body = urlencode(data).encode('utf-8')
+    scope = {
+        'type': 'http',
+        'method': method,
+        'headers': [
+            (b'content-type', b'application/x-www-form-urlencoded'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+        'client': (ipaddr, 443),
+    }
+    # The body is sent in two chunks.
+    messages = [
+        {'type': 'http.request', 'body': body[:10], 'more_body': True},
+        {'type': 'http.request', 'body': body[10:]},
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+
+
+
+def test_parse_body():
+    body = urlencode(DATA).encode('utf-8')
+    assert parse_body(body, 'application/x-www-form-urlencoded') == DATA
+    assert parse_body(json.dumps(DATA).encode(), 'application/json; charset=utf-8') == DATA
+    with pytest.raises(ValueError):
+        parse_body(b'[]', 'application/json')
+
+
+
+
+@pytest.mark.parametrize('call', [call_wsgi, call_asgi])
+def test_receiver(call, done):
+    app = ITNReceiver()
+    assert call(app, DATA) == (200, {})
+    assert len(done) == 1
+    itn = done[0]
+    assert itn.secchecks_passed
+    assert itn.payfast_ipaddr == '197.97.145.145'
+
+    # Copies are acknowledged without being processed again.
+    assert call(app, DATA) == (200, {})
+    assert len(done) == 1
+
+    # ITNs that fail the checks are acknowledged; the callback decides.
+    data = {**DATA, 'pf_payment_id': '1089251'}
+    assert call(app, data, ipaddr='10.0.0.1') == (200, {})
+    assert not done[1].secchecks_passed
+
+    status, body = call(app, DATA, method='GET')
+    assert status == 405
+    assert body == {'detail': 'Method "GET" not allowed.'}
+    assert call(ITNReceiver(max_body_size=10), DATA)[0] == 413
+
+
+
+
+def test_receiver_in_progress(done):
+    app = ITNReceiver()
+    itn_store.begin(DATA)
+    assert call_wsgi(app, DATA)[0] == 503
+    assert done == []
+
+
+
+
+@pytest.mark.parametrize('call', [call_wsgi, call_asgi])
+def test_receiver_queue(call, done, monkeypatch):
+    from payfast.queue import itn_queue
+
+    monkeypatch.setattr(settings, 'ITN_MODE', 'queue')
+    monkeypatch.setattr(itn_queue, 'start', lambda *args, **kwargs: None)
+    enqueued = []
+    monkeypatch.setattr(itn_queue, 'enqueue', lambda data, ipaddr: enqueued.append((data, ipaddr)))
+    app = ITNReceiver()
+    assert call(app, DATA) == (200, {})
+    assert enqueued == [(DATA, '197.97.145.145')]
+    assert done == []
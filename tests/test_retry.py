@@ -0,0 +1,198 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+import requests
+import requests.adapters
+
+from payfast.conf import settings
+from payfast.base import AsyncTransport, RequestsTransport
+from payfast.retry import RetryPolicy
+from payfast.exceptions import PayFastTimeout, PayFastAPIException
+
+URI = 'https://api.payfast.co.za/subscriptions/abc'
+
+
+
+
+def test_is_idempotent():
+    policy = RetryPolicy()
+    assert policy.is_idempotent('GET', f'{URI}/fetch')
+    assert not policy.is_idempotent('POST', f'{URI}/adhoc', {'amount': 500})
+    assert policy.is_idempotent('POST', f'{URI}/adhoc', {'m_payment_id': '1'})
+    assert not policy.is_idempotent('PATCH', f'{URI}/update', {'amount': 500})
+
+
+
+
+def request(policy, handler, method='GET', uri=f'{URI}/fetch', payload=None):
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        transport = AsyncTransport('v1', client=client, retry_policy=policy)
+        try:
+            return await transport.request(method, uri, payload=payload)
+        finally:
+            await transport.close()
+    return asyncio.run(run())
+
+
+
+
+def test_retry_on_server_error():
+    policy = RetryPolicy(max_attempts=3, backoff=0)
+    statuses = [503, 429, 200]
+
+    def handler(request):
+        return httpx.Response(statuses.pop(0), json={'code': 200})
+
+    response = request(policy, handler)
+    assert response.ok
+    stats = policy.stats.snapshot()
+    assert stats['retries'] == 2
+    assert stats['retries:503'] == 1
+    assert stats['retries:429'] == 1
+
+
+
+
+def test_no_retry_for_charge_without_key():
+    policy = RetryPolicy(max_attempts=3, backoff=0)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.ConnectError('boom')
+
+    with pytest.raises(PayFastTimeout):
+        request(
+            policy,
+            handler,
+            method='POST',
+            uri=f'{URI}/adhoc',
+            payload={'amount': 500},
+        )
+    assert len(calls) == 1
+    assert policy.stats.snapshot()['not_idempotent'] == 1
+
+
+
+
+class Adapter(requests.adapters.BaseAdapter):
+    """
+    Responds with the statuses in order; ``None`` is a connection error.
+    """
+
+    def __init__(self, statuses, headers=None):
+        super().__init__()
+        self.statuses = list(statuses)
+        self.headers = headers or {}
+        self.requests = []
+
+
+    def send(self, request, timeout=None, **kwargs):
+        self.requests.append((request, timeout))
+        status = self.statuses.pop(0)
+        if status is None:
+            raise requests.ConnectionError('boom')
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(self.headers)
+        response._content = b'{"code": 200}'
+        response.url = request.url
+        response.request = request
+        return response
+
+
+    def close(self):
+        pass
+
+
+
+
+@pytest.fixture
+def send(monkeypatch):
+    """
+    Sends a request with ``RequestsTransport`` and returns the adapter,
+    the response (or exception) and the delays that were slept.
+    """
+    delays = []
+    monkeypatch.setattr(settings, 'CIRCUIT_BREAKER', False)
+    monkeypatch.setattr(time, 'sleep', delays.append)
+
+    def send(policy, adapter, method='GET', uri=f'{URI}/fetch', payload=None):
+        session = requests.Session()
+        session.mount('https://', adapter)
+        transport = RequestsTransport('v1', session=session, retry_policy=policy)
+        try:
+            return transport.request(method, uri, payload=payload), delays
+        except (PayFastTimeout, PayFastAPIException) as exc:
+            return exc, delays
+
+    return send
+
+
+
+
+def test_sync_retry_on_server_error(send):
+    policy = RetryPolicy(max_attempts=3, backoff=0)
+    adapter = Adapter([503, None, 200])
+    response, delays = send(policy, adapter)
+    assert response.ok
+    assert len(adapter.requests) == 3
+    stats = policy.stats.snapshot()
+    assert stats['retries'] == 2
+    assert stats['retries:503'] == 1
+    assert stats['retries:connection'] == 1
+
+    # Until the attempts run out.
+    adapter = Adapter([502, 502])
+    error, delays = send(RetryPolicy(max_attempts=2, backoff=0), adapter)
+    assert isinstance(error, PayFastAPIException)
+    assert error.status == 502
+    assert len(adapter.requests) == 2
+
+
+
+
+def test_sync_no_retry_for_charge_without_key(send):
+    policy = RetryPolicy(max_attempts=3, backoff=0)
+    adapter = Adapter([None])
+    error, delays = send(policy, adapter, method='POST', uri=f'{URI}/adhoc', payload={'amount': 500})
+    assert isinstance(error, PayFastTimeout)
+    assert len(adapter.requests) == 1
+    assert policy.stats.snapshot()['not_idempotent'] == 1
+
+    adapter = Adapter([503])
+    error, delays = send(policy, adapter, method='POST', uri=f'{URI}/adhoc', payload={'amount': 500})
+    assert error.status == 503
+    assert len(adapter.requests) == 1
+
+    # Charges with an "m_payment_id" are retried.
+    adapter = Adapter([503, 200])
+    response, delays = send(policy, adapter, method='POST', uri=f'{URI}/adhoc', payload={'m_payment_id': '1'})
+    assert response.ok
+    assert len(adapter.requests) == 2
+
+
+
+
+def test_sync_retry_after_and_deadline(send):
+    policy = RetryPolicy(max_attempts=3, backoff=0, deadline=60)
+    adapter = Adapter([429, 200], headers={'Retry-After': '2'})
+    response, delays = send(policy, adapter)
+    assert response.ok
+    assert delays == [2.0]
+
+    # A Retry-After beyond the deadline isn't waited for.
+    delays.clear()
+    policy = RetryPolicy(max_attempts=3, backoff=0, deadline=1)
+    adapter = Adapter([503, 200], headers={'Retry-After': '5'})
+    error, delays = send(policy, adapter)
+    assert error.status == 503
+    assert delays == []
+    assert len(adapter.requests) == 1
+    assert policy.stats.snapshot()['exhausted'] == 1
+    # Each attempt's timeout is bounded by the time left.
+    request, timeout = adapter.requests[0]
+    assert timeout <= 1
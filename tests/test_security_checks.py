@@ -0,0 +1,89 @@
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from payfast.merchants import current_merchant
+from payfast.signature import make_signature
+from payfast.security_checks import ValidateClient
+
+DATA = {
+    'pf_payment_id': '1089250',
+    'payment_status': 'COMPLETE',
+    'amount_gross': '200.00',
+    'merchant_id': '10000100',
+}
+DATA['signature'] = make_signature(DATA)
+
+
+
+
+class Adapter(BaseAdapter):
+
+    def __init__(self, text='VALID', error=None):
+        super().__init__()
+        self.text = text
+        self.error = error
+        self.requests = []
+
+
+    def send(self, request, timeout=None, **kwargs):
+        self.requests.append((request, timeout))
+        if self.error:
+            raise self.error
+        response = requests.Response()
+        response.status_code = 200
+        response._content = self.text.encode()
+        response.url = request.url
+        response.request = request
+        return response
+
+
+    def close(self):
+        pass
+
+
+
+
+def test_validate():
+    adapter = Adapter()
+    client = ValidateClient(connect_timeout=1, read_timeout=2, cache_ttl=60, adapter=adapter)
+    assert client.validate(DATA)
+    assert client.validate(DATA)
+    assert len(adapter.requests) == 1
+    request, timeout = adapter.requests[0]
+    assert timeout == (1, 2)
+    assert request.headers['Content-Type'] == 'application/x-www-form-urlencoded'
+    assert b'pf_payment_id=1089250' in request.body.encode()
+
+    # Cached by merchant and signature, not by the querystring.
+    merchant_id = str(current_merchant().merchant_id)
+    assert list(client._cache) == [(merchant_id, DATA['signature'])]
+
+    adapter.text = 'INVALID'
+    assert not client.validate({**DATA, 'amount_gross': '1.00', 'signature': 'forged'})
+    metrics = client.metrics()
+    assert (metrics['requests'], metrics['valid'], metrics['invalid']) == (2, 1, 1)
+    assert metrics['cache_hits'] == 1
+    assert 0 <= metrics['p50'] <= metrics['p99']
+
+    # Only "VALID" results are cached and only when the cache is enabled.
+    assert not client.validate({**DATA, 'amount_gross': '1.00', 'signature': 'forged'})
+    adapter.text = 'VALID'
+    unsigned = {key: value for key, value in DATA.items() if key != 'signature'}
+    assert client.validate(unsigned)
+    assert client.validate(unsigned)
+    assert client.metrics()['requests'] == 5
+    client = ValidateClient(cache_ttl=0, adapter=adapter)
+    adapter.text = 'VALID'
+    client.validate(DATA)
+    client.validate(DATA)
+    assert client.metrics()['requests'] == 2
+
+
+
+
+def test_errors():
+    client = ValidateClient(adapter=Adapter(error=requests.ConnectTimeout()))
+    with pytest.raises(requests.ConnectTimeout):
+        client.validate(DATA)
+    assert client.metrics()['errors'] == 1
@@ -0,0 +1,101 @@
+import hashlib
+from urllib.parse import urlencode
+from decimal import Decimal
+
+import pytest
+
+from payfast.signature import (
+    FIELD_ORDER,
+    PREFIX_FIELDS,
+    Signer,
+    PrefixSigner,
+    make_querystring,
+    make_signature,
+)
+
+DATA = {
+    'amount': Decimal('10.00'),
+    'item_name': 'Things & stuff, ünïcode',
+    'merchant_id': 10000100,
+    'merchant_key': '46f0cd694581a',
+    'return_url': 'https://example.com/return?a=1',
+    'name_first': None,
+    'email_confirmation': 1,
+    'custom_str1': '{"user_id": "456", "trial": [null, null]}',
+    'signature': 'ignored',
+}
+
+
+
+
+def expected(data, salt, a12y):
+    keys = list(data)
+    if a12y:
+        keys = sorted(keys + ['passphrase'])
+    else:
+        keys = sorted(keys, key=FIELD_ORDER.index)
+    pairs = []
+    for key in keys:
+        if key == 'signature':
+            continue
+        value = salt if key == 'passphrase' else data[key]
+        if value is not None:
+            pairs.append((key, str(value)))
+    if not a12y:
+        pairs.append(('passphrase', salt))
+    return urlencode(pairs)
+
+
+
+
+@pytest.mark.parametrize('a12y', [False, True])
+@pytest.mark.parametrize('salt', ['testing12345', 'with space&amp', ''])
+def test_querystring(a12y, salt):
+    querystring = make_querystring(DATA, salt=salt, a12y=a12y)
+    assert querystring == expected(DATA, salt, a12y)
+
+
+
+
+def test_signature():
+    signer = Signer('testing12345')
+    querystring = expected(DATA, 'testing12345', False)
+    md5 = hashlib.md5(querystring.encode()).hexdigest()
+    assert signer.signature(DATA) == md5
+    headers = {'merchant-id': '10000100', 'version': 'v1', 'timestamp': 'now'}
+    assert len(make_signature(headers, a12y=True)) == 32
+
+
+
+
+def test_unknown_field():
+    with pytest.raises(ValueError):
+        make_querystring({'unknown': '1'})
+
+
+
+
+def test_prefix_signer():
+    signer = Signer('testing12345')
+    prefix = PrefixSigner(signer, DATA)
+    assert prefix.signature(DATA) == signer.signature(DATA)
+    assert prefix.signature(DATA, a12y=True) == signer.signature(DATA, a12y=True)
+    # Different merchant fields are signed in full.
+    other = {**DATA, 'return_url': 'https://example.com/other'}
+    assert prefix.signature(other) == signer.signature(other)
+    # Only merchant fields.
+    merchant = {field: DATA.get(field) for field in PREFIX_FIELDS}
+    assert prefix.signature(merchant) == signer.signature(merchant)
+
+
+
+
+def test_sign():
+    signer = Signer('testing12345')
+    data = {key: value for key, value in DATA.items() if key != 'signature'}
+    for signer in [signer, PrefixSigner(signer, DATA)]:
+        signature, query = signer.sign(data)
+        assert signature == signer.signature(data)
+        pairs = [(key, str(value)) for key, value in data.items() if value is not None]
+        pairs.sort(key=lambda pair: FIELD_ORDER.index(pair[0]))
+        assert query.decode() == urlencode(pairs)
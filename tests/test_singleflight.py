@@ -0,0 +1,140 @@
+import time
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+from payfast import AsyncPayFast
+from payfast.base import AsyncTransport
+from payfast.singleflight import SingleFlight
+
+
+
+
+def test_threads_share_call():
+    flight = SingleFlight()
+    calls = []
+    results = []
+
+    def fetch():
+        calls.append(True)
+        time.sleep(0.1)
+        return 'result'
+
+    def target():
+        results.append(flight.do('token', fetch))
+
+    threads = [threading.Thread(target=target) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == ['result'] * 5
+    assert flight.stats['shared'] == 4
+
+
+
+
+def test_threads_get_copies():
+    from payfast.exceptions import PayFastAPIException
+
+    class Response:
+        url = 'https://api.payfast.co.za/subscriptions/a3b3ae55-ab8b/fetch'
+        status_code = 500
+        text = 'error'
+
+    class Subscription:
+        def __init__(self, amount):
+            self.amount = amount
+
+    def run(fetch):
+        flight = SingleFlight()
+        results = []
+
+        def target():
+            try:
+                results.append(flight.do('token', fetch))
+            except PayFastAPIException as exc:
+                results.append(exc)
+
+        threads = [threading.Thread(target=target) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+            # The first thread makes the call.
+            time.sleep(0.02)
+        for thread in threads:
+            thread.join()
+        return results
+
+    def fetch():
+        time.sleep(0.1)
+        return Subscription(100)
+
+    results = run(fetch)
+    assert len({id(result) for result in results}) == 3
+    results[0].amount = 200
+    assert [result.amount for result in results[1:]] == [100, 100]
+
+    def fail():
+        time.sleep(0.1)
+        raise PayFastAPIException(Response())
+
+    errors = run(fail)
+    assert len({id(error) for error in errors}) == 3
+    assert all(error.status == 500 for error in errors)
+    assert len({str(error) for error in errors}) == 1
+    # The copies' cause is the exception of the call.
+    original, = [error for error in errors if error.__cause__ is None]
+    assert [error.__cause__ for error in errors if error is not original] == [original] * 2
+
+
+
+
+def test_threads_share_exception():
+    flight = SingleFlight()
+
+    def fetch():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        flight.do('token', fetch)
+    assert not flight._calls
+
+
+
+
+def test_async_coalescing():
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={
+            'code': 200,
+            'status': 'success',
+            'data': {
+                'response': {
+                    'pf_payment_id': 69,
+                    'm_payment_id': 232345,
+                    'status': 'COMPLETE',
+                    'amount': 3600,
+                },
+            },
+        })
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        transport = AsyncTransport('v1', client=client)
+        async with AsyncPayFast(transport=transport) as payfast:
+            return await asyncio.gather(*[
+                payfast.cc_transactions.get('69') for _ in range(10)
+            ])
+
+    transactions = asyncio.run(run())
+    assert len(requests) == 1
+    assert len(transactions) == 10
+    # Each caller gets its own copy.
+    assert len({id(t) for t in transactions}) == 10
+    assert all(t.amount == transactions[0].amount for t in transactions)
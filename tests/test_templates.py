@@ -0,0 +1,25 @@
+from payfast.conf import settings
+from payfast.payment import Payment
+from payfast.templates import render_form, render_to_string, get_template
+
+
+
+
+def test_render_form(monkeypatch):
+    payment = Payment(
+        10.00,
+        'A "quoted" & <escaped> \'item\'',
+        name_first='Zoë',
+        custom_str3='</form><script>',
+    )
+    context = payment.get_form_context()
+    expected = render_to_string('payfast/form.html', context)
+    rendered = render_form(
+        context['inputs'],
+        context['payfast_process_url'],
+        context['button_name'],
+    )
+    assert rendered == expected
+    monkeypatch.setattr(settings, 'FORM_RENDERER', 'string')
+    assert payment.get_form() == expected
+    assert get_template('payfast/form.html') is get_template('payfast/form.html')
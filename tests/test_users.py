@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+
+import pytest
+
+from payfast import users
+from payfast.payment import Payment
+from payfast.batch import PaymentBatch
+from payfast.users import UserResolver, resolver
+
+
+
+
+class DoesNotExist(Exception):
+    pass
+
+
+
+
+class Manager:
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+
+    def get(self, pk):
+        self.queries += 1
+        try:
+            return self.rows[int(pk)]
+        except KeyError:
+            raise DoesNotExist
+
+
+    def in_bulk(self, ids):
+        self.queries += 1
+        return {int(pk): self.rows[int(pk)] for pk in ids if int(pk) in self.rows}
+
+
+
+
+@pytest.fixture
+def User(monkeypatch):
+    rows = {
+        pk: SimpleNamespace(pk=pk, first_name=f'First{pk}', last_name='Last', email=f'{pk}@example.com')
+        for pk in (1, 2, 3)
+    }
+    model = SimpleNamespace(objects=Manager(rows), DoesNotExist=DoesNotExist)
+    monkeypatch.setattr(users, 'get_user_model', lambda: model)
+    resolver.clear()
+    yield model
+    resolver.clear()
+
+
+
+
+def test_get_user(User):
+    assert Payment(10, 'Things', user_id=2).email_address == '2@example.com'
+    assert User.objects.queries == 1
+    # Supplied details and users don't need a query.
+    Payment(10, 'Things', user_id=2, name_first='A', name_last='B', email_address='a@b.c')
+    payment = Payment(10, 'Things', user_id=2, user={'first_name': 'Ann', 'email': 'ann@example.com'})
+    assert (payment.name_first, payment.email_address) == ('Ann', 'ann@example.com')
+    assert User.objects.queries == 1
+    assert Payment(10, 'Things', user_id=9).email_address is None
+
+
+
+
+def test_prefetch(User):
+    with resolver.prefetch([1, '2', 9, None]) as prefetched:
+        assert set(prefetched) == {'1', '2'}
+        assert Payment(10, 'Things', user_id='1').name_first == 'First1'
+        assert Payment(10, 'Things', user_id=2).user is prefetched['2']
+        # The IDs that were prefetched before are not fetched again.
+        with resolver.prefetch([1, 3]):
+            assert resolver.get_user(3).first_name == 'First3'
+    assert User.objects.queries == 2
+
+    urls = list(PaymentBatch(
+        [{'amount': 10, 'item_name': 'Invoice', 'user_id': pk} for pk in (1, 2, 3, 2)],
+        output='url',
+        chunksize=10,
+    ))
+    assert 'email_address=3%40example.com' in urls[2]
+    assert User.objects.queries == 3
+
+
+
+
+def test_cache(User):
+    cached = UserResolver(cache_size=1, timeout=60)
+    assert cached.resolve(1)[1]['first_name'] == 'First1'
+    assert cached.resolve(1) == (None, {'first_name': 'First1', 'last_name': 'Last', 'email': '1@example.com'})
+    assert User.objects.queries == 1
+    cached.resolve(2)
+    cached.resolve(1)
+    assert User.objects.queries == 3
+    cached.forget(1)
+    cached.resolve(1)
+    assert User.objects.queries == 4
+
+    expired = UserResolver(cache_size=10, timeout=0)
+    expired.resolve(1)
+    expired.resolve(1)
+    assert User.objects.queries == 6
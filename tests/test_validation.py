@@ -0,0 +1,60 @@
+import pytest
+import pydantic
+
+from payfast.payment import Payment, SubscriptionPayment, TokenizedSub
+from payfast.validation import (
+    PaymentValidator,
+    SubscriptionPaymentValidator,
+    get_compiled_validator,
+    validate,
+    validate_many,
+)
+
+
+
+
+def test_compiled_validator():
+    payments = [
+        Payment(10.00, 'Some things', email_confirmation=True),
+        SubscriptionPayment(10.00, 'Some things, but every month'),
+        TokenizedSub(10.00, 'Some things'),
+    ]
+    for payment in payments:
+        validator = get_compiled_validator(payment.validator)
+        assert validator.is_valid(payment.data_for_payfast)
+
+    data = payments[1].data_for_payfast
+    invalid = [
+        {**data, 'signature': 'short'},
+        {**data, 'payment_method': 'nope'},
+        {**data, 'custom_str3': 'x' * 256},
+        {**data, 'cycles': -1},
+        {key: value for key, value in data.items() if key != 'amount'},
+    ]
+    validator = get_compiled_validator(SubscriptionPaymentValidator)
+    for item in invalid:
+        assert not validator.is_valid(item)
+        with pytest.raises(pydantic.ValidationError):
+            validate(SubscriptionPaymentValidator, item, mode='compiled')
+        with pytest.raises(pydantic.ValidationError):
+            validate(SubscriptionPaymentValidator, item, mode='full')
+        validate(SubscriptionPaymentValidator, item, mode='off')
+
+    # Coerced by pydantic, so not certain for the compiled validator but
+    # still valid.
+    coerced = {**payments[0].data_for_payfast, 'custom_int1': '5'}
+    assert not get_compiled_validator(PaymentValidator).is_valid(coerced)
+    validate(PaymentValidator, coerced, mode='compiled')
+
+
+
+
+def test_validate_many():
+    payloads = [Payment(10 + i, 'Things').data_for_payfast for i in range(5)]
+    validate_many(PaymentValidator, payloads, mode='compiled')
+    validate_many(PaymentValidator, payloads, mode='full')
+    payloads.append({**payloads[0], 'signature': None})
+    with pytest.raises(pydantic.ValidationError):
+        validate_many(PaymentValidator, payloads, mode='compiled')
+    with pytest.raises(ValueError):
+        validate(PaymentValidator, payloads[0], mode='fast')